@@ -0,0 +1,100 @@
+# Micro-batching of AI extraction requests with single-flight de-duplication
+import copy
+import threading
+from concurrent.futures import Future
+
+from ai_cache import cache_key
+
+
+class AIBatcher:
+    """Coalesces concurrent journey extractions into one AI call
+
+    Callers arriving within window_seconds of the first pending request share a
+    batch, which is sent as soon as the window closes or max_batch_size distinct
+    journeys are waiting. Identical journey texts (same cache key) already in
+    flight are not sent again - later callers wait on the first caller's result.
+    send_batch(texts) must return one result per text, in order.
+    """
+
+    def __init__(self, send_batch, window_seconds=0.1, max_batch_size=8):
+        self.send_batch = send_batch
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending = []  # (key, journey_text, future) waiting for the current window
+        self._inflight = {}  # key -> future, for pending and sent requests
+        self._timer = None
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_texts = 0
+
+    def extract(self, journey_text, timeout=None):
+        """Return the AI result for journey_text, raising if its batch failed"""
+        key = cache_key(journey_text)
+        flush_now = None
+        with self._lock:
+            self.requests += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._pending.append((key, journey_text, future))
+                if len(self._pending) >= self.max_batch_size:
+                    flush_now = self._take_batch()
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.window_seconds, self._flush_window)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if flush_now:
+            self._send(flush_now)
+        # Coalesced callers each get their own copy to annotate
+        return copy.deepcopy(future.result(timeout=timeout))
+
+    def _take_batch(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_window(self):
+        with self._lock:
+            self._timer = None
+            batch, self._pending = self._pending, []
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            results = self.send_batch([text for _, text, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"AI returned {len(results)} journeys for a batch of {len(batch)}")
+        except Exception as e:
+            results = None
+            error = e
+
+        with self._lock:
+            self.batches += 1
+            self.batched_texts += len(batch)
+            for key, _, _ in batch:
+                self._inflight.pop(key, None)
+
+        for i, (_, _, future) in enumerate(batch):
+            if results is None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'avg_batch_size': self.batched_texts / self.batches if self.batches else 0.0,
+                'pending': len(self._pending)
+            }
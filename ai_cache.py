@@ -0,0 +1,194 @@
+# Cache for AI-extracted journey information
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Fare settings that feed into the AI prompt - changing any of them changes the cache key
+FARE_SETTINGS = (
+    'TAXI_BASE_FARE',
+    'TAXI_PER_KM',
+    'METRO_BASE_FARE',
+    'METRO_ZONE_FARE',
+    'BUS_BASE_FARE',
+    'BUS_ZONE_FARE',
+    'ZONE_LENGTH_KM',
+    'MAX_FARE_ZONES',
+    'NOL_CARD_TIERS',
+    'DEFAULT_NOL_TIER',
+)
+
+_WHITESPACE = re.compile(r'[ \t]+')
+
+
+def normalize_journey_text(journey_text):
+    """Collapse insignificant whitespace so equivalent journey texts share a cache key"""
+    lines = (_WHITESPACE.sub(' ', line).strip() for line in journey_text.strip().splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def fare_fingerprint():
+    """Hash of the current fare configuration"""
+    settings = {name: getattr(config, name, None) for name in FARE_SETTINGS}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def cache_key(journey_text, model=None):
+    """Content address for a journey text under the current model and fare configuration"""
+    parts = (
+        model or config.BYTEPLUS_MODEL or '',
+        fare_fingerprint(),
+        normalize_journey_text(journey_text),
+    )
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class SQLiteCacheBackend:
+    """Shared on-disk cache so hits carry across gunicorn workers"""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ai_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, stored_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, now):
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM ai_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return None, row[1] if row else None
+        return row[0], row[1]
+
+    def put(self, key, value, expires_at, now):
+        """Store a value and return the number of rows evicted to stay within bounds"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO ai_cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+                (key, value, expires_at, now),
+            )
+            evicted = conn.execute('DELETE FROM ai_cache WHERE expires_at <= ?', (now,)).rowcount
+            evicted += conn.execute(
+                'DELETE FROM ai_cache WHERE key IN ('
+                'SELECT key FROM ai_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            ).rowcount
+        return evicted
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM ai_cache')
+
+
+class JourneyCache:
+    """Bounded LRU + TTL cache of AI journey results, optionally backed by SQLite"""
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, path=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, serialized value)
+        self._lock = threading.Lock()
+        self._backend = SQLiteCacheBackend(path, max_entries) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, journey_text):
+        """Return a fresh copy of the cached result, or None on a miss"""
+        key = cache_key(journey_text)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+                self.expirations += 1
+
+        if self._backend is not None:
+            try:
+                value, expires_at = self._backend.get(key, now)
+            except sqlite3.Error as e:
+                print(f"AI cache backend error: {e}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.hits += 1
+                return json.loads(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, journey_text, journey_info):
+        """Cache an AI result for this journey text"""
+        key = cache_key(journey_text)
+        now = self._clock()
+        value = json.dumps(journey_info, ensure_ascii=False)
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+
+        if self._backend is not None:
+            try:
+                evicted = self._backend.put(key, value, expires_at, now)
+            except sqlite3.Error as e:
+                print(f"AI cache backend error: {e}")
+                return
+            with self._lock:
+                self.evictions += evicted
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._backend is not None:
+            self._backend.clear()
+
+    def stats(self):
+        """Counters for monitoring cache effectiveness"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+journey_cache = JourneyCache(
+    max_entries=config.AI_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.AI_CACHE_TTL_SECONDS,
+    path=config.AI_CACHE_PATH,
+)
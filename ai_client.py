@@ -0,0 +1,287 @@
+# Deadline-bound Ark calls with hedging, a circuit breaker and a pooled HTTP client
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """The AI provider is marked unhealthy - callers should use the local parser"""
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and probes again after reset_seconds
+
+    While open every call is refused immediately. After reset_seconds one probe
+    call is let through (half open); its success closes the circuit, its failure
+    opens it again. on_transition(old, new) is called on every state change.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0, on_transition=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.on_transition = on_transition
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.rejected = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and self._clock() - self.opened_at >= self.reset_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def available(self):
+        """True unless the circuit is open and not yet due for a probe"""
+        with self._lock:
+            return self.state != OPEN or self._clock() - self.opened_at >= self.reset_seconds
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = self._clock()
+                self._transition(OPEN)
+
+    def release(self):
+        """End a call that says nothing about the provider's health, freeing the probe slot"""
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state):
+        old, self.state = self.state, state
+        if self.on_transition is not None:
+            try:
+                self.on_transition(old, state)
+            except Exception as e:
+                print(f"Circuit breaker callback error: {e}")
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        """The percentile of recent latencies, or None until min_samples calls have succeeded"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def build_ark_client(base_url, api_key, connect_timeout=3.0, max_connections=20, keepalive_connections=10,
+                     keepalive_seconds=30.0):
+    """Ark client on a pooled, keep-alive httpx connection, with SDK retries off
+
+    Retries are left to ResilientAIClient, which hedges instead of waiting out
+    the SDK's backoff.
+    """
+    import httpx
+    from byteplussdkarkruntime import Ark
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=keepalive_connections,
+                            keepalive_expiry=keepalive_seconds),
+        timeout=httpx.Timeout(60.0, connect=connect_timeout),
+    )
+    return Ark(base_url=base_url, api_key=api_key, max_retries=0, http_client=http_client)
+
+
+def _close_response(future):
+    # A streamed answer that lost the hedge still holds its connection
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result()[0], 'close', None)
+        if close is not None:
+            close()
+
+
+class ResilientAIClient:
+    """Chat completions with a per-call deadline, hedged requests and a circuit breaker
+
+    If the first request has not answered once the recent p{hedge_percentile}
+    latency (at least hedge_min_seconds) has passed, a second identical request
+    is sent and whichever answers first wins. Hedges are limited to
+    hedge_budget of all calls so a slow provider is not sent double the load.
+
+    Streamed calls answer once the headers arrive, so they hedge on their own
+    latency history and only count towards the breaker once the stream has
+    been read.
+    """
+
+    def __init__(self, client, model, timeout=25.0, max_workers=16, hedge=True, hedge_percentile=95,
+                 hedge_min_seconds=1.0, hedge_budget=0.1, breaker=None, latencies=None, stream_latencies=None):
+        self.client = client
+        self.model = model
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_budget = hedge_budget
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = latencies or LatencyTracker()
+        self.stream_latencies = stream_latencies or LatencyTracker()
+        self._executor = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.stream_failures = 0
+
+    def _get_executor(self):
+        # Created lazily so each forked worker owns its threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ai-call')
+        return self._executor
+
+    def available(self):
+        return self.breaker.available()
+
+    def hedge_delay(self, latencies=None):
+        """Seconds to wait before hedging, or None while there is too little latency history"""
+        if not self.hedge:
+            return None
+        threshold = (latencies or self.latencies).percentile(self.hedge_percentile)
+        return None if threshold is None else max(threshold, self.hedge_min_seconds)
+
+    def _call(self, messages, timeout, kwargs):
+        start = time.monotonic()
+        response = self.client.chat.completions.create(model=self.model, messages=messages,
+                                                       timeout=timeout, **kwargs)
+        return response, time.monotonic() - start
+
+    def create(self, messages, timeout=None, **kwargs):
+        """Return the Ark response, raising CircuitOpenError, TimeoutError or the provider's error"""
+        response = self._request(messages, timeout, kwargs, self.latencies)
+        self.breaker.record_success()
+        return response
+
+    def stream(self, messages, read, timeout=None, **kwargs):
+        """Stream the Ark response into read(stream) and return what read returns
+
+        A deadline or transport error raised by read counts as a provider
+        failure. A ValueError, such as StreamAborted when the answer
+        contradicts the journey, is about the content rather than the provider
+        and is raised again without touching the breaker.
+        """
+        stream = self._request(messages, timeout, dict(kwargs, stream=True), self.stream_latencies)
+        try:
+            result = read(stream)
+        except ValueError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            with self._lock:
+                self.stream_failures += 1
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _request(self, messages, timeout, kwargs, latencies):
+        # Success is left to the caller; a failed or timed out request is recorded here
+        if not self.breaker.allow():
+            raise CircuitOpenError("AI provider circuit is open")
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        executor = self._get_executor()
+        with self._lock:
+            self.calls += 1
+
+        primary = executor.submit(self._call, messages, timeout, kwargs)
+        pending = {primary}
+        delay = self.hedge_delay(latencies)
+        if delay is not None and delay < timeout:
+            done, _ = wait(pending, timeout=delay)
+            if not done and self._take_hedge():
+                pending.add(executor.submit(self._call, messages, max(deadline - time.monotonic(), 0.001), kwargs))
+
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response, latency = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                latencies.add(latency)
+                if future is not primary:
+                    with self._lock:
+                        self.hedge_wins += 1
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return response
+
+        for late in pending:
+            late.add_done_callback(_close_response)
+        self.breaker.record_failure()
+        with self._lock:
+            if error is None or pending:
+                self.timeouts += 1
+            else:
+                self.failures += 1
+        if error is not None and not pending:
+            raise error
+        raise TimeoutError(f"AI call exceeded its {timeout:.1f}s deadline")
+
+    def _take_hedge(self):
+        with self._lock:
+            if self.hedges >= self.hedge_budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+                'stream_failures': self.stream_failures,
+                'circuit_state': STATE_VALUES[self.breaker.state],
+                'circuit_rejected': self.breaker.rejected
+            }
+        delay = self.hedge_delay()
+        stats['hedge_delay_seconds'] = delay if delay is not None else 0.0
+        return stats
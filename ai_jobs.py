@@ -0,0 +1,153 @@
+# Background AI fare extraction jobs, so request workers never wait on the LLM
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMED_OUT = 'timed_out'
+
+FINISHED = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+class AIJob:
+    """One AI extraction request and its outcome"""
+
+    def __init__(self, journey_text, on_complete=None, options=None):
+        self.id = str(uuid.uuid4())
+        self.journey_text = journey_text
+        self.on_complete = on_complete
+        self.options = options or {}
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class AIJobQueue:
+    """Executor-backed queue of AI extraction jobs
+
+    At most max_workers extractions run at once and at most max_pending wait
+    behind them; submit() returns None when the queue is full so the caller
+    keeps its locally computed answer. A job still unfinished after
+    timeout_seconds is reported as timed out and its late result discarded.
+    """
+
+    def __init__(self, worker, max_workers=4, max_pending=64, timeout_seconds=30.0, ttl_seconds=600.0):
+        self.worker = worker
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout_seconds = timeout_seconds
+        self.ttl_seconds = ttl_seconds
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Created lazily so each forked worker owns its pool
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ai-job')
+        return self._executor
+
+    def submit(self, journey_text, on_complete=None, **options):
+        """Queue an extraction; on_complete(result) runs on the job thread when it succeeds
+
+        Keyword options are passed on to the worker with the journey text.
+        """
+        with self._lock:
+            self._expire(time.time())
+            active = sum(1 for job in self._jobs.values() if job.status in (PENDING, RUNNING))
+            if active >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                return None
+            job = AIJob(journey_text, on_complete, options)
+            self._jobs[job.id] = job
+            job.future = self._get_executor().submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        with self._lock:
+            if job.status != PENDING:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            result = self.worker(job.journey_text, **job.options)
+        except Exception as e:
+            print(f"AI job error: {e}")
+            with self._lock:
+                if job.status == RUNNING:
+                    job.status = FAILED
+                    job.error = str(e)
+                    job.finished_at = time.time()
+            return
+
+        with self._lock:
+            self._check_timeout(job, time.time())
+            if job.status != RUNNING:
+                return  # Cancelled or timed out while the AI call was in flight
+            job.result = result
+        if job.on_complete is not None:
+            try:
+                job.on_complete(result)
+            except Exception as e:
+                print(f"AI job completion error: {e}")
+        with self._lock:
+            job.status = DONE
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._check_timeout(job, time.time())
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it already finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED or job.result is not None:
+                return False
+            job.future.cancel()
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return True
+
+    def _check_timeout(self, job, now):
+        if job.status in (PENDING, RUNNING) and job.result is None and now - job.created_at > self.timeout_seconds:
+            job.status = TIMED_OUT
+            job.finished_at = now
+            job.future.cancel()
+
+    def _expire(self, now):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at + self.ttl_seconds <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {status: 0 for status in (PENDING, RUNNING) + FINISHED}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            counts['rejected'] = self.rejected
+            return counts
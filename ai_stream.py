@@ -0,0 +1,236 @@
+# Streaming AI extraction - journey steps are parsed and checked as the completion arrives
+import json
+import re
+import threading
+import time
+
+from fare_engine import step_count
+
+STEP_MODES = frozenset(('taxi', 'metro', 'bus', 'transfer', 'walk'))
+_MODE_ALIASES = {'walk': 'transfer'}
+_STEPS_KEY = re.compile(r'"journey_steps"\s*:\s*\[')
+
+MALFORMED = 'malformed'
+MISMATCH = 'mismatch'
+
+
+class StreamAborted(ValueError):
+    """The streamed answer was malformed or disagreed with the journey text; reason says which"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class StepStreamParser:
+    """Incremental JSON scanner that returns each journey_steps element once it is complete
+
+    Only the journey_steps array is scanned as it arrives; the whole answer is
+    still parsed with json.loads once the stream ends. Raises StreamAborted as
+    soon as the text cannot be the expected JSON object.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._phase = 'start'  # start -> key -> array -> done
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start = None
+
+    def feed(self, chunk):
+        """Add streamed text and return the steps completed by it"""
+        self.text += chunk
+        text = self.text
+        if self._phase == 'start':
+            stripped = text.lstrip()
+            if not stripped:
+                return []
+            if stripped[0] != '{':
+                raise StreamAborted(MALFORMED, "AI answer is not a JSON object")
+            self._phase = 'key'
+        if self._phase == 'key':
+            match = _STEPS_KEY.search(text, self._pos)
+            if match is None:
+                # The key may be split across chunks - rescan its possible start next time
+                self._pos = max(self._pos, len(text) - 32)
+                return []
+            self._pos = match.end()
+            self._phase = 'array'
+        if self._phase == 'array':
+            return self._scan_array(text)
+        return []
+
+    def _scan_array(self, text):
+        steps = []
+        pos = self._pos
+        while pos < len(text):
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth == 0:
+                    raise StreamAborted(MALFORMED, "Expected a step object in journey_steps")
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0:
+                    if char == '[':
+                        raise StreamAborted(MALFORMED, "Expected a step object in journey_steps")
+                    self._element_start = pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    if char == '}':
+                        raise StreamAborted(MALFORMED, "Unbalanced braces in journey_steps")
+                    self._phase = 'done'
+                    pos += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    steps.append(self._load_step(text[self._element_start:pos + 1]))
+            elif self._depth == 0 and not (char.isspace() or char == ','):
+                raise StreamAborted(MALFORMED, f"Unexpected {char!r} in journey_steps")
+            pos += 1
+        self._pos = pos
+        return steps
+
+    @staticmethod
+    def _load_step(text):
+        try:
+            step = json.loads(text)
+        except ValueError:
+            raise StreamAborted(MALFORMED, "Invalid JSON in a journey step")
+        if not isinstance(step, dict):
+            raise StreamAborted(MALFORMED, "Journey step is not an object")
+        return step
+
+
+def _number(step, field):
+    value = step.get(field)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise StreamAborted(MALFORMED, f"Step {field} {value!r} is not a number")
+
+
+class StepValidator:
+    """Checks streamed AI steps against the steps parsed locally from the same text
+
+    Step count, modes and distances are only compared when the local parse
+    found every numbered step, so indexes line up; otherwise only the field
+    types are checked.
+    """
+
+    def __init__(self, journey_text, local_steps, distance_tolerance=0.25, min_distance_km=0.1):
+        aligned = bool(local_steps) and len(local_steps) == step_count(journey_text)
+        self.local_steps = local_steps if aligned else None
+        self.expected = len(local_steps) if aligned else 0
+        self.distance_tolerance = distance_tolerance
+        self.min_distance_km = min_distance_km
+
+    def check(self, index, step):
+        mode = str(step.get('mode', '')).lower()
+        if mode not in STEP_MODES:
+            raise StreamAborted(MALFORMED, f"Step {index + 1} has unknown mode {step.get('mode')!r}")
+        distance = _number(step, 'distance_km')
+        _number(step, 'fare_aed')
+        if self.expected and index >= self.expected:
+            raise StreamAborted(MISMATCH, f"AI returned more than the {self.expected} steps in the journey")
+        if self.local_steps is None:
+            return
+
+        local = self.local_steps[index]
+        if _MODE_ALIASES.get(mode, mode) != local['mode']:
+            raise StreamAborted(MISMATCH, f"Step {index + 1} is {mode} but the journey says {local['mode']}")
+        if distance is not None and local['distance'] > 0:
+            allowed = max(local['distance'] * self.distance_tolerance, self.min_distance_km)
+            if abs(distance - local['distance']) > allowed:
+                raise StreamAborted(MISMATCH, f"Step {index + 1} is {distance} km but the journey says {local['distance']} km")
+
+    def finish(self, count):
+        if self.expected and count < self.expected:
+            raise StreamAborted(MISMATCH, f"AI returned {count} of the {self.expected} steps in the journey")
+
+
+class StreamingExtractor:
+    """Reads a streamed chat completion into journey JSON, stopping at the first bad step
+
+    Aborting closes the stream, so the provider stops generating tokens the
+    caller would throw away.
+    """
+
+    def __init__(self, distance_tolerance=0.25):
+        self.distance_tolerance = distance_tolerance
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.completed = 0
+        self.steps = 0
+        self.aborted_malformed = 0
+        self.aborted_mismatch = 0
+        self.chars_received = 0
+
+    def extract(self, stream, journey_text, local_steps, deadline=None, on_step=None):
+        """Return the parsed answer, raising StreamAborted or TimeoutError
+
+        on_step(index, step) is called for each step as soon as it is complete.
+        """
+        parser = StepStreamParser()
+        validator = StepValidator(journey_text, local_steps, self.distance_tolerance)
+        count = 0
+        with self._lock:
+            self.streams += 1
+        try:
+            for chunk in stream:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("AI stream exceeded its deadline")
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if not content:
+                    continue
+                for step in parser.feed(content):
+                    validator.check(count, step)
+                    if on_step is not None:
+                        on_step(count, step)
+                    count += 1
+            validator.finish(count)
+            try:
+                answer = json.loads(parser.text)
+            except ValueError:
+                raise StreamAborted(MALFORMED, "AI answer is not valid JSON")
+            with self._lock:
+                self.completed += 1
+            return answer
+        except StreamAborted as e:
+            with self._lock:
+                if e.reason == MALFORMED:
+                    self.aborted_malformed += 1
+                else:
+                    self.aborted_mismatch += 1
+            raise
+        finally:
+            with self._lock:
+                self.steps += count
+                self.chars_received += len(parser.text)
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': self.streams,
+                'completed': self.completed,
+                'steps': self.steps,
+                'aborted_malformed': self.aborted_malformed,
+                'aborted_mismatch': self.aborted_mismatch,
+                'chars_received': self.chars_received
+            }
@@ -1,214 +1,100 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, g, send_file
 import json
 import uuid
-import qrcode
 import base64
-from io import BytesIO
-import re
-from byteplussdkarkruntime import Ark
 import config
 import os
+import time
+import atexit
+from ai_cache import journey_cache
+import fare_engine
+from fare_engine import calculate_fare
+from journey_parser import parse_journey_text
+from journey_store import journey_store
+from fare_log import fare_log
+from ledger import ledger
+from traffic import TrafficLog, CAPTURED_ENDPOINTS
+from journey_catalog import journey_catalog
+from qr_render import render_qr, build_qr_data, get_qr_image, qr_purpose, qr_cache, qr_prerenderer, CONTENT_TYPES
+from ai_jobs import AIJobQueue
+from ai_batcher import AIBatcher
+from ai_client import build_ark_client, ResilientAIClient, CircuitBreaker, CircuitOpenError
+from ai_stream import StreamingExtractor, StreamAborted
+from prompt_compaction import compact_journey_text, restore_stops
+from journey_events import journey_events, journey_status_payload, status_etag
+from qr_payload import parse_scan_data
+from gate_validator import apply_scan, skip_transfers, GateValidator, ScanResultCache
+from stop_registry import stop_registry, annotate_stops
+from assets import AssetManifest
+import metrics
+from metrics import timed
+from datetime import date
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=config.STATIC_DIR)
 app.secret_key = config.SECRET_KEY
+app.session_interface = metrics.TimedSessionInterface()
 
-# Initialize Ark client
-client = Ark(
-    base_url=config.BYTEPLUS_BASE_URL,
-    api_key=config.BYTEPLUS_API_KEY
+# Templates link static files by content hash so browsers can cache them for good
+asset_manifest = AssetManifest(config.STATIC_DIR, check_interval=config.ASSET_CHECK_INTERVAL)
+
+def asset_url(filename):
+    hashed = asset_manifest.hashed(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=hashed)
+
+app.jinja_env.globals.update(asset_url=asset_url, asset_exists=asset_manifest.exists)
+
+# Initialize Ark client on a pooled connection, behind deadlines, hedging and a circuit breaker
+client = build_ark_client(
+    config.BYTEPLUS_BASE_URL,
+    config.BYTEPLUS_API_KEY,
+    connect_timeout=config.AI_CONNECT_TIMEOUT_SECONDS,
+    max_connections=config.AI_POOL_CONNECTIONS,
+    keepalive_connections=config.AI_POOL_KEEPALIVE
+)
+ai_client = ResilientAIClient(
+    client,
+    config.BYTEPLUS_MODEL,
+    timeout=config.AI_REQUEST_TIMEOUT_SECONDS,
+    max_workers=config.AI_POOL_CONNECTIONS,
+    hedge=config.AI_HEDGE_ENABLED,
+    hedge_min_seconds=config.AI_HEDGE_MIN_SECONDS,
+    hedge_budget=config.AI_HEDGE_BUDGET,
+    breaker=CircuitBreaker(config.AI_BREAKER_FAILURES, config.AI_BREAKER_RESET_SECONDS,
+                           on_transition=lambda old, new: metrics.ai_circuit_transitions_total.inc(old, new))
 )
 
-def load_sample_journey():
-    """Load sample journey from JSON file"""
-    try:
-        with open('sample_journey.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data['sample_journey']
-    except Exception as e:
-        print(f"Error loading sample journey: {e}")
-        # Fallback sample if file can't be loaded
-        return {
-            "title": "Sample Journey",
-            "description": "Default multi-modal journey",
-            "journey_text": "1. taxi: 1 stop, 8.5 min, 4.2 km\n   Stops: Dubai Marina Walk -> Mall of the Emirates Metro Station\n\n2. MRed1 (metro): 7 stops, 12.1 min, 15.8 km\n   Stops: Mall of the Emirates Metro Station 1 -> Union Metro Station 2\n\n3. 64 (bus): 8 stops, 18.3 min, 12.4 km\n   Stops: Union Bus Terminal -> Gold Souq Bus Station"
-        }
+def load_sample_journey(name=None):
+    """Return a sample journey from the in-process catalog"""
+    return journey_catalog.get(name)
 
+@timed('fare_log')
 def save_calculated_fares_to_json(journey_info):
-    """Save BytePlus AI-calculated fares back to the JSON file"""
-    try:
-        # Load current JSON data
-        with open('sample_journey.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Create calculated_fares section with AI results
-        calculated_fares = {
-            "total": journey_info.get('total_fare', 0),
-            "breakdown": {},
-            "calculated_by": "BytePlus AI",
-            "timestamp": "live_calculation"
-        }
-        
-        # Add individual transport mode fares
-        for step in journey_info.get('journey_steps', []):
-            mode = step.get('mode', 'unknown')
-            if mode not in ['walk', 'transfer']:  # Skip walking transfers
-                fare = step.get('fare_aed', 0)
-                if mode in calculated_fares["breakdown"]:
-                    calculated_fares["breakdown"][mode] += fare
-                else:
-                    calculated_fares["breakdown"][mode] = fare
-        
-        # Update the JSON with calculated fares
-        data['sample_journey']['calculated_fares'] = calculated_fares
-        
-        # Save back to file
-        with open('sample_journey.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-            
-        print(f"✅ Updated JSON with AI-calculated fares: Total {calculated_fares['total']} AED")
-        
-    except Exception as e:
-        print(f"Error saving calculated fares: {e}")
+    """Queue the calculated fares for the append-only fare results log"""
+    fare_log.record(journey_info)
+
+# Payments, scans and step transitions go to the ledger unless it is turned off
+journey_ledger = ledger if config.LEDGER_ENABLED else None
 
-# Fare rates (in AED) - moved to config.py
-FARE_RATES = {
-    'taxi': config.TAXI_PER_KM,
-    'metro': config.METRO_PER_KM,
-    'bus': config.BUS_PER_KM,
-    'transfer': 0.0  # walking transfers are free
-}
+# Journey route traffic is captured for replay when a capture path is set
+traffic_log = TrafficLog(config.TRAFFIC_CAPTURE_PATH) if config.TRAFFIC_CAPTURE_PATH else None
+if traffic_log is not None:
+    atexit.register(traffic_log.flush)
 
 # Dubai transport stops - from config
 STOPS_LIST = ', '.join(config.DUBAI_STOPS)
 
-def parse_journey_text(journey_text):
-    """Parse the journey text and extract transport modes, distances, and stops"""
-    lines = journey_text.strip().split('\n')
-    journey_steps = []
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # Skip empty lines and headers
-        if not line or line.startswith('===') or line.startswith('---'):
-            i += 1
-            continue
-            
-        # Look for numbered steps with transport info
-        if '. ' in line and ('km' in line or 'min' in line):
-            # Extract step number and details
-            try:
-                # Parse the line to get mode and details
-                parts = line.split(': ', 1)
-                if len(parts) >= 2:
-                    # Extract mode from the first part
-                    step_part = parts[0].strip()
-                    details = parts[1].strip()
-                    
-                    # Extract transport mode - handle different formats
-                    mode = None
-                    line_number = None
-                    
-                    # Check for patterns like "1. taxi:" or "3. MRed1 (metro):" or "5. 64 (bus):"
-                    if 'taxi' in step_part.lower():
-                        mode = 'taxi'
-                    elif '(metro)' in step_part.lower():
-                        mode = 'metro'
-                        # Extract line number like "MRed1"
-                        mode_match = re.search(r'(\w+)\s*\(metro\)', step_part)
-                        if mode_match:
-                            line_number = mode_match.group(1)
-                    elif '(bus)' in step_part.lower():
-                        mode = 'bus'
-                        # Extract route number like "64"
-                        mode_match = re.search(r'(\d+)\s*\(bus\)', step_part)
-                        if mode_match:
-                            line_number = mode_match.group(1)
-                    elif 'transfer' in step_part.lower() or 'walk' in step_part.lower():
-                        mode = 'transfer'
-                    
-                    if mode:
-                        # Extract distance
-                        distance_match = re.search(r'(\d+\.?\d*)\s*km', details)
-                        distance = float(distance_match.group(1)) if distance_match else 0
-                        
-                        # Look for stops in next line
-                        stops = []
-                        if i + 1 < len(lines) and lines[i + 1].strip().startswith('Stops:'):
-                            stops_line = lines[i + 1].strip()
-                            stops_text = stops_line.replace('Stops:', '').strip()
-                            stops = [stop.strip() for stop in stops_text.split('->')]
-                            i += 1  # Skip the stops line
-                        
-                        journey_steps.append({
-                            'mode': mode,
-                            'line_number': line_number,
-                            'distance': distance,
-                            'stops': stops,
-                            'completed': False
-                        })
-                        
-            except Exception as e:
-                print(f"Error parsing line '{line}': {e}")
-                
-        i += 1
-    
-    return journey_steps
-
-def calculate_fare(mode, distance, line_number=None):
-    """Calculate fare based on transport mode and distance"""
-    if mode == 'taxi':
-        fare = max(config.TAXI_BASE_FARE, config.TAXI_PER_KM * distance)  # Minimum base fare
-    elif mode == 'metro':
-        fare = config.METRO_BASE_FARE + (distance * config.METRO_PER_KM)
-    elif mode == 'bus':
-        fare = config.BUS_BASE_FARE + (distance * config.BUS_PER_KM)
-    else:
-        fare = 0.0
-    
-    # Round to whole numbers for clean display
-    return round(fare)
-
+@timed('qr_render')
 def generate_qr_code(data):
     """Generate QR code and return as base64 string"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    buffered = BytesIO()
-    img.save(buffered)
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    return img_str
+    return base64.b64encode(render_qr(data)).decode()
 
-def get_journey_info_from_ai(journey_text):
-    """Use ByteDance AI to extract and structure journey information"""
-    try:
-        response = client.chat.completions.create(
-            model=config.BYTEPLUS_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a Dubai RTA transport assistant. Extract transport information from journey descriptions and return structured data."
-                },
-                {
-                    "role": "user",
-                    "content": f"""
-Journey text: {journey_text}
+AI_SYSTEM_PROMPT = "You are a Dubai RTA transport assistant. Extract transport information from journey descriptions and return structured data."
 
-Please extract the following information and return as JSON:
-{{
+JOURNEY_JSON_FORMAT = """{
     "journey_steps": [
-        {{
+        {
             "step_number": 1,
             "mode": "taxi|metro|bus|transfer|walk",
             "line_number": "route number if applicable",
@@ -216,23 +102,111 @@ Please extract the following information and return as JSON:
             "duration_min": "duration in minutes as float", 
             "stops": ["start_stop", "end_stop"],
             "fare_aed": "calculated fare in AED"
-        }}
+        }
     ],
     "total_fare": "total fare for entire journey",
     "total_distance": "total distance in km",
     "total_duration": "total duration in minutes"
-}}
+}"""
+
+def fare_structure_prompt():
+    return f"Use Dubai RTA fare structure: Taxi {config.TAXI_PER_KM} AED/km with a minimum of {config.TAXI_BASE_FARE} AED. Metro and bus use zone fares: Metro {config.METRO_BASE_FARE} AED within one zone plus {config.METRO_ZONE_FARE} AED per additional zone, Bus {config.BUS_BASE_FARE} AED within one zone plus {config.BUS_ZONE_FARE} AED per additional zone, counting one zone per {config.ZONE_LENGTH_KM} km and at most {config.MAX_FARE_ZONES} zones. Walking transfers free."
+
+def ai_messages(content):
+    return [
+        {"role": "system", "content": AI_SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+def request_ai_completion(content):
+    response = ai_client.create(ai_messages(content))
+    return response.choices[0].message.content
+
+# Streamed single-journey extractions are checked step by step against the local parse
+stream_extractor = StreamingExtractor(distance_tolerance=config.AI_STREAM_DISTANCE_TOLERANCE)
+
+def request_ai_stream(content, journey_text, steps):
+    """Stream the AI answer, giving up as soon as a step is malformed or contradicts the journey text"""
+    start = time.monotonic()
+    def on_step(index, step):
+        if index == 0:
+            metrics.stage_seconds.observe(time.monotonic() - start, 'ai_first_step')
+    def read(stream):
+        return stream_extractor.extract(stream, journey_text, steps,
+                                        deadline=start + config.AI_REQUEST_TIMEOUT_SECONDS, on_step=on_step)
+    return ai_client.stream(ai_messages(content), read)
+
+def prepare_ai_journey(journey_text):
+    """Parse the journey locally and return (text for the prompt, parsed steps)"""
+    with metrics.stage_seconds.time('parse_journey'):
+        steps = parse_journey_text(journey_text)
+    if not config.AI_PROMPT_COMPACTION:
+        return journey_text, steps
+    compact = compact_journey_text(journey_text)
+    metrics.prompt_tokens_saved.observe(compact.tokens_before - compact.tokens_after)
+    return compact.text, steps
+
+def restore_ai_stops(ai_data, steps):
+    """Map the AI's endpoint-only stops back onto the full parsed stop lists"""
+    if config.AI_PROMPT_COMPACTION and isinstance(ai_data, dict):
+        restore_stops(ai_data, steps)
+    return ai_data
 
-Use Dubai RTA fare structure: Taxi minimum {config.TAXI_BASE_FARE} AED + {config.TAXI_PER_KM} AED/km, Metro {config.METRO_BASE_FARE}-{config.METRO_BASE_FARE + 5} AED, Bus {config.BUS_BASE_FARE}-{config.BUS_BASE_FARE + 3} AED, Walking transfers free.
+def request_ai_extraction(journey_text):
+    """Send one journey to the AI and return its JSON answer"""
+    prompt_text, steps = prepare_ai_journey(journey_text)
+    content = f"""
+Journey text: {prompt_text}
+
+Please extract the following information and return as JSON:
+{JOURNEY_JSON_FORMAT}
+
+{fare_structure_prompt()}
+"""
+    if config.AI_STREAMING:
+        return restore_ai_stops(request_ai_stream(content, journey_text, steps), steps)
+    return restore_ai_stops(json.loads(request_ai_completion(content)), steps)
+
+def request_ai_batch(journey_texts):
+    """Send several journeys in one AI call, sharing the instructions, and return one answer per journey"""
+    if len(journey_texts) == 1:
+        return [request_ai_extraction(journey_texts[0])]
+    
+    prepared = [prepare_ai_journey(text) for text in journey_texts]
+    journeys = '\n\n'.join(f"Journey {i}:\n{text}" for i, (text, _) in enumerate(prepared, 1))
+    content = f"""
+{journeys}
+
+For each of the {len(journey_texts)} journeys above, extract the following information and return as JSON of the form {{"journeys": [...]}} with one object per journey, in the same order:
+{JOURNEY_JSON_FORMAT}
+
+{fare_structure_prompt()}
 """
-                }
-            ],
-        )
+    results = json.loads(request_ai_completion(content))['journeys']
+    for result, (_, steps) in zip(results, prepared):
+        restore_ai_stops(result, steps)
+    return results
+
+# Concurrent AI extractions share one Ark call per batching window
+ai_batcher = AIBatcher(request_ai_batch,
+                       window_seconds=config.AI_BATCH_WINDOW_MS / 1000.0,
+                       max_batch_size=config.AI_BATCH_MAX_SIZE)
+
+@timed('ai_extraction')
+def get_journey_info_from_ai(journey_text):
+    """Use ByteDance AI to extract and structure journey information"""
+    cached = journey_cache.get(journey_text)
+    if cached is not None:
+        return cached
+
+    try:
+        if config.AI_BATCH_WINDOW_MS > 0:
+            ai_data = ai_batcher.extract(journey_text, timeout=config.AI_REQUEST_TIMEOUT_SECONDS + 1)
+        else:
+            ai_data = request_ai_extraction(journey_text)
         
-        ai_response = response.choices[0].message.content
-        # Try to parse JSON from AI response
+        # Try to use the JSON from AI response
         try:
-            ai_data = json.loads(ai_response)
             # Round all fare values in AI response
             if 'journey_steps' in ai_data:
                 for step in ai_data['journey_steps']:
@@ -240,100 +214,251 @@ Use Dubai RTA fare structure: Taxi minimum {config.TAXI_BASE_FARE} AED + {config
                         step['fare_aed'] = round(float(step['fare_aed']))
             if 'total_fare' in ai_data:
                 ai_data['total_fare'] = round(float(ai_data['total_fare']))
+            ai_data['fare_source'] = 'ai'
+            journey_cache.put(journey_text, ai_data)
             return ai_data
         except:
             # Fallback to manual parsing if AI doesn't return valid JSON
+            metrics.ai_fallback_total.inc('invalid_response')
             return parse_journey_manually(journey_text)
             
+    except CircuitOpenError:
+        # The provider is unhealthy - don't wait on it
+        metrics.ai_fallback_total.inc('circuit_open')
+        return parse_journey_manually(journey_text)
+    except StreamAborted as e:
+        # The streamed answer went wrong part way - stop paying for it and parse locally
+        metrics.ai_fallback_total.inc(f'stream_{e.reason}')
+        return parse_journey_manually(journey_text)
+    except ValueError:
+        # Fallback to manual parsing if AI doesn't return valid JSON
+        metrics.ai_fallback_total.inc('invalid_json')
+        return parse_journey_manually(journey_text)
     except Exception as e:
         print(f"AI processing error: {e}")
+        metrics.ai_fallback_total.inc('error')
         return parse_journey_manually(journey_text)
 
-def parse_journey_manually(journey_text):
+def parse_journey_manually(journey_text, tier=None, spent_today=0.0):
     """Fallback manual parsing"""
-    steps = parse_journey_text(journey_text)
-    total_fare = 0
+    with metrics.stage_seconds.time('parse_journey'):
+        steps = parse_journey_text(journey_text)
+    journey_info = fare_engine.price_journey(steps, tier, spent_today)
+    journey_info['fare_source'] = 'fallback'
+    return journey_info
+
+def get_rider_journey_info_from_ai(journey_text, tier=None, spent_today=0.0):
+    """AI extraction with fares converted to the rider's Nol tier and daily-cap spend"""
+    return fare_engine.apply_tier(get_journey_info_from_ai(journey_text), tier, spent_today)
+
+# Background AI extraction for journeys the local engine cannot price confidently
+ai_jobs = AIJobQueue(
+    get_rider_journey_info_from_ai,
+    max_workers=config.AI_JOB_CONCURRENCY,
+    max_pending=config.AI_JOB_MAX_PENDING,
+    timeout_seconds=config.AI_JOB_TIMEOUT_SECONDS
+)
+
+def get_journey_info(journey_text, tier=None, spent_today=0.0, steps=None, defer_ai=False):
+    """Price well-formed journeys locally and only ask the AI when parsing is not confident
     
-    journey_steps = []
-    for i, step in enumerate(steps):
-        fare = calculate_fare(step['mode'], step['distance'], step.get('line_number'))
-        total_fare += fare
-        
-        journey_steps.append({
-            "step_number": i + 1,
-            "mode": step['mode'],
-            "line_number": step.get('line_number'),
-            "distance_km": step['distance'],
-            "stops": step['stops'],
-            "fare_aed": fare,  # Already rounded in calculate_fare function
-            "completed": False
-        })
+    With defer_ai the AI is not called here: the locally computed fares are returned
+    as a provisional answer for the caller to revise with a background AI job.
+    """
+    if steps is None:
+        with metrics.stage_seconds.time('parse_journey'):
+            steps = parse_journey_text(journey_text)
+    if fare_engine.is_confident(journey_text, steps):
+        journey_info = fare_engine.price_journey(steps, tier, spent_today)
+        journey_info['fare_source'] = 'local'
+    elif not ai_client.available():
+        metrics.ai_fallback_total.inc('circuit_open')
+        journey_info = parse_journey_manually(journey_text, tier, spent_today)
+    elif defer_ai:
+        journey_info = fare_engine.price_journey(steps, tier, spent_today)
+        journey_info['fare_source'] = 'provisional'
+    else:
+        journey_info = get_rider_journey_info_from_ai(journey_text, tier, spent_today)
     
-    return {
-        "journey_steps": journey_steps,
-        "total_fare": round(total_fare),  # Round total fare too
-        "total_distance": sum(step['distance'] for step in steps),
-        "journey_id": str(uuid.uuid4())
-    }
+    fare_engine.record_path(journey_info.get('fare_source', 'ai'))
+    return journey_info
+
+def nol_spent_today():
+    """Metro/bus spend recorded in this session today, used for Nol daily caps"""
+    spend = session.get('nol_spend', {})
+    return spend.get('amount', 0.0) if spend.get('date') == date.today().isoformat() else 0.0
+
+def apply_ai_result(journey_id, provisional_info, ai_info):
+    """Replace a journey's provisional fares with the AI result, unless it is already paid"""
+    ai_info['journey_id'] = journey_id
+    ai_info['title'] = provisional_info.get('title')
+    ai_info['description'] = provisional_info.get('description')
+    annotate_stops(ai_info.get('journey_steps', []))
+    if journey_store.replace_journey_info(journey_id, ai_info):
+        save_calculated_fares_to_json(ai_info)
+        journey_events.publish(journey_id)
+    fare_engine.record_path(ai_info.get('fare_source', 'ai'))
+
+def wait_for_journey_change(journey_id, etag, timeout):
+    """Block until the journey's status differs from etag or timeout passes, and return the latest status"""
+    deadline = time.monotonic() + timeout
+    while True:
+        # Read the version before the store so a change in between still wakes us
+        version = journey_events.version(journey_id)
+        state = journey_store.get(journey_id)
+        if state is None:
+            return None
+        status = journey_status_payload(state)
+        remaining = deadline - time.monotonic()
+        if status_etag(journey_id, status) != etag or remaining <= 0:
+            return status
+        journey_events.wait(journey_id, version, min(remaining, config.JOURNEY_EVENT_POLL_SECONDS))
+
+def load_journey_state():
+    """Look up the server-side state for the journey in this session"""
+    journey_id = session.get('journey_id')
+    return journey_store.get(journey_id) if journey_id else None
+
+# Batched scans from metro gates and bus validators, checked against the journey store
+gate_validator = GateValidator(
+    journey_store,
+    journey_events,
+    ScanResultCache(config.GATE_IDEMPOTENCY_MAX_ENTRIES, config.GATE_IDEMPOTENCY_TTL_SECONDS),
+    require_signed=config.QR_PAYLOAD_FORMAT == 'compact',
+    ledger=journey_ledger
+)
+
+# Component stats exposed as gauges on /metrics
+metrics.registry.collect('ai_cache', journey_cache.stats)
+metrics.registry.collect('fare_path', fare_engine.path_stats)
+metrics.registry.collect('qr_cache', qr_cache.stats)
+metrics.registry.collect('qr_prerender', qr_prerenderer.stats)
+metrics.registry.collect('ai_jobs', ai_jobs.stats)
+metrics.registry.collect('ai_batcher', ai_batcher.stats)
+metrics.registry.collect('ai_client', ai_client.stats)
+metrics.registry.collect('ai_stream', stream_extractor.stats)
+metrics.registry.collect('fare_log', fare_log.stats)
+metrics.registry.collect('ledger', ledger.stats)
+if traffic_log is not None:
+    metrics.registry.collect('traffic_log', traffic_log.stats)
+metrics.registry.collect('stop_registry', stop_registry.stats)
+metrics.registry.collect('assets', asset_manifest.stats)
+metrics.registry.collect('gate', gate_validator.stats)
+metrics.registry.collect('journey_events', lambda: {'waiters': journey_events.waiters})
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        metrics.request_seconds.observe(elapsed, request.endpoint or 'unmatched', request.method, response.status_code)
+        if config.METRICS_TIMING_HEADER:
+            response.headers['Server-Timing'] = f'app;dur={elapsed * 1000:.1f}'
+        if traffic_log is not None and request.endpoint in CAPTURED_ENDPOINTS:
+            traffic_log.record_request(request, response, elapsed, session.get('journey_id'))
+    return response
 
 @app.route('/')
 def home():
     # Load sample journey data
-    sample_journey = load_sample_journey()
-    return render_template('index.html', sample_journey=sample_journey)
+    journey_name = request.args.get('journey')
+    sample_journey = load_sample_journey(journey_name)
+    if sample_journey is None:
+        journey_name, sample_journey = None, load_sample_journey()
+    return render_template('index.html', sample_journey=sample_journey, journey_name=journey_name)
 
 @app.route('/process_journey', methods=['POST'])
 def process_journey():
-    # Use the sample journey from JSON file instead of user input
-    sample_journey = load_sample_journey()
+    # Use a sample journey from the catalog instead of user input
+    request_data = request.get_json(silent=True) or {}
+    sample_journey, steps = journey_catalog.lookup(request_data.get('journey'))
+    if sample_journey is None:
+        return jsonify({'error': 'Unknown sample journey'}), 404
     journey_text = sample_journey['journey_text']
     
     if not journey_text:
         return jsonify({'error': 'No journey data available'}), 400
     
-    # Process journey using AI
-    journey_info = get_journey_info_from_ai(journey_text)
+    # Price locally when possible, otherwise process journey using AI
+    tier = request_data.get('nol_tier')
+    if tier is not None and tier not in config.NOL_CARD_TIERS:
+        return jsonify({'error': 'Unknown Nol card tier'}), 400
+    
+    journey_info = get_journey_info(journey_text, tier, nol_spent_today(), steps,
+                                    defer_ai=config.AI_ASYNC_JOBS)
     journey_info['title'] = sample_journey.get('title', 'Multi-Modal Journey')
     journey_info['description'] = sample_journey.get('description', '')
+    annotate_stops(journey_info.get('journey_steps', []))
     
-    # Save the AI-calculated fares back to the JSON file
-    save_calculated_fares_to_json(journey_info)
+    # Store server-side - the session cookie only carries the journey ID
+    journey_id = journey_info.setdefault('journey_id', str(uuid.uuid4()))
+    journey_store.create(journey_id, journey_info)
+    session['journey_id'] = journey_id
     
-    # Store in session
-    session['journey_info'] = journey_info
-    session['current_step'] = 0
-    session['journey_id'] = journey_info.get('journey_id', str(uuid.uuid4()))
-    session['payment_completed'] = False
+    response = dict(journey_info)
+    job = None
+    if journey_info['fare_source'] == 'provisional':
+        # Revise the provisional fares with the AI in the background
+        job = ai_jobs.submit(journey_text, on_complete=lambda ai_info: apply_ai_result(journey_id, journey_info, ai_info),
+                             tier=tier, spent_today=nol_spent_today())
+    if job is not None:
+        response['job_id'] = job.id
+    else:
+        # Log the calculated fares - written in the background, off the request path
+        save_calculated_fares_to_json(journey_info)
     
-    return jsonify(journey_info)
+    return jsonify(response)
 
 @app.route('/payment')
 def payment_page():
-    if 'journey_info' not in session:
+    state = load_journey_state()
+    if state is None:
         return redirect(url_for('home'))
     
-    journey_info = session['journey_info']
+    journey_info = state['journey_info']
     return render_template('payment.html', journey_info=journey_info)
 
 @app.route('/process_payment', methods=['POST'])
 def process_payment():
-    if 'journey_info' not in session:
+    state = load_journey_state()
+    if state is None:
         return jsonify({'error': 'No active journey'}), 400
     
+    if state['payment_completed']:
+        # Paying again would double the ledger revenue and the Nol daily-cap spend
+        return jsonify({'error': 'Journey already paid'}), 409
+    
     payment_data = request.json
     payment_method = payment_data.get('payment_method')
     amount = payment_data.get('amount')
     
     # Simulate payment processing (in real app, integrate with payment gateway)
     if payment_method and amount:
-        # Mark payment as completed
-        session['payment_completed'] = True
-        session['payment_method'] = payment_method
-        session['payment_amount'] = amount
+        # Mark payment as completed - only one of two concurrent payments gets through
+        if not journey_store.mark_paid(session['journey_id'], payment_method, amount):
+            return jsonify({'error': 'Journey already paid'}), 409
+        
+        # Track metro/bus spend towards the Nol daily cap
+        nol_fares = sum(step.get('fare_aed', 0) for step in state['journey_info']['journey_steps']
+                        if step.get('mode') in ['metro', 'bus'])
+        session['nol_spend'] = {'date': date.today().isoformat(), 'amount': nol_spent_today() + nol_fares}
+        
+        # Render every QR code the journey will need before the rider reaches it
+        qr_prerenderer.submit_journey(session['journey_id'], state['journey_info']['journey_steps'])
+        journey_events.publish(session['journey_id'])
+        
+        transaction_id = str(uuid.uuid4())
+        if journey_ledger is not None:
+            journey_ledger.record_payment(session['journey_id'], state['journey_info'], payment_method, amount,
+                                          transaction_id)
         
         return jsonify({
             'success': True,
-            'transaction_id': str(uuid.uuid4()),
+            'transaction_id': transaction_id,
             'message': 'Payment processed successfully'
         })
     else:
@@ -341,17 +466,17 @@ def process_payment():
 
 @app.route('/generate_qr')
 def generate_qr():
-    if 'journey_info' not in session or not session.get('payment_completed', False):
+    state = load_journey_state()
+    if state is None or not state['payment_completed']:
         return redirect(url_for('home'))
     
-    journey_info = session['journey_info']
-    current_step = session.get('current_step', 0)
+    journey_info = state['journey_info']
     
     # Skip walking transfers automatically
-    while (current_step < len(journey_info['journey_steps']) and 
-           journey_info['journey_steps'][current_step]['mode'] in ['transfer', 'walk']):
-        current_step += 1
-        session['current_step'] = current_step
+    if skip_transfers(journey_store, journey_events, session['journey_id'], state, journey_ledger) is None:
+        # A concurrent request moved the journey on - render its current step instead
+        return redirect(url_for('generate_qr'))
+    current_step = state['current_step']
     
     if current_step >= len(journey_info['journey_steps']):
         # Calculate actual transport modes used (excluding walking/transfers)
@@ -375,123 +500,258 @@ def generate_qr():
     
     current_transport = journey_info['journey_steps'][current_step]
     
-    # Generate QR code data for scanning purposes only (no payment)
-    qr_data = {
-        'journey_id': session['journey_id'],
-        'step': current_step,
-        'mode': current_transport['mode'],
-        'action': 'scan',  # Changed from payment action to scan action
-        'line_number': current_transport.get('line_number'),
-        'purpose': 'entry' if current_transport['mode'] in ['metro', 'bus'] else 'exit'
-    }
-    
-    qr_code_img = generate_qr_code(json.dumps(qr_data))
+    # QR code image is served (and cached by the browser) from the /qr endpoint
+    purpose = qr_purpose(current_transport['mode'])
+    qr_url = url_for('qr_image', journey_id=session['journey_id'], step=current_step, fmt='png', purpose=purpose)
     
     return render_template('qr_code.html', 
-                         qr_code=qr_code_img, 
+                         qr_url=qr_url, 
+                         scan_data=build_qr_data(session['journey_id'], current_step, current_transport['mode'],
+                                                 current_transport.get('line_number'), purpose),
                          transport_info=current_transport,
                          current_step=current_step + 1,
                          total_steps=len([s for s in journey_info['journey_steps'] if s['mode'] not in ['transfer', 'walk']]),
-                         payment_completed=True)
+                         payment_completed=True,
+                         journey_events_sse=config.JOURNEY_EVENTS_SSE)
 
 @app.route('/scan_qr', methods=['POST'])
 def scan_qr():
     qr_data = request.json.get('qr_data', '')
     
     try:
-        scan_info = json.loads(qr_data)
+        scan_info, signed = parse_scan_data(qr_data)
         journey_id = scan_info.get('journey_id')
         
-        if journey_id != session.get('journey_id'):
+        # Signed payloads carry their own proof; legacy JSON must match the rider's session
+        if not signed and journey_id != session.get('journey_id'):
             return jsonify({'error': 'Invalid QR code'}), 400
         
-        current_step = session.get('current_step', 0)
-        journey_info = session['journey_info']
-        
-        # Handle different scan actions
-        action = scan_info.get('action', 'scan')
-        mode = scan_info.get('mode')
+        state = journey_store.get(journey_id)
+        if state is None:
+            return jsonify({'error': 'No active journey'}), 400
         
-        if action == 'scan':
-            if mode == 'taxi':
-                # Taxi - single scan to exit
-                session['current_step'] = current_step + 1
-                return jsonify({
-                    'success': True, 
-                    'action': 'exit_taxi',
-                    'show_animation': True,
-                    'animation_duration': 8000,  # 8 seconds
-                    'message': 'Taxi journey completed!',
-                    'next_step': True
-                })
-            elif mode in ['metro', 'bus']:
-                purpose = scan_info.get('purpose', 'entry')
-                if purpose == 'entry':
-                    # Metro/Bus entry scan
-                    return jsonify({
-                        'success': True, 
-                        'action': f'enter_{mode}',
-                        'show_animation': True,
-                        'animation_duration': 8000,  # 8 seconds
-                        'message': f'Entered {mode}!',
-                        'need_exit_qr': True
-                    })
-                elif purpose == 'exit':
-                    # Metro/Bus exit scan
-                    session['current_step'] = current_step + 1
-                    return jsonify({
-                        'success': True, 
-                        'action': f'exit_{mode}',
-                        'show_animation': True,
-                        'animation_duration': 8000,  # 8 seconds
-                        'message': f'Exited {mode}!',
-                        'next_step': True
-                    })
+        result, status = apply_scan(journey_store, journey_events, journey_id, state, scan_info, journey_ledger)
+        return jsonify(result), status
                     
     except Exception as e:
         return jsonify({'error': 'Invalid QR code format'}), 400
 
+@app.route('/gate/scans', methods=['POST'])
+def gate_scans():
+    """Batched scans reported by metro gates and bus validators"""
+    if config.GATE_API_TOKEN and request.headers.get('Authorization') != f'Bearer {config.GATE_API_TOKEN}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    body = request.get_json(silent=True) or {}
+    scans = body.get('scans')
+    if not isinstance(scans, list):
+        return jsonify({'error': 'Expected a list of scans'}), 400
+    if len(scans) > config.GATE_MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {config.GATE_MAX_BATCH_SIZE} scans per batch'}), 413
+    results = gate_validator.validate_batch(scans)
+    return jsonify({
+        'results': results,
+        'accepted': sum(1 for r in results if r['accepted'])
+    })
+
 @app.route('/generate_exit_qr')
 def generate_exit_qr():
-    if 'journey_info' not in session or not session.get('payment_completed', False):
+    state = load_journey_state()
+    if state is None or not state['payment_completed']:
         return redirect(url_for('home'))
     
-    journey_info = session['journey_info']
-    current_step = session.get('current_step', 0)
+    journey_info = state['journey_info']
+    current_step = state['current_step']
     current_transport = journey_info['journey_steps'][current_step]
     
-    # Generate exit QR code for metro/bus
-    qr_data = {
-        'journey_id': session['journey_id'],
-        'step': current_step,
-        'mode': current_transport['mode'],
-        'action': 'scan',
-        'line_number': current_transport.get('line_number'),
-        'purpose': 'exit'
-    }
-    
-    qr_code_img = generate_qr_code(json.dumps(qr_data))
+    # Exit QR code for metro/bus
+    qr_url = url_for('qr_image', journey_id=session['journey_id'], step=current_step, fmt='png', purpose='exit')
     
     return render_template('exit_qr.html', 
-                         qr_code=qr_code_img, 
+                         qr_url=qr_url, 
+                         scan_data=build_qr_data(session['journey_id'], current_step, current_transport['mode'],
+                                                 current_transport.get('line_number'), 'exit'),
                          transport_info=current_transport,
                          current_step=current_step + 1,  # Add 1 for display (1-based indexing)
                          session=session)
 
+@app.route('/qr/<journey_id>/<int:step>.<fmt>')
+def qr_image(journey_id, step, fmt):
+    if fmt not in CONTENT_TYPES:
+        return jsonify({'error': 'Unsupported QR format'}), 404
+    if journey_id != session.get('journey_id'):
+        return jsonify({'error': 'Invalid journey'}), 403
+    
+    state = journey_store.get(journey_id)
+    if state is None or not state['payment_completed'] or step >= len(state['journey_info']['journey_steps']):
+        return jsonify({'error': 'No such journey step'}), 404
+    
+    transport = state['journey_info']['journey_steps'][step]
+    purpose = request.args.get('purpose', qr_purpose(transport['mode']))
+    if purpose not in ['entry', 'exit']:
+        return jsonify({'error': 'Invalid QR purpose'}), 400
+    
+    with metrics.stage_seconds.time('qr_image'):
+        image, etag = get_qr_image(journey_id, step, transport['mode'], transport.get('line_number'), purpose, fmt)
+    
+    # A step's QR code never changes, so browsers can keep it for the whole journey
+    response = Response(image, mimetype=CONTENT_TYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = config.JOURNEY_TTL_SECONDS
+    return response.make_conditional(request)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    entry = asset_manifest.lookup(filename)
+    if entry is None:
+        return jsonify({'error': 'Unknown asset'}), 404
+    
+    # Range requests (video seeking) get the file itself; whole text assets go out precompressed
+    if entry.gzipped is not None and request.range is None and request.accept_encodings['gzip']:
+        response = Response(entry.gzipped, mimetype=entry.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(entry.digest + '-gzip')
+        response = response.make_conditional(request)
+    else:
+        response = send_file(entry.path, mimetype=entry.mimetype, etag=entry.digest, conditional=True,
+                             max_age=config.ASSET_MAX_AGE_SECONDS)
+    if entry.gzipped is not None:
+        response.vary.add('Accept-Encoding')
+    # The URL changes with the content, so it never needs revalidating
+    response.cache_control.public = True
+    response.cache_control.max_age = config.ASSET_MAX_AGE_SECONDS
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/journey_jobs/<job_id>', methods=['GET', 'DELETE'])
+def journey_job(job_id):
+    if request.method == 'DELETE':
+        if not ai_jobs.cancel(job_id):
+            return jsonify({'error': 'Job not found or already finished'}), 404
+        return jsonify({'job_id': job_id, 'status': 'cancelled'})
+    
+    job = ai_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+def ledger_authorized():
+    return not config.LEDGER_API_TOKEN or request.headers.get('Authorization') == f'Bearer {config.LEDGER_API_TOKEN}'
+
+@app.route('/fare_results')
+def fare_results():
+    """Logged fare results - they include journey IDs, so the ledger token guards them too"""
+    if not ledger_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    since = request.args.get('since', type=float)
+    limit = request.args.get('limit', 100, type=int)
+    results = fare_log.query(journey_id=request.args.get('journey_id'),
+                             since=since,
+                             calculated_by=request.args.get('calculated_by'),
+                             limit=limit)
+    return jsonify({'results': results})
+
+@app.route('/ledger/journeys/<journey_id>')
+def ledger_history(journey_id):
+    """Every payment, scan and step transition recorded for a journey"""
+    if not ledger_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'journey_id': journey_id, 'entries': ledger.history(journey_id)})
+
+@app.route('/ledger/revenue')
+def ledger_revenue():
+    """Fare revenue per transport mode, optionally per day"""
+    if not ledger_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    by_day = request.args.get('by', '') == 'day'
+    return jsonify({'revenue': ledger.revenue_by_mode(since=request.args.get('since', type=float),
+                                                      until=request.args.get('until', type=float),
+                                                      by_day=by_day)})
+
+@app.route('/stops/resolve')
+def resolve_stop():
+    name = request.args.get('name', '').strip()
+    if not name:
+        return jsonify({'error': 'name is required'}), 400
+    stop = stop_registry.resolve(name)
+    if stop is None:
+        return jsonify({'error': 'Unknown stop'}), 404
+    return jsonify({'query': name, 'stop': stop._asdict()})
+
+@app.route('/stops/nearby')
+def nearby_stops():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({'error': 'lat and lon are required'}), 400
+    radius_km = min(request.args.get('radius_km', 0.5, type=float), config.STOP_NEARBY_MAX_KM)
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    stops = [dict(stop._asdict(), distance_km=round(distance, 3))
+             for stop, distance in stop_registry.nearby(lat, lon, radius_km, limit)]
+    return jsonify({'stops': stops})
+
 @app.route('/journey_status')
 def journey_status():
-    if 'journey_info' not in session:
+    state = load_journey_state()
+    if state is None:
         return jsonify({'error': 'No active journey'}), 400
     
-    journey_info = session['journey_info']
-    current_step = session.get('current_step', 0)
+    journey_id = session['journey_id']
+    status = journey_status_payload(state)
+    etag = status_etag(journey_id, status)
     
-    return jsonify({
-        'current_step': current_step,
-        'total_steps': len(journey_info['journey_steps']),
-        'completed': current_step >= len(journey_info['journey_steps']),
-        'journey_info': journey_info
-    })
+    # Long-poll: a client that already has the current status can wait for the next change
+    wait = min(request.args.get('wait', 0, type=float), config.JOURNEY_LONG_POLL_MAX_SECONDS)
+    if wait > 0 and request.if_none_match.contains(etag):
+        status = wait_for_journey_change(journey_id, etag, wait)
+        if status is None:
+            return jsonify({'error': 'No active journey'}), 400
+        etag = status_etag(journey_id, status)
+    
+    response = jsonify(status)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/journey_events')
+def journey_events_stream():
+    """Server-Sent Events stream of step changes, ending when the journey completes"""
+    if not config.JOURNEY_EVENTS_SSE:
+        return jsonify({'error': 'Journey events are disabled'}), 404
+    state = load_journey_state()
+    if state is None:
+        return jsonify({'error': 'No active journey'}), 400
+    journey_id = session['journey_id']
+    
+    def stream():
+        etag = None
+        deadline = time.monotonic() + config.JOURNEY_EVENTS_MAX_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            status = wait_for_journey_change(journey_id, etag, min(remaining, config.JOURNEY_EVENT_KEEPALIVE_SECONDS))
+            if status is None:
+                yield 'event: gone\ndata: {}\n\n'
+                return
+            new_etag = status_etag(journey_id, status)
+            if new_etag == etag:
+                yield ': keep-alive\n\n'
+                continue
+            etag = new_etag
+            event = 'completed' if status['completed'] else 'status'
+            yield f"event: {event}\nid: {etag}\ndata: {json.dumps(status)}\n\n"
+            if status['completed']:
+                return
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_page():
+    if not config.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=config.DEBUG, host='0.0.0.0', port=5000)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Static asset pipeline - content-hashed URLs, precompressed text assets and a smaller scan video
+
+Templates link assets through asset_url('css/qr_code.css'), which returns
+/assets/css/qr_code.<hash>.css. The hash changes whenever the file does, so the
+response can be cached as immutable. Text assets are gzipped once when the
+manifest is built.
+
+    python assets.py encode-video   # writes static/tick_video.webm with ffmpeg
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import config
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 512
+
+Asset = namedtuple('Asset', ('name', 'path', 'digest', 'mimetype', 'size', 'gzipped'))
+
+
+def hashed_name(name, digest):
+    """'css/app.css' -> 'css/app.<digest>.css'"""
+    root, ext = os.path.splitext(name)
+    return f'{root}.{digest}{ext}'
+
+
+def _load_asset(static_dir, name, hash_length):
+    path = os.path.join(static_dir, name)
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:hash_length]
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    gzipped = None
+    if len(data) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data) * 0.9:
+            gzipped = compressed
+    return Asset(name, path, digest, mimetype, len(data), gzipped)
+
+
+def _dir_signature(static_dir):
+    signature = []
+    for root, _, files in os.walk(static_dir):
+        for filename in files:
+            st = os.stat(os.path.join(root, filename))
+            signature.append((root, filename, st.st_mtime_ns, st.st_size))
+    return sorted(signature)
+
+
+class AssetManifest:
+    """Content hashes of every file under static_dir
+
+    With a check_interval the directory is stat'ed at most that often and the
+    manifest rebuilt when a file changes, for editing assets in development.
+    Otherwise it is built once.
+    """
+
+    def __init__(self, static_dir, hash_length=12, check_interval=0.0, clock=time.monotonic):
+        self.static_dir = static_dir
+        self.hash_length = hash_length
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self._by_name = {}
+        self._by_hashed = {}
+        self.builds = 0
+        self._refresh(force=True)
+
+    def _refresh(self, force=False):
+        if not force and (not self.check_interval or self._clock() < self._next_check):
+            return
+        with self._lock:
+            self._next_check = self._clock() + self.check_interval
+            signature = _dir_signature(self.static_dir)
+            if signature == self._signature:
+                return
+            by_name = {}
+            for root, _, files in os.walk(self.static_dir):
+                for filename in files:
+                    name = os.path.relpath(os.path.join(root, filename), self.static_dir).replace(os.sep, '/')
+                    by_name[name] = _load_asset(self.static_dir, name, self.hash_length)
+            self._by_name = by_name
+            self._by_hashed = {hashed_name(name, asset.digest): asset for name, asset in by_name.items()}
+            self._signature = signature
+            self.builds += 1
+
+    def names(self):
+        self._refresh()
+        return sorted(self._by_name)
+
+    def get(self, name):
+        self._refresh()
+        return self._by_name.get(name)
+
+    def exists(self, name):
+        return self.get(name) is not None
+
+    def hashed(self, name):
+        """Hashed file name for an asset, or None if there is no such file"""
+        asset = self.get(name)
+        return None if asset is None else hashed_name(name, asset.digest)
+
+    def lookup(self, hashed):
+        """The asset served at a hashed name; stale hashes are not found"""
+        self._refresh()
+        return self._by_hashed.get(hashed)
+
+    def stats(self):
+        assets = list(self._by_name.values())
+        return {
+            'assets': len(assets),
+            'bytes': sum(asset.size for asset in assets),
+            'gzipped_bytes': sum(len(asset.gzipped) if asset.gzipped else asset.size for asset in assets),
+            'builds': self.builds
+        }
+
+
+def encode_video(source, target, width=320, crf=40):
+    """Re-encode the scan animation as a small VP9 WebM with ffmpeg"""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is not installed")
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-i', source,
+                    '-vf', f'scale={width}:-2', '-an',
+                    '-c:v', 'libvpx-vp9', '-b:v', '0', '-crf', str(crf), '-row-mt', '1',
+                    target], check=True)
+    return os.path.getsize(source), os.path.getsize(target)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Static asset tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    video = commands.add_parser('encode-video', help='write a smaller WebM variant of the scan animation')
+    video.add_argument('--source', default=os.path.join(config.STATIC_DIR, 'tick_video.mp4'))
+    video.add_argument('--target', default=os.path.join(config.STATIC_DIR, 'tick_video.webm'))
+    video.add_argument('--width', type=int, default=320)
+    video.add_argument('--crf', type=int, default=40, help='VP9 quality, higher is smaller')
+    commands.add_parser('manifest', help='print the hashed name of every asset')
+    args = parser.parse_args(argv)
+
+    if args.command == 'encode-video':
+        try:
+            before, after = encode_video(args.source, args.target, args.width, args.crf)
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            print(f"Error encoding video: {e}")
+            sys.exit(1)
+        print(f"{args.target}: {after} bytes ({after / before:.0%} of {before})")
+    else:
+        manifest = AssetManifest(config.STATIC_DIR)
+        for name in manifest.names():
+            asset = manifest.get(name)
+            gzipped = f", gzip {len(asset.gzipped)}" if asset.gzipped else ''
+            print(f"{manifest.hashed(name)}  {asset.size} bytes{gzipped}")
+
+
+if __name__ == '__main__':
+    main()
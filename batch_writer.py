@@ -0,0 +1,89 @@
+# Background batched writer shared by the fare results log, the ledger and the traffic capture log
+import json
+import os
+import queue
+import threading
+import time
+
+
+def append_jsonl(path, items, fsync=True):
+    """Append items as JSON lines with a single O_APPEND write
+
+    Concurrent processes appending to the same file never interleave partial lines.
+    """
+    data = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items).encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BatchedWriter:
+    """Queue drained by a writer thread that hands items to write_batch in batches
+
+    A batch closes at batch_size items or flush_interval seconds after its first
+    item. Items queued by one put() always land in the same batch. A failed
+    write_batch is counted and logged, and its items are dropped.
+    """
+
+    def __init__(self, write_batch, name, batch_size=100, flush_interval=1.0):
+        self.write_batch = write_batch
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.items_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+
+    def put(self, *items):
+        """Queue items to be written together"""
+        self._ensure_writer()
+        self._queue.put(items)
+
+    def _ensure_writer(self):
+        # Started lazily so each forked worker gets its own writer thread
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name=f'{self.name}-writer', daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            groups = [self._queue.get()]
+            size = len(groups[0])
+            deadline = time.monotonic() + self.flush_interval
+            while size < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    groups.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(groups[-1])
+            batch = [item for items in groups for item in items]
+            try:
+                self.write_batch(batch)
+                self.items_written += len(batch)
+                self.batches_written += 1
+            except Exception as e:
+                self.write_errors += 1
+                print(f"Error writing {self.name}: {e}")
+            for _ in groups:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued item has been written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def qsize(self):
+        return self._queue.qsize()
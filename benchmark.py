@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""Benchmarks for the parsing, fare, QR and request hot paths
+
+Journeys are generated from a fixed seed in the sample_journeys.py format, so
+runs are comparable. Results are written as JSON and can be compared against a
+stored baseline:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --fail-on-regression
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import config
+from mock_ark_server import answer_for_prompt
+
+MODES = ('taxi', 'metro', 'bus', 'transfer')
+METRO_LINES = ('MRed1', 'MRed2', 'MGreen1')
+BUS_LINES = ('8', '11', '64', 'F55', 'X28')
+
+# name -> (legs, stops per leg, modes to draw from)
+SCENARIOS = {
+    'short': (3, 2, MODES),
+    'commute': (8, 12, MODES),
+    'long_rail': (20, 200, ('metro', 'bus', 'transfer')),
+    'huge_stops': (4, 2000, ('metro', 'bus'))
+}
+
+
+def synthetic_journey(rng, legs, stops_per_leg, modes=MODES):
+    """Journey text with the given number of legs and stops, in the sample journey format"""
+    lines = ["=== Synthetic Journey ==="]
+    stop = rng.choice(config.DUBAI_STOPS)
+    for number in range(1, legs + 1):
+        mode = rng.choice(modes)
+        distance = round(rng.uniform(0.02, 0.3) if mode == 'transfer' else rng.uniform(0.5, 35.0), 2)
+        stop_count = 2 if mode in ('taxi', 'transfer') else max(2, stops_per_leg)
+        minutes = round(distance * rng.uniform(1.0, 3.0) + 1, 1)
+        if mode == 'taxi':
+            label = 'taxi'
+        elif mode == 'transfer':
+            label = 'transfer (walk)'
+        elif mode == 'metro':
+            label = f"{rng.choice(METRO_LINES)} (metro)"
+        else:
+            label = f"{rng.choice(BUS_LINES)} (bus)"
+
+        stops = [stop] + [f"{rng.choice(config.DUBAI_STOPS)} {number}-{i}" for i in range(1, stop_count)]
+        stop = stops[-1]
+        lines.append(f"{number}. {label}: {stop_count - 1} stops, {minutes} min, {distance} km")
+        lines.append(f"   Stops: {' -> '.join(stops)}")
+        lines.append("")
+    return '\n'.join(lines)
+
+
+def bench(func, min_time=0.2, min_rounds=5):
+    """Time func until min_time has passed; returns per-call statistics in microseconds
+
+    Like timeit, garbage collection is paused while timing.
+    """
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _bench(func, min_time, min_rounds)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _bench(func, min_time, min_rounds):
+    # Calibrate a batch size that takes about a millisecond, so timer overhead stays small
+    batch = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(batch):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.001 or batch >= 1 << 20:
+            break
+        batch *= 2
+
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < min_rounds or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for _ in range(batch):
+            func()
+        samples.append((time.perf_counter() - start) / batch * 1e6)
+
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'median_us': round(median, 3),
+        'p95_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'ops_per_sec': round(1e6 / median, 1) if median else None,
+        'calls': len(samples) * batch
+    }
+
+
+class StubArk:
+    """Stands in for the Ark client: answers chat completions from the local fare engine"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        content = json.dumps(answer_for_prompt(messages[-1]['content']))
+        if stream:
+            return self._chunks(content)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    @staticmethod
+    def _chunks(content, chunk_chars=40):
+        for start in range(0, len(content), chunk_chars):
+            delta = SimpleNamespace(content=content[start:start + chunk_chars])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def micro_benchmarks(min_time):
+    import app
+    from app import parse_journey_text, parse_journey_manually, calculate_fare, generate_qr_code
+    from qr_render import build_qr_data
+
+    rng = random.Random(1234)
+    results = {}
+    for name, (legs, stops, modes) in SCENARIOS.items():
+        text = synthetic_journey(rng, legs, stops, modes)
+        results[f'parse_journey_text/{name}'] = bench(lambda: parse_journey_text(text), min_time)
+        results[f'parse_journey_manually/{name}'] = bench(lambda: parse_journey_manually(text), min_time)
+
+    distances = [rng.uniform(0.1, 40.0) for _ in range(1000)]
+    for mode in ('taxi', 'metro', 'bus'):
+        results[f'calculate_fare/{mode}'] = bench(
+            lambda: [calculate_fare(mode, d) for d in distances], min_time)
+        results[f'calculate_fare/{mode}']['note'] = 'per 1000 fares'
+
+    qr_data = build_qr_data('3f3f7fbe-01f3-446c-af13-d735001e7f55', 2, 'metro', 'MRed1', 'exit')
+    results['generate_qr_code'] = bench(lambda: generate_qr_code(qr_data), min_time)
+
+    # AI path with a stubbed client and unique journeys, so every call misses the cache
+    counter = iter(range(10 ** 9))
+    text = synthetic_journey(rng, 6, 10)
+    results['get_journey_info_from_ai/stub'] = bench(
+        lambda: app.get_journey_info_from_ai(f"{text}\n# run {next(counter)}"), min_time)
+    return results
+
+
+def _scan_data(html, function):
+    return json.loads(re.search(function + r'\((".*?")\)', html).group(1))
+
+
+def journey_flow(client, journey_name, poll_status=False):
+    """process -> pay -> QR -> scan through every step of a sample journey; returns requests made
+
+    With poll_status the journey status is fetched after every scan, as the QR pages do.
+    """
+    requests = 0
+    response = client.post('/process_journey', json={'journey': journey_name})
+    amount = response.get_json()['total_fare']
+    client.post('/process_payment', json={'payment_method': 'credit_card', 'amount': amount or 1})
+    requests += 2
+    while True:
+        html = client.get('/generate_qr').get_data(as_text=True)
+        requests += 1
+        if 'scanQR(' not in html:
+            return requests
+        client.get(re.search(r'src="(/qr/[^"]+)"', html).group(1).replace('&amp;', '&'))
+        result = client.post('/scan_qr', json={'qr_data': _scan_data(html, 'scanQR')}).get_json()
+        requests += 2
+        if poll_status:
+            client.get('/journey_status')
+            requests += 1
+        if result.get('need_exit_qr'):
+            html = client.get('/generate_exit_qr').get_data(as_text=True)
+            client.post('/scan_qr', json={'qr_data': _scan_data(html, 'scanExitQR')})
+            requests += 2
+            if poll_status:
+                client.get('/journey_status')
+                requests += 1
+
+
+def flow_benchmark(rounds):
+    from app import app
+    results = {}
+    for journey_name in ('multi_modal', 'simple', 'complex'):
+        durations = []
+        requests = 0
+        for _ in range(rounds):
+            client = app.test_client()
+            start = time.perf_counter()
+            requests = journey_flow(client, journey_name)
+            durations.append((time.perf_counter() - start) * 1e3)
+        durations.sort()
+        median = statistics.median(durations)
+        results[f'flow/{journey_name}'] = {
+            'median_ms': round(median, 3),
+            'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+            'requests_per_flow': requests,
+            'flows_per_sec': round(1e3 / median, 1)
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Ratios of current to baseline time per benchmark; returns (report lines, regressions)"""
+    lines, regressions = [], []
+    for name, result in sorted(results.items()):
+        before = baseline.get('results', {}).get(name)
+        key = 'median_us' if 'median_us' in result else 'median_ms'
+        if not before or not before.get(key):
+            lines.append(f"{name:45} {result[key]:>12.3f}  (new)")
+            continue
+        ratio = result[key] / before[key]
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        lines.append(f"{name:45} {before[key]:>12.3f} -> {result[key]:>12.3f}  x{ratio:.2f}{flag}")
+    return lines, regressions
+
+
+def setup_environment(tmp_dir, ai_latency):
+    """Point side effects at a scratch directory and swap in the stub AI client"""
+    import app
+    from fare_log import fare_log
+    from ledger import ledger
+    fare_log.path = os.path.join(tmp_dir, 'fare_results.jsonl')
+    ledger.path = os.path.join(tmp_dir, 'ledger.sqlite3')
+    config.AI_BATCH_WINDOW_MS = 0  # Time the AI call itself, not the batching window
+    app.ai_client.client = StubArk(latency=ai_latency)
+
+
+def flush_side_effects():
+    """Wait for the background log writers before the scratch directory goes away"""
+    from fare_log import fare_log
+    from ledger import ledger
+    fare_log.flush()
+    ledger.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the hot-path benchmarks')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per micro-benchmark')
+    parser.add_argument('--flow-rounds', type=int, default=30, help='full journeys per sample in the flow benchmark')
+    parser.add_argument('--ai-latency', type=float, default=0.0, help='seconds the stub AI waits per call')
+    parser.add_argument('--only', choices=['micro', 'flow'], help='run one group of benchmarks')
+    parser.add_argument('--save', help='write results JSON to this file')
+    parser.add_argument('--baseline', help='compare against a results JSON file')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_environment(tmp_dir, args.ai_latency)
+        results = {}
+        if args.only != 'flow':
+            results.update(micro_benchmarks(args.min_time))
+        if args.only != 'micro':
+            results.update(flow_benchmark(args.flow_rounds))
+        flush_side_effects()
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'qr_payload_format': config.QR_PAYLOAD_FORMAT,
+            'journey_store': config.JOURNEY_STORE_BACKEND
+        },
+        'results': results
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressions = compare(results, json.load(f), args.threshold)
+        print('\n'.join(lines))
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+    elif not args.save:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
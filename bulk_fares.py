@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Reprice journey datasets in bulk
+
+Streams journeys from JSONL, parses them in chunks into columnar mode/distance
+arrays and prices every step with NumPy using the fare constants in config.py.
+Each input line is a JSON object with either "journey_text" (the same text
+/process_journey accepts) or "journey_steps" (dicts with mode and distance_km,
+as in AI results); "journey_id" and "nol_tier" are optional, and a journey
+without an ID is identified by its line's byte offset in the file.
+
+    python bulk_fares.py journeys.jsonl -o fares.jsonl --workers 8
+    python bulk_fares.py journeys.jsonl --set TAXI_PER_KM=9 --set METRO_ZONE_FARE=2.5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+import config
+from journey_parser import parse_journey_text
+
+MODE_CODES = {'taxi': 1, 'metro': 2, 'bus': 3}  # everything else (transfers, walks) is free
+FARE_CONSTANTS = (
+    'TAXI_BASE_FARE', 'TAXI_PER_KM',
+    'METRO_BASE_FARE', 'METRO_ZONE_FARE',
+    'BUS_BASE_FARE', 'BUS_ZONE_FARE',
+    'ZONE_LENGTH_KM', 'MAX_FARE_ZONES'
+)
+
+
+def fare_table(overrides=None):
+    """Fare constants and Nol tier rules as arrays, with optional what-if overrides"""
+    table = {name: getattr(config, name) for name in FARE_CONSTANTS}
+    table.update(overrides or {})
+    tiers = list(config.NOL_CARD_TIERS)
+    rules = [config.NOL_CARD_TIERS[name] for name in tiers]
+    table['tiers'] = tiers
+    table['multiplier'] = np.array([r['multiplier'] for r in rules], dtype=np.float64)
+    table['surcharge'] = np.array([r.get('surcharge', 0.0) for r in rules], dtype=np.float64)
+    # No cap is modelled as an unreachable one
+    table['daily_cap'] = np.array([r['daily_cap'] if r.get('daily_cap') is not None else np.inf for r in rules],
+                                  dtype=np.float64)
+    return table
+
+
+class JourneyColumns:
+    """A chunk of journeys flattened into one row per step
+
+    journey_start[i]:journey_start[i + 1] are the step rows of journey i.
+    """
+
+    def __init__(self, journey_ids, tiers, journey_start, modes, distances):
+        self.journey_ids = journey_ids
+        self.tiers = tiers
+        self.journey_start = journey_start
+        self.modes = modes
+        self.distances = distances
+
+    def __len__(self):
+        return len(self.journey_ids)
+
+
+def _record_steps(record):
+    if record.get('journey_text'):
+        return [(step.mode, step.distance) for step in parse_journey_text(record['journey_text'])]
+    return [(step.get('mode'), step.get('distance_km', step.get('distance', 0)) or 0)
+            for step in record.get('journey_steps', [])]
+
+
+def columns_from_lines(lines, table, default_tier=None, line_ids=None):
+    """Parse JSONL lines into JourneyColumns; returns (columns, number of lines skipped)
+
+    Lines may be str or UTF-8 bytes; a line that does not decode is skipped
+    like malformed JSON. Journeys without a journey_id get line_ids[i] (the
+    line's byte offset when read from a file), or the line's index when
+    line_ids is not given.
+    """
+    tier_index = {name: i for i, name in enumerate(table['tiers'])}
+    default_index = tier_index[default_tier or config.DEFAULT_NOL_TIER]
+    journey_ids, tiers, starts, modes, distances = [], [], [0], [], []
+    skipped = 0
+    for offset, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line.decode('utf-8') if isinstance(line, bytes) else line)
+            steps = _record_steps(record)
+            step_distances = [float(distance) for _, distance in steps]
+        except (ValueError, TypeError, AttributeError):
+            skipped += 1
+            continue
+        journey_ids.append(record.get('journey_id', offset if line_ids is None else line_ids[offset]))
+        tiers.append(tier_index.get(record.get('nol_tier'), default_index))
+        modes.extend(MODE_CODES.get(mode, 0) for mode, _ in steps)
+        distances.extend(step_distances)
+        starts.append(len(modes))
+
+    columns = JourneyColumns(
+        journey_ids,
+        np.array(tiers, dtype=np.intp),
+        np.array(starts, dtype=np.intp),
+        np.array(modes, dtype=np.int8),
+        np.array(distances, dtype=np.float64)
+    )
+    return columns, skipped
+
+
+def price_columns(columns, table):
+    """Per-step and per-journey fares, matching fare_engine.price_journey with no prior spend
+
+    Returns (step_fares, total_fares) as integer arrays aligned with the step rows
+    and journeys of columns.
+    """
+    modes, distances = columns.modes, columns.distances
+    counts = np.diff(columns.journey_start)
+    journey_of_step = np.repeat(np.arange(len(columns)), counts)
+    step_tier = columns.tiers[journey_of_step]
+
+    zones = 1 + np.floor_divide(distances, table['ZONE_LENGTH_KM'])
+    zones = np.clip(zones, 1, table['MAX_FARE_ZONES'])
+    is_metro = modes == MODE_CODES['metro']
+    stage = np.where(is_metro, table['METRO_BASE_FARE'], table['BUS_BASE_FARE']) + \
+        np.where(is_metro, table['METRO_ZONE_FARE'], table['BUS_ZONE_FARE']) * (zones - 1)
+    stage = stage * table['multiplier'][step_tier] + table['surcharge'][step_tier]
+    taxi = np.maximum(table['TAXI_BASE_FARE'], table['TAXI_PER_KM'] * distances)
+
+    is_stage = is_metro | (modes == MODE_CODES['bus'])
+    # np.round rounds halves to even, like the round() calculate_fare uses
+    fares = np.round(np.select([modes == MODE_CODES['taxi'], is_stage], [taxi, stage], 0.0))
+
+    # Daily cap: each journey's metro/bus spend is capped cumulatively, in step order
+    stage_fares = np.where(is_stage, fares, 0.0)
+    running = np.cumsum(stage_fares)
+    before_journey = np.concatenate(([0.0], running))[columns.journey_start[:-1]]
+    spent = running - np.repeat(before_journey, counts)
+    cap = table['daily_cap'][step_tier]
+    capped = np.minimum(spent, cap) - np.minimum(spent - stage_fares, cap)
+    fares = np.where(is_stage, np.maximum(capped, 0.0), fares).astype(np.int64)
+
+    fare_sums = np.concatenate(([0], np.cumsum(fares)))
+    totals = fare_sums[columns.journey_start[1:]] - fare_sums[columns.journey_start[:-1]]
+    return fares, totals
+
+
+def iter_line_chunks(handle, chunk_size, end=None):
+    """Yield (byte offsets, lines) from handle, stopping at byte offset end
+
+    Offsets are from the start of the file, so they identify lines uniquely
+    whichever shard reads them.
+    """
+    offsets, lines = [], []
+    while end is None or handle.tell() < end:
+        offset = handle.tell()
+        line = handle.readline()
+        if not line:
+            break
+        offsets.append(offset)
+        lines.append(line)
+        if len(lines) >= chunk_size:
+            yield offsets, lines
+            offsets, lines = [], []
+    if lines:
+        yield offsets, lines
+
+
+def reprice_stream(handle, out, table, chunk_size=10000, default_tier=None, end=None):
+    """Reprice every journey readable from handle, writing one JSON line per journey to out"""
+    summary = {'journeys': 0, 'steps': 0, 'skipped': 0, 'total_fare': 0}
+    for offsets, lines in iter_line_chunks(handle, chunk_size, end):
+        columns, skipped = columns_from_lines(lines, table, default_tier, offsets)
+        fares, totals = price_columns(columns, table)
+        step_fares = fares.tolist()
+        starts = columns.journey_start.tolist()
+        out.write(''.join(
+            json.dumps({
+                'journey_id': journey_id,
+                'nol_tier': table['tiers'][columns.tiers[i]],
+                'step_fares': step_fares[starts[i]:starts[i + 1]],
+                'total_fare': int(totals[i])
+            }) + '\n'
+            for i, journey_id in enumerate(columns.journey_ids)
+        ))
+        summary['journeys'] += len(columns)
+        summary['steps'] += len(step_fares)
+        summary['skipped'] += skipped
+        summary['total_fare'] += int(totals.sum())
+    return summary
+
+
+def _shard_bounds(path, shards):
+    """Split a file into byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as handle:
+        for i in range(1, shards):
+            handle.seek(max(size * i // shards, bounds[-1]))
+            if handle.tell() > 0:
+                handle.readline()  # Finish the line the split point landed in
+            bounds.append(max(handle.tell(), bounds[-1]))
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _reprice_shard(args):
+    path, start, end, part_path, overrides, chunk_size, default_tier = args
+    table = fare_table(overrides)
+    with open(path, 'rb') as handle, open(part_path, 'w', encoding='utf-8') as out:
+        handle.seek(start)
+        return reprice_stream(handle, out, table, chunk_size, default_tier, end)
+
+
+def reprice_file(path, out_path, workers=1, chunk_size=10000, default_tier=None, overrides=None):
+    """Reprice a JSONL file, sharding it across worker processes; returns summary counts
+
+    Journeys without a journey_id are identified by their line's byte offset.
+    """
+    if workers <= 1:
+        with open(path, 'rb') as handle, open(out_path, 'w', encoding='utf-8') as out:
+            return reprice_stream(handle, out, fare_table(overrides), chunk_size, default_tier)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as tmp:
+        tasks = [(path, start, end, os.path.join(tmp, f'part-{i}.jsonl'), overrides, chunk_size, default_tier)
+                 for i, (start, end) in enumerate(_shard_bounds(path, workers))]
+        with multiprocessing.Pool(workers) as pool:
+            summaries = pool.map(_reprice_shard, tasks)
+        # Parts are concatenated in shard order, so output follows input order
+        with open(out_path, 'w', encoding='utf-8') as out:
+            for task in tasks:
+                with open(task[3], encoding='utf-8') as part:
+                    shutil.copyfileobj(part, out)
+
+    return {key: sum(s[key] for s in summaries) for key in summaries[0]}
+
+
+def _parse_override(text):
+    name, _, value = text.partition('=')
+    if name not in FARE_CONSTANTS or not value:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE with NAME one of {', '.join(FARE_CONSTANTS)}")
+    return name, float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reprice journeys from a JSONL file')
+    parser.add_argument('input', help='JSONL file of journeys')
+    parser.add_argument('-o', '--output', help='JSONL file for the repriced journeys (default: stdout)')
+    parser.add_argument('--workers', type=int, default=1, help='processes to shard the file across')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='journeys parsed and priced per chunk')
+    parser.add_argument('--tier', choices=list(config.NOL_CARD_TIERS), help='Nol tier for journeys without one')
+    parser.add_argument('--set', dest='overrides', type=_parse_override, action='append', default=[],
+                        help='override a fare constant, e.g. TAXI_PER_KM=9')
+    args = parser.parse_args(argv)
+    overrides = dict(args.overrides)
+
+    if args.output:
+        summary = reprice_file(args.input, args.output, args.workers, args.chunk_size, args.tier, overrides)
+    else:
+        with open(args.input, 'rb') as handle:
+            summary = reprice_stream(handle, sys.stdout, fare_table(overrides), args.chunk_size, args.tier)
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,12 +15,127 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
 
 # RTA Fare Configuration (in AED)
-TAXI_BASE_FARE = 12.0
+TAXI_BASE_FARE = 12.0  # Minimum taxi fare
 TAXI_PER_KM = 8.0
+
+# Metro and bus use zone (stage) fares: the single-zone fare plus a supplement
+# for every additional zone crossed, up to MAX_FARE_ZONES
 METRO_BASE_FARE = 3.0
-METRO_PER_KM = 0.5
+METRO_ZONE_FARE = 2.25
 BUS_BASE_FARE = 2.0
-BUS_PER_KM = 0.3
+BUS_ZONE_FARE = 1.5
+ZONE_LENGTH_KM = 10.0  # Approximate zone size used to count zones from distance
+MAX_FARE_ZONES = 3
+
+# Nol card tiers - stage fares are multiplied per tier, Red tickets pay a surcharge,
+# and metro/bus spend per day is capped where the tier has a daily cap
+NOL_CARD_TIERS = {
+    'red': {'multiplier': 1.0, 'surcharge': 1.0, 'daily_cap': None},
+    'silver': {'multiplier': 1.0, 'surcharge': 0.0, 'daily_cap': 20.0},
+    'gold': {'multiplier': 2.0, 'surcharge': 0.0, 'daily_cap': 40.0},
+    'blue': {'multiplier': 0.5, 'surcharge': 0.0, 'daily_cap': 10.0},  # Concession card
+}
+DEFAULT_NOL_TIER = os.getenv("DEFAULT_NOL_TIER", "silver")
+
+# AI Response Cache Configuration
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "512"))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH")  # Optional SQLite file shared between workers
+
+# AI Extraction Jobs - journeys that need the AI are priced locally straight away and
+# revised in the background, so request workers never wait on the LLM
+AI_ASYNC_JOBS = os.getenv("AI_ASYNC_JOBS", "True").lower() == "true"
+AI_JOB_CONCURRENCY = int(os.getenv("AI_JOB_CONCURRENCY", "4"))
+AI_JOB_MAX_PENDING = int(os.getenv("AI_JOB_MAX_PENDING", "64"))
+AI_JOB_TIMEOUT_SECONDS = float(os.getenv("AI_JOB_TIMEOUT_SECONDS", "30"))
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", "25"))  # Deadline for one AI call, hedges included
+
+# AI provider connection pool, hedged requests and circuit breaker
+AI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AI_CONNECT_TIMEOUT_SECONDS", "3"))
+AI_POOL_CONNECTIONS = int(os.getenv("AI_POOL_CONNECTIONS", "16"))
+AI_POOL_KEEPALIVE = int(os.getenv("AI_POOL_KEEPALIVE", "8"))
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "True").lower() == "true"
+AI_HEDGE_MIN_SECONDS = float(os.getenv("AI_HEDGE_MIN_SECONDS", "1.0"))  # Never hedge before this, even if p95 is lower
+AI_HEDGE_BUDGET = float(os.getenv("AI_HEDGE_BUDGET", "0.1"))  # At most this share of calls get a second request
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))  # Consecutive failures that open the circuit
+AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+# Journeys are sent to the AI with only the first and last stop of each leg
+AI_PROMPT_COMPACTION = os.getenv("AI_PROMPT_COMPACTION", "True").lower() == "true"
+
+# Streamed extraction - steps are checked against the local parse as they arrive
+AI_STREAMING = os.getenv("AI_STREAMING", "True").lower() == "true"
+AI_STREAM_DISTANCE_TOLERANCE = float(os.getenv("AI_STREAM_DISTANCE_TOLERANCE", "0.25"))  # Share of the parsed distance a step may differ by
+
+# AI Request Batching - concurrent extractions within the window share one Ark call (0 disables)
+AI_BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "150"))
+AI_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "8"))
+
+# Journey State Store - "memory" (single worker) or "sqlite" (shared between workers)
+JOURNEY_STORE_BACKEND = os.getenv("JOURNEY_STORE_BACKEND", "memory")
+JOURNEY_STORE_PATH = os.getenv("JOURNEY_STORE_PATH", "journeys.sqlite3")
+JOURNEY_TTL_SECONDS = int(os.getenv("JOURNEY_TTL_SECONDS", "86400"))
+
+# Sample Journey Catalog - the JSON file is re-checked for changes at most this often
+SAMPLE_JOURNEY_PATH = os.getenv("SAMPLE_JOURNEY_PATH", "sample_journey.json")
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "2.0"))
+
+# Journey Status Push (SSE / long-poll)
+# Each /journey_events connection holds a request worker, so scan pages long-poll
+# /journey_status unless SSE is turned on - only do that with threaded or async workers
+JOURNEY_EVENTS_SSE = os.getenv("JOURNEY_EVENTS_SSE", "False").lower() == "true"
+JOURNEY_EVENT_POLL_SECONDS = 1.0  # Store re-check interval, for changes made by other workers
+JOURNEY_EVENT_KEEPALIVE_SECONDS = 15.0
+JOURNEY_EVENTS_MAX_SECONDS = 300.0  # Clients reconnect after this
+JOURNEY_LONG_POLL_MAX_SECONDS = 30.0
+
+# Gate Validation - batched scans from metro gates and bus validators
+GATE_API_TOKEN = os.getenv("GATE_API_TOKEN", "")  # Bearer token required on /gate/scans when set
+GATE_MAX_BATCH_SIZE = int(os.getenv("GATE_MAX_BATCH_SIZE", "1000"))
+GATE_IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("GATE_IDEMPOTENCY_MAX_ENTRIES", "100000"))
+GATE_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("GATE_IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+# Calculated Fare Results Log (append-only JSONL)
+FARE_LOG_PATH = os.getenv("FARE_LOG_PATH", "fare_results.jsonl")
+FARE_LOG_BATCH_SIZE = int(os.getenv("FARE_LOG_BATCH_SIZE", "100"))
+FARE_LOG_FLUSH_INTERVAL = float(os.getenv("FARE_LOG_FLUSH_INTERVAL", "1.0"))
+
+# Payment and Trip Ledger (append-only SQLite, written behind the request path)
+LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "True").lower() == "true"
+LEDGER_PATH = os.getenv("LEDGER_PATH", "ledger.sqlite3")
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "200"))
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "0.5"))
+LEDGER_API_TOKEN = os.getenv("LEDGER_API_TOKEN", "")  # Bearer token required on /ledger/* and /fare_results when set
+
+# QR Code Rendering - the fast path uses a fixed symbol version and mask pattern
+QR_CACHE_MAX_ENTRIES = int(os.getenv("QR_CACHE_MAX_ENTRIES", "1024"))
+QR_FAST_PATH = os.getenv("QR_FAST_PATH", "True").lower() == "true"
+QR_VERSION = int(os.getenv("QR_VERSION", "3"))  # Fits the compact payload at error correction L (JSON needs 8)
+QR_MASK_PATTERN = 0
+# "compact" packs scan data into a signed base32 payload validators can verify offline; "json" is the legacy format
+QR_PAYLOAD_FORMAT = os.getenv("QR_PAYLOAD_FORMAT", "compact")
+
+# QR codes for the whole journey are pre-rendered after payment on a "thread" or "process" pool
+QR_PRERENDER_WORKERS = int(os.getenv("QR_PRERENDER_WORKERS", "2"))
+QR_PRERENDER_EXECUTOR = os.getenv("QR_PRERENDER_EXECUTOR", "thread")
+QR_PRERENDER_WAIT_SECONDS = 2.0  # How long a QR page waits for an in-flight pre-render
+
+# Traffic Capture - journey route requests are logged for replay with traffic.py when a path is set
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")
+
+# Metrics - served at /metrics in Prometheus text format
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "False").lower() == "true"  # Adds Server-Timing
+
+# Static assets - served at content-hashed URLs and cached as immutable
+STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+ASSET_MAX_AGE_SECONDS = int(os.getenv("ASSET_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+ASSET_CHECK_INTERVAL = float(os.getenv("ASSET_CHECK_INTERVAL", "0"))  # Rescan static files this often in development; 0 scans once
+
+# Stop registry - optional GTFS stops.txt loaded alongside DUBAI_STOPS
+STOPS_PATH = os.getenv("STOPS_PATH")
+STOP_GRID_CELL_DEGREES = float(os.getenv("STOP_GRID_CELL_DEGREES", "0.01"))  # About 1.1 km
+STOP_NEARBY_MAX_KM = float(os.getenv("STOP_NEARBY_MAX_KM", "5"))
 
 # Dubai Transport Stops
 DUBAI_STOPS = [
@@ -0,0 +1,23 @@
+# Shared pytest fixtures - app side effects go to a scratch directory
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+
+
+@pytest.fixture(scope='session')
+def side_effect_dir(tmp_path_factory):
+    from benchmark import flush_side_effects
+    yield tmp_path_factory.mktemp('side_effects')
+    flush_side_effects()
+
+
+@pytest.fixture(autouse=True)
+def scratch_logs(side_effect_dir):
+    """Keep the fare results log and ledger the app writes to out of the working directory"""
+    from fare_log import fare_log
+    from ledger import ledger
+    fare_log.path = str(side_effect_dir / 'fare_results.jsonl')
+    ledger.path = str(side_effect_dir / 'ledger.sqlite3')
@@ -0,0 +1,144 @@
+# Local RTA fare engine - prices well-formed journeys without calling the AI
+import copy
+import re
+import threading
+import uuid
+from collections import Counter
+
+import config
+
+# Step headers look like "1. taxi:", "3. MRed1 (metro):" or "5. 64 (bus):"
+_STEP_HEADER = re.compile(r'^\s*\d+\.\s', re.MULTILINE)
+
+_path_counts = Counter()
+_path_lock = threading.Lock()
+
+
+def nol_tier(tier=None):
+    """Return the fare rules for a Nol card tier, falling back to the default tier"""
+    return config.NOL_CARD_TIERS.get(tier or config.DEFAULT_NOL_TIER,
+                                     config.NOL_CARD_TIERS[config.DEFAULT_NOL_TIER])
+
+
+def zones_for_distance(distance):
+    """Approximate the number of fare zones travelled from the distance"""
+    zones = 1 + int(distance // config.ZONE_LENGTH_KM)
+    return min(zones, config.MAX_FARE_ZONES)
+
+
+def stage_fare(mode, zones, tier=None):
+    """Metro/bus stage fare for the number of zones travelled"""
+    if mode == 'metro':
+        base, per_zone = config.METRO_BASE_FARE, config.METRO_ZONE_FARE
+    else:
+        base, per_zone = config.BUS_BASE_FARE, config.BUS_ZONE_FARE
+
+    zones = max(1, min(zones, config.MAX_FARE_ZONES))
+    rules = nol_tier(tier)
+    return (base + per_zone * (zones - 1)) * rules['multiplier'] + rules.get('surcharge', 0.0)
+
+
+def calculate_fare(mode, distance, line_number=None, tier=None, zones=None):
+    """Calculate fare based on transport mode and distance"""
+    if mode == 'taxi':
+        fare = max(config.TAXI_BASE_FARE, config.TAXI_PER_KM * distance)  # Minimum base fare
+    elif mode in ('metro', 'bus'):
+        fare = stage_fare(mode, zones or zones_for_distance(distance), tier)
+    else:
+        fare = 0.0
+
+    # Round to whole numbers for clean display
+    return round(fare)
+
+
+def apply_daily_cap(fare, spent_today, tier=None):
+    """Limit a metro/bus fare so the day's Nol spend never exceeds the tier's daily cap"""
+    cap = nol_tier(tier).get('daily_cap')
+    if cap is None:
+        return fare
+    return max(0, min(fare, round(cap - spent_today)))
+
+
+def apply_tier(journey_info, tier=None, spent_today=0.0):
+    """Re-price metro/bus steps priced at the default tier (AI answers, fallbacks) for a rider's tier and daily cap
+
+    Steps are re-priced from their distance; a step without a usable distance
+    has its fare converted between the tiers' rules instead. Returns a new
+    journey info - taxi fares do not depend on the tier.
+    """
+    default, rules = nol_tier(), nol_tier(tier)
+    journey_info = copy.deepcopy(journey_info)
+    nol_spent = spent_today
+    for step in journey_info.get('journey_steps', []):
+        if step.get('mode') not in ('metro', 'bus'):
+            continue
+        try:
+            fare = calculate_fare(step['mode'], float(step['distance_km']), step.get('line_number'), tier)
+        except (KeyError, TypeError, ValueError):
+            zone_fare = (float(step.get('fare_aed', 0)) - default.get('surcharge', 0.0)) / default['multiplier']
+            fare = round(zone_fare * rules['multiplier'] + rules.get('surcharge', 0.0))
+        fare = apply_daily_cap(fare, nol_spent, tier)
+        nol_spent += fare
+        step['fare_aed'] = fare
+    journey_info['total_fare'] = round(sum(float(step.get('fare_aed', 0))
+                                           for step in journey_info.get('journey_steps', [])))
+    journey_info['nol_tier'] = tier or config.DEFAULT_NOL_TIER
+    return journey_info
+
+
+def step_count(journey_text):
+    """Number of numbered step headers in the journey text"""
+    return len(_STEP_HEADER.findall(journey_text))
+
+
+def is_confident(journey_text, steps):
+    """True when every numbered step in the text was parsed with its distance and stops"""
+    if not steps or step_count(journey_text) != len(steps):
+        return False
+    for step in steps:
+        if step['mode'] != 'transfer' and (step['distance'] <= 0 or len(step['stops']) < 2):
+            return False
+    return True
+
+
+def price_journey(steps, tier=None, spent_today=0.0):
+    """Build journey info with per-step fares from parsed journey steps"""
+    total_fare = 0
+    nol_spent = spent_today
+
+    journey_steps = []
+    for i, step in enumerate(steps):
+        fare = calculate_fare(step['mode'], step['distance'], step.get('line_number'), tier)
+        if step['mode'] in ('metro', 'bus'):
+            fare = apply_daily_cap(fare, nol_spent, tier)
+            nol_spent += fare
+        total_fare += fare
+
+        journey_steps.append({
+            "step_number": i + 1,
+            "mode": step['mode'],
+            "line_number": step.get('line_number'),
+            "distance_km": step['distance'],
+            "stops": step['stops'],
+            "fare_aed": fare,  # Already rounded in calculate_fare function
+            "completed": False
+        })
+
+    return {
+        "journey_steps": journey_steps,
+        "total_fare": round(total_fare),  # Round total fare too
+        "total_distance": sum(step['distance'] for step in steps),
+        "nol_tier": tier or config.DEFAULT_NOL_TIER,
+        "journey_id": str(uuid.uuid4())
+    }
+
+
+def record_path(fare_source):
+    """Count which pricing path ('local', 'ai' or 'fallback') a request took"""
+    with _path_lock:
+        _path_counts[fare_source] += 1
+
+
+def path_stats():
+    with _path_lock:
+        return dict(_path_counts)
@@ -0,0 +1,89 @@
+# Append-only log of calculated fares, written by a background thread
+import atexit
+import json
+import time
+
+import config
+from batch_writer import BatchedWriter, append_jsonl
+
+
+def fare_breakdown(journey_info):
+    """Total fare per transport mode, skipping walking transfers"""
+    breakdown = {}
+    for step in journey_info.get('journey_steps', []):
+        mode = step.get('mode', 'unknown')
+        if mode not in ['walk', 'transfer']:
+            breakdown[mode] = breakdown.get(mode, 0) + step.get('fare_aed', 0)
+    return breakdown
+
+
+class FareResultLog:
+    """JSONL fare results log with batched, fsynced appends
+
+    record() only enqueues - a writer thread drains the queue, appends each batch
+    with a single O_APPEND write and fsyncs once per batch, so concurrent workers
+    sharing the file never interleave partial lines.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=1.0, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._writer = BatchedWriter(self._write_batch, 'fare-log', batch_size, flush_interval)
+
+    def record(self, journey_info):
+        """Queue the calculated fares for a journey"""
+        self._writer.put({
+            'timestamp': time.time(),
+            'journey_id': journey_info.get('journey_id'),
+            'title': journey_info.get('title'),
+            'total': journey_info.get('total_fare', 0),
+            'breakdown': fare_breakdown(journey_info),
+            'calculated_by': journey_info.get('fare_source', 'ai'),
+            'nol_tier': journey_info.get('nol_tier')
+        })
+
+    def _write_batch(self, batch):
+        append_jsonl(self.path, batch, self.fsync)
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        self._writer.flush()
+
+    def query(self, journey_id=None, since=None, until=None, calculated_by=None, limit=None):
+        """Read back logged fare results, oldest first"""
+        results = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue  # Skip a torn trailing line
+                    if journey_id is not None and item.get('journey_id') != journey_id:
+                        continue
+                    if since is not None and item['timestamp'] < since:
+                        continue
+                    if until is not None and item['timestamp'] >= until:
+                        continue
+                    if calculated_by is not None and item.get('calculated_by') != calculated_by:
+                        continue
+                    results.append(item)
+        except FileNotFoundError:
+            return []
+        return results[-limit:] if limit else results
+
+    def stats(self):
+        return {
+            'queued': self._writer.qsize(),
+            'records_written': self._writer.items_written,
+            'batches_written': self._writer.batches_written,
+            'write_errors': self._writer.write_errors
+        }
+
+
+fare_log = FareResultLog(
+    config.FARE_LOG_PATH,
+    batch_size=config.FARE_LOG_BATCH_SIZE,
+    flush_interval=config.FARE_LOG_FLUSH_INTERVAL
+)
+atexit.register(fare_log.flush)
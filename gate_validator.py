@@ -0,0 +1,261 @@
+# Scan transitions shared by /scan_qr and the batched gate validation endpoint
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from qr_payload import parse_scan_data
+
+
+def skip_transfers(store, events, journey_id, state, ledger=None):
+    """Move a journey past walking transfers at its current step, updating state
+
+    Returns the number of steps skipped, or None if another request moved the
+    journey first.
+    """
+    steps = state['journey_info']['journey_steps']
+    current_step = state['current_step']
+    skipped = 0
+    while current_step + skipped < len(steps) and steps[current_step + skipped]['mode'] in ['transfer', 'walk']:
+        skipped += 1
+    if not skipped:
+        return 0
+    if store.advance_step(journey_id, current_step, skipped) is None:
+        return None
+    events.publish(journey_id)
+    if ledger is not None:
+        ledger.record_step(journey_id, current_step, current_step + skipped, 'transfer_skipped')
+    state['current_step'] = current_step + skipped
+    return skipped
+
+
+def check_scan(state, scan_info):
+    """Why a scan cannot be applied to a journey's state, as (error, status_code), or None if it can"""
+    if not state['payment_completed']:
+        return 'Journey not paid', 403
+    steps = state['journey_info']['journey_steps']
+    current_step = state['current_step']
+    if current_step >= len(steps):
+        return 'Journey already completed', 409
+    if scan_info.get('step') != current_step or scan_info.get('mode') != steps[current_step]['mode']:
+        return 'QR code is not for the current step', 409
+    return None
+
+
+def apply_scan(store, events, journey_id, state, scan_info, ledger=None, source='web'):
+    """Apply one scan to a journey: taxi exit and metro/bus exit advance the step, entry does not
+
+    The journey must be paid and the scan must be for its current step and
+    mode. Returns (result, status_code) in the /scan_qr response format. With
+    a ledger, the scan and any step it advances are recorded.
+    """
+    current_step = state['current_step']
+    problem = check_scan(state, scan_info)
+    if problem is not None:
+        result, status = {'error': problem[0]}, problem[1]
+    else:
+        result, status = _apply_scan(store, events, journey_id, scan_info)
+    if ledger is not None:
+        mode = scan_info.get('mode')
+        purpose = scan_info.get('purpose', 'exit' if mode == 'taxi' else 'entry')
+        ledger.record_scan(journey_id, current_step, mode, purpose, result, source)
+        if result.get('next_step'):
+            ledger.record_step(journey_id, current_step, current_step + 1, result['action'])
+    return result, status
+
+
+def _apply_scan(store, events, journey_id, scan_info):
+    action = scan_info.get('action', 'scan')
+    mode = scan_info.get('mode')
+    # Steps only advance from the step printed on the QR code, so a replayed code
+    # for a step the journey has already left is refused, not applied to the next one
+    scanned_step = scan_info.get('step')
+
+    if action == 'scan':
+        if mode == 'taxi':
+            # Taxi - single scan to exit
+            if store.advance_step(journey_id, scanned_step) is None:
+                return {'error': 'QR code already scanned'}, 409
+            events.publish(journey_id)
+            return {
+                'success': True,
+                'action': 'exit_taxi',
+                'show_animation': True,
+                'animation_duration': 8000,  # 8 seconds
+                'message': 'Taxi journey completed!',
+                'next_step': True
+            }, 200
+        elif mode in ['metro', 'bus']:
+            purpose = scan_info.get('purpose', 'entry')
+            if purpose == 'entry':
+                # Metro/Bus entry scan
+                return {
+                    'success': True,
+                    'action': f'enter_{mode}',
+                    'show_animation': True,
+                    'animation_duration': 8000,  # 8 seconds
+                    'message': f'Entered {mode}!',
+                    'need_exit_qr': True
+                }, 200
+            elif purpose == 'exit':
+                # Metro/Bus exit scan
+                if store.advance_step(journey_id, scanned_step) is None:
+                    return {'error': 'QR code already scanned'}, 409
+                events.publish(journey_id)
+                return {
+                    'success': True,
+                    'action': f'exit_{mode}',
+                    'show_animation': True,
+                    'animation_duration': 8000,  # 8 seconds
+                    'message': f'Exited {mode}!',
+                    'next_step': True
+                }, 200
+
+    return {'error': 'Invalid QR code format'}, 400
+
+
+class ScanResultCache:
+    """Bounded, expiring map of idempotency key -> first result, so replayed scans are answered, not re-applied"""
+
+    def __init__(self, max_entries=100000, ttl_seconds=86400, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def scan_idempotency_key(scan):
+    """The validator's idempotency key, or a digest of the scanned payload for replays without one"""
+    if scan.get('idempotency_key'):
+        return str(scan['idempotency_key'])
+    qr_data = scan.get('qr_data')
+    if not isinstance(qr_data, str):
+        qr_data = json.dumps(qr_data, sort_keys=True)
+    return hashlib.sha1(qr_data.encode('utf-8')).hexdigest()
+
+
+class GateValidator:
+    """Validates bursts of gate scans against server-side journey state
+
+    Gates have no rider session, so every scan is checked against the journey
+    store: the journey must exist and be paid, and the scan must be for the
+    journey's current step and its mode. Each journey is loaded once per batch
+    and its scans are applied in order. With require_signed, unsigned legacy
+    JSON payloads are refused before any store lookup.
+    """
+
+    def __init__(self, store, events, results=None, require_signed=True, ledger=None):
+        self.store = store
+        self.events = events
+        self.results = results or ScanResultCache()
+        self.require_signed = require_signed
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.replayed = 0
+
+    def validate_batch(self, scans):
+        states = {}  # journey_id -> state loaded for this batch
+        results = []
+        for index, scan in enumerate(scans):
+            result = self._validate(scan, states)
+            result['index'] = index
+            results.append(result)
+        return results
+
+    def _validate(self, scan, states):
+        if not isinstance(scan, dict):
+            return self._reject(None, None, 'Invalid scan')
+        key = scan_idempotency_key(scan)
+        previous = self.results.get(key)
+        if previous is not None:
+            with self._lock:
+                self.replayed += 1
+            return dict(previous, replayed=True)
+
+        try:
+            scan_info, signed = parse_scan_data(scan['qr_data'])
+            journey_id = scan_info['journey_id']
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return self._reject(key, None, 'Invalid QR code format', final=True)
+        if self.require_signed and not signed:
+            return self._reject(key, journey_id, 'Unsigned QR code', final=True)
+
+        if journey_id not in states:
+            states[journey_id] = self.store.get(journey_id)
+        state = states[journey_id]
+        if state is None:
+            return self._reject(key, journey_id, 'Unknown journey', final=True)
+        # Riders who only use gates never load /generate_qr, which skips transfers for the web flow
+        if state['payment_completed'] and skip_transfers(self.store, self.events, journey_id, state,
+                                                         self.ledger) is None:
+            state = states[journey_id] = self.store.get(journey_id)
+            if state is None:
+                # Deleted or expired while the transfers were being skipped
+                return self._reject(key, journey_id, 'Unknown journey', final=True)
+
+        current_step = state['current_step']
+        outcome, status = apply_scan(self.store, self.events, journey_id, state, scan_info,
+                                     self.ledger, source='gate')
+        if status == 409:
+            # Another worker or gate moved the journey on - reload before the next scan
+            states[journey_id] = self.store.get(journey_id)
+        elif outcome.get('next_step'):
+            state['current_step'] = current_step + 1
+
+        if status != 200:
+            return self._reject(key, journey_id, outcome['error'], recorded=True)
+        result = {
+            'idempotency_key': key,
+            'journey_id': journey_id,
+            'accepted': True,
+            'action': outcome['action'],
+            'next_step': outcome.get('next_step', False),
+            'replayed': False
+        }
+        self.results.put(key, result)
+        with self._lock:
+            self.accepted += 1
+        return result
+
+    def _reject(self, key, journey_id, error, recorded=False, final=False):
+        # Only rejections that can never turn into acceptances are remembered - a QR
+        # refused for an unpaid journey or another step is valid once the journey gets there
+        result = {
+            'idempotency_key': key,
+            'journey_id': journey_id,
+            'accepted': False,
+            'error': error,
+            'replayed': False
+        }
+        if key is not None and final:
+            self.results.put(key, result)
+        if self.ledger is not None and journey_id is not None and not recorded:
+            self.ledger.record_scan(journey_id, None, None, None, result, source='gate')
+        with self._lock:
+            self.rejected += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'accepted': self.accepted, 'rejected': self.rejected, 'replayed': self.replayed}
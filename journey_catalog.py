@@ -0,0 +1,92 @@
+# In-process catalog of sample journeys, reloaded only when the JSON file changes
+import json
+import os
+import threading
+import time
+
+import config
+from journey_parser import parse_journey_text
+from sample_journeys import SAMPLE_JOURNEYS
+
+DEFAULT_JOURNEY = 'default'
+
+# Used when sample_journey.json cannot be loaded
+FALLBACK_JOURNEY = {
+    "title": "Sample Journey",
+    "description": "Default multi-modal journey",
+    "journey_text": "1. taxi: 1 stop, 8.5 min, 4.2 km\n   Stops: Dubai Marina Walk -> Mall of the Emirates Metro Station\n\n2. MRed1 (metro): 7 stops, 12.1 min, 15.8 km\n   Stops: Mall of the Emirates Metro Station 1 -> Union Metro Station 2\n\n3. 64 (bus): 8 stops, 18.3 min, 12.4 km\n   Stops: Union Bus Terminal -> Gold Souq Bus Station"
+}
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class JourneyCatalog:
+    """Named sample journeys with their parsed steps
+
+    The JSON file is stat'ed at most once per check_interval seconds and only
+    reparsed when its inode, mtime or size changes. The journeys from
+    sample_journeys.py are parsed once at startup.
+    """
+
+    def __init__(self, path, check_interval=2.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self.reloads = 0
+        self._entries = {}  # name -> (journey, parsed steps)
+        for name, (title, description, text) in SAMPLE_JOURNEYS.items():
+            self._add(name, {"title": title, "description": description, "journey_text": text.strip()})
+        self._refresh()
+
+    def _add(self, name, journey):
+        self._entries[name] = (journey, parse_journey_text(journey.get('journey_text', '')))
+
+    def _refresh(self):
+        now = self._clock()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                signature = _file_signature(self.path)
+            except OSError as e:
+                signature = None
+                if self._signature is not None or DEFAULT_JOURNEY not in self._entries:
+                    print(f"Error loading sample journey: {e}")
+            if signature == self._signature and DEFAULT_JOURNEY in self._entries:
+                return
+
+            journey = FALLBACK_JOURNEY
+            if signature is not None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        journey = json.load(f)['sample_journey']
+                except Exception as e:
+                    print(f"Error loading sample journey: {e}")
+            self._add(DEFAULT_JOURNEY, journey)
+            self._signature = signature
+            self.reloads += 1
+
+    def lookup(self, name=None):
+        """Return (journey, parsed steps) for the named journey, or (None, None) if unknown"""
+        self._refresh()
+        return self._entries.get(name or DEFAULT_JOURNEY, (None, None))
+
+    def get(self, name=None):
+        """Return the named journey (the JSON sample by default), or None if unknown"""
+        return self.lookup(name)[0]
+
+    def names(self):
+        self._refresh()
+        return list(self._entries)
+
+
+journey_catalog = JourneyCatalog(config.SAMPLE_JOURNEY_PATH, config.CATALOG_CHECK_INTERVAL)
@@ -0,0 +1,58 @@
+# Wake-ups for clients waiting on journey state changes (SSE and long-poll)
+import threading
+
+
+class JourneyEvents:
+    """In-process change notification per journey
+
+    publish() wakes every waiter in this worker immediately. Waiters should use a
+    short timeout and re-check the journey store, so they still see changes made
+    by other workers.
+    """
+
+    def __init__(self, max_tracked=10000):
+        self.max_tracked = max_tracked
+        self._cond = threading.Condition()
+        self._versions = {}  # journey_id -> number of changes published
+        self.waiters = 0
+
+    def publish(self, journey_id):
+        with self._cond:
+            version = self._versions.pop(journey_id, 0) + 1
+            if len(self._versions) >= self.max_tracked:
+                # Drop the least recently changed half; their waiters fall back to polling
+                for stale in list(self._versions)[:self.max_tracked // 2]:
+                    del self._versions[stale]
+            self._versions[journey_id] = version
+            self._cond.notify_all()
+
+    def version(self, journey_id):
+        with self._cond:
+            return self._versions.get(journey_id, 0)
+
+    def wait(self, journey_id, since_version, timeout):
+        """Block until a change is published after since_version or timeout passes"""
+        with self._cond:
+            self.waiters += 1
+            try:
+                return self._cond.wait_for(lambda: self._versions.get(journey_id, 0) != since_version, timeout)
+            finally:
+                self.waiters -= 1
+
+
+def journey_status_payload(state):
+    """Slim journey status - progress only, no journey body"""
+    total_steps = len(state['journey_info']['journey_steps'])
+    return {
+        'current_step': state['current_step'],
+        'total_steps': total_steps,
+        'completed': state['current_step'] >= total_steps,
+        'payment_completed': state['payment_completed']
+    }
+
+
+def status_etag(journey_id, status):
+    return f"{journey_id}-{status['current_step']}-{status['total_steps']}-{int(status['payment_completed'])}"
+
+
+journey_events = JourneyEvents()
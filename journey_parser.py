@@ -0,0 +1,142 @@
+# Single-pass journey text parser
+import re
+import sys
+from array import array
+
+# One pattern per line kind, tried in a single match per line
+_LINE = re.compile(r'''
+    ^\s*(?:
+        (?P<rule>===|---)                                   # headers and separators
+      | (?P<number>\d+)\.\s+(?P<label>[^:]*?)\s*:\s*(?P<details>.*?)\s*$   # "3. MRed1 (metro): 7 stops, 12.1 min, 15.8 km"
+      | Stops:\s*(?P<stops>.*?)\s*$                         # "Stops: a -> b -> c"
+    )
+''', re.VERBOSE)
+
+# "MRed1 (metro)", "64 (bus)", "taxi (taxi)", "transfer (walk)" or a bare "taxi"
+_LABEL = re.compile(r'(?:(?P<line>\w+)\s*)?\((?P<mode>metro|bus|taxi|transfer|walk)\)|\b(?P<bare>taxi|transfer|walk)\b',
+                    re.IGNORECASE)
+_DISTANCE = re.compile(r'(\d+\.?\d*)\s*km')
+_DURATION_OR_DISTANCE = re.compile(r'km|min')
+_ARROW = re.compile(r'\s*->\s*')
+
+_MODE_ALIASES = {'walk': 'transfer'}
+_FIELDS = frozenset(('mode', 'line_number', 'distance', 'stops', 'completed'))
+_MAX_NODE_ID_DIGITS = 18  # fits a signed 64-bit array slot
+
+
+class JourneyStep:
+    """Compact parsed journey step
+
+    Stops are held in an int64 array: OSM node IDs are stored as themselves and
+    named stops as negative indexes into a tuple of interned names. Supports the
+    dict-style access (step['mode'], step.get('line_number')) the fare code uses.
+    """
+
+    __slots__ = ('mode', 'line_number', 'distance', 'completed', '_stop_ids', '_stop_names')
+
+    def __init__(self, mode, line_number=None, distance=0.0):
+        self.mode = mode
+        self.line_number = line_number
+        self.distance = distance
+        self.completed = False
+        self._stop_ids = array('q')
+        self._stop_names = ()
+
+    def set_stops(self, stops_text):
+        stop_ids = array('q')
+        names = []
+        for stop in _ARROW.split(stops_text):
+            if stop.isascii() and stop.isdigit() and len(stop) <= _MAX_NODE_ID_DIGITS and (stop[0] != '0' or stop == '0'):
+                stop_ids.append(int(stop))
+            else:
+                names.append(sys.intern(stop))
+                stop_ids.append(-len(names))
+        self._stop_ids = stop_ids
+        self._stop_names = tuple(names)
+
+    @property
+    def stop_ids(self):
+        """Stops with numeric node IDs as ints and named stops as strings"""
+        names = self._stop_names
+        return [names[-i - 1] if i < 0 else i for i in self._stop_ids]
+
+    @property
+    def stops(self):
+        names = self._stop_names
+        return [names[-i - 1] if i < 0 else str(i) for i in self._stop_ids]
+
+    def __len__(self):
+        return len(self._stop_ids)
+
+    def __getitem__(self, key):
+        if key not in _FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'line_number': self.line_number,
+            'distance': self.distance,
+            'stops': self.stops,
+            'completed': self.completed
+        }
+
+    def __repr__(self):
+        return f"JourneyStep({self.mode!r}, {self.line_number!r}, {self.distance!r}, {len(self)} stops)"
+
+
+def _parse_step_header(label, details):
+    """Build a step from a header line, or None if it is not a transport step"""
+    if not _DURATION_OR_DISTANCE.search(details):
+        return None
+
+    match = _LABEL.search(label)
+    if not match:
+        return None
+
+    if match.group('mode'):
+        mode = match.group('mode').lower()
+        line_number = match.group('line') if mode in ('metro', 'bus') else None
+    else:
+        mode = match.group('bare').lower()
+        line_number = None
+    mode = _MODE_ALIASES.get(mode, mode)
+
+    distance_match = _DISTANCE.search(details)
+    distance = float(distance_match.group(1)) if distance_match else 0
+    return JourneyStep(mode, line_number, distance)
+
+
+def iter_journey_steps(lines):
+    """Parse journey lines incrementally, yielding each step once its stops are known"""
+    pending = None
+    for line in lines:
+        match = _LINE.match(line)
+        if match is not None and match.group('stops') is not None and pending is not None:
+            pending.set_stops(match.group('stops'))
+            yield pending
+            pending = None
+            continue
+
+        if pending is not None:
+            # The stops line must directly follow its step
+            yield pending
+            pending = None
+
+        if match is not None and match.group('number') is not None:
+            pending = _parse_step_header(match.group('label'), match.group('details'))
+
+    if pending is not None:
+        yield pending
+
+
+def parse_journey_text(journey_text):
+    """Parse the journey text and extract transport modes, distances, and stops"""
+    return list(iter_journey_steps(journey_text.splitlines()))
@@ -0,0 +1,244 @@
+# Server-side journey state, keyed by journey_id
+import copy
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import config
+
+
+class JourneyStore(ABC):
+    """Interface for journey state backends
+
+    A journey's state is a dict with journey_info, current_step, payment_completed,
+    payment_method and payment_amount. Only the journey_id lives in the cookie.
+    """
+
+    @abstractmethod
+    def create(self, journey_id, journey_info):
+        """Store a new, unpaid journey at step 0"""
+
+    @abstractmethod
+    def get(self, journey_id):
+        """Return the journey state, or None if it is unknown or expired"""
+
+    @abstractmethod
+    def update(self, journey_id, **fields):
+        """Set payment fields on a journey; returns False if the journey is unknown"""
+
+    @abstractmethod
+    def mark_paid(self, journey_id, payment_method, payment_amount):
+        """Record the payment if the journey is not paid yet
+
+        Returns False if the journey is unknown or already paid, so of two
+        concurrent payments only one goes through.
+        """
+
+    @abstractmethod
+    def replace_journey_info(self, journey_id, journey_info):
+        """Swap in revised journey info (e.g. AI fares) while the journey is still unpaid
+
+        Returns False if the journey is unknown or has already been paid for.
+        """
+
+    @abstractmethod
+    def advance_step(self, journey_id, expected_step, steps=1):
+        """Atomically move from expected_step forward by steps
+
+        Returns the new step, or None if the journey is unknown or is no longer
+        on expected_step. Scans pass the step from the QR code, so a replayed
+        code fails here just like a concurrent one.
+        """
+
+    @abstractmethod
+    def delete(self, journey_id):
+        """Forget a journey"""
+
+
+def _new_state(journey_info):
+    return {
+        'journey_info': journey_info,
+        'current_step': 0,
+        'payment_completed': False,
+        'payment_method': None,
+        'payment_amount': None
+    }
+
+
+_PAYMENT_FIELDS = ('payment_completed', 'payment_method', 'payment_amount')
+
+
+class MemoryJourneyStore(JourneyStore):
+    """In-process store - state is per worker, so use it with a single worker"""
+
+    def __init__(self, ttl_seconds=86400, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._journeys = {}  # journey_id -> (last_touched, state)
+        self._lock = threading.Lock()
+
+    def create(self, journey_id, journey_info):
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            self._journeys[journey_id] = (now, _new_state(journey_info))
+
+    def get(self, journey_id):
+        with self._lock:
+            entry = self._live_entry(journey_id)
+            return copy.deepcopy(entry[1]) if entry else None
+
+    def update(self, journey_id, **fields):
+        with self._lock:
+            entry = self._live_entry(journey_id)
+            if entry is None:
+                return False
+            entry[1].update((k, v) for k, v in fields.items() if k in _PAYMENT_FIELDS)
+            self._journeys[journey_id] = (self._clock(), entry[1])
+            return True
+
+    def mark_paid(self, journey_id, payment_method, payment_amount):
+        with self._lock:
+            entry = self._live_entry(journey_id)
+            if entry is None or entry[1]['payment_completed']:
+                return False
+            entry[1].update(payment_completed=True, payment_method=payment_method, payment_amount=payment_amount)
+            self._journeys[journey_id] = (self._clock(), entry[1])
+            return True
+
+    def replace_journey_info(self, journey_id, journey_info):
+        with self._lock:
+            entry = self._live_entry(journey_id)
+            if entry is None or entry[1]['payment_completed']:
+                return False
+            entry[1]['journey_info'] = journey_info
+            self._journeys[journey_id] = (self._clock(), entry[1])
+            return True
+
+    def advance_step(self, journey_id, expected_step, steps=1):
+        with self._lock:
+            entry = self._live_entry(journey_id)
+            if entry is None or entry[1]['current_step'] != expected_step:
+                return None
+            entry[1]['current_step'] = expected_step + steps
+            self._journeys[journey_id] = (self._clock(), entry[1])
+            return expected_step + steps
+
+    def delete(self, journey_id):
+        with self._lock:
+            self._journeys.pop(journey_id, None)
+
+    def _live_entry(self, journey_id):
+        entry = self._journeys.get(journey_id)
+        if entry is not None and entry[0] + self.ttl_seconds <= self._clock():
+            del self._journeys[journey_id]
+            return None
+        return entry
+
+    def _expire(self, now):
+        expired = [jid for jid, (touched, _) in self._journeys.items() if touched + self.ttl_seconds <= now]
+        for journey_id in expired:
+            del self._journeys[journey_id]
+
+
+class SQLiteJourneyStore(JourneyStore):
+    """File-backed store shared by every worker on the host"""
+
+    def __init__(self, path, ttl_seconds=86400, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS journeys ('
+                'journey_id TEXT PRIMARY KEY, journey_info TEXT NOT NULL, '
+                'current_step INTEGER NOT NULL DEFAULT 0, payment_completed INTEGER NOT NULL DEFAULT 0, '
+                'payment_method TEXT, payment_amount REAL, updated_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, journey_id, journey_info):
+        now = self._clock()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM journeys WHERE updated_at <= ?', (now - self.ttl_seconds,))
+            conn.execute(
+                'INSERT OR REPLACE INTO journeys (journey_id, journey_info, updated_at) VALUES (?, ?, ?)',
+                (journey_id, json.dumps(journey_info, ensure_ascii=False), now)
+            )
+
+    def get(self, journey_id):
+        row = self._connect().execute(
+            'SELECT journey_info, current_step, payment_completed, payment_method, payment_amount '
+            'FROM journeys WHERE journey_id = ? AND updated_at > ?',
+            (journey_id, self._clock() - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'journey_info': json.loads(row[0]),
+            'current_step': row[1],
+            'payment_completed': bool(row[2]),
+            'payment_method': row[3],
+            'payment_amount': row[4]
+        }
+
+    def update(self, journey_id, **fields):
+        fields = {k: v for k, v in fields.items() if k in _PAYMENT_FIELDS}
+        assignments = ''.join(f'{name} = ?, ' for name in fields)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f'UPDATE journeys SET {assignments}updated_at = ? WHERE journey_id = ?',
+                (*fields.values(), self._clock(), journey_id)
+            )
+        return cursor.rowcount == 1
+
+    def mark_paid(self, journey_id, payment_method, payment_amount):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE journeys SET payment_completed = 1, payment_method = ?, payment_amount = ?, updated_at = ? '
+                'WHERE journey_id = ? AND payment_completed = 0 AND updated_at > ?',
+                (payment_method, payment_amount, self._clock(), journey_id, self._clock() - self.ttl_seconds)
+            )
+        return cursor.rowcount == 1
+
+    def replace_journey_info(self, journey_id, journey_info):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE journeys SET journey_info = ?, updated_at = ? '
+                'WHERE journey_id = ? AND payment_completed = 0',
+                (json.dumps(journey_info, ensure_ascii=False), self._clock(), journey_id)
+            )
+        return cursor.rowcount == 1
+
+    def advance_step(self, journey_id, expected_step, steps=1):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE journeys SET current_step = current_step + ?, updated_at = ? '
+                'WHERE journey_id = ? AND current_step = ?',
+                (steps, self._clock(), journey_id, expected_step)
+            )
+        return expected_step + steps if cursor.rowcount == 1 else None
+
+    def delete(self, journey_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM journeys WHERE journey_id = ?', (journey_id,))
+
+
+def create_journey_store():
+    """Build the journey store selected in config"""
+    if config.JOURNEY_STORE_BACKEND == 'sqlite':
+        return SQLiteJourneyStore(config.JOURNEY_STORE_PATH, config.JOURNEY_TTL_SECONDS)
+    return MemoryJourneyStore(config.JOURNEY_TTL_SECONDS)
+
+
+journey_store = create_journey_store()
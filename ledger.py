@@ -0,0 +1,145 @@
+# Append-only ledger of payments, scans and step transitions, written behind the request path
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+import config
+from batch_writer import BatchedWriter
+
+PAYMENT = 'payment'
+FARE = 'fare'
+SCAN = 'scan'
+STEP = 'step'
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS ledger ('
+    'seq INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, journey_id TEXT NOT NULL, '
+    'kind TEXT NOT NULL, step INTEGER, mode TEXT, amount REAL, detail TEXT)',
+    'CREATE INDEX IF NOT EXISTS ledger_journey ON ledger (journey_id, seq)',
+    'CREATE INDEX IF NOT EXISTS ledger_kind_ts ON ledger (kind, ts)',
+    "CREATE TRIGGER IF NOT EXISTS ledger_no_update BEFORE UPDATE ON ledger "
+    "BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END",
+    "CREATE TRIGGER IF NOT EXISTS ledger_no_delete BEFORE DELETE ON ledger "
+    "BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END",
+)
+
+
+class JourneyLedger:
+    """SQLite ledger with queued, batched inserts
+
+    The record_* methods only enqueue. A writer thread drains the queue and
+    inserts each batch in one transaction; with WAL and synchronous=NORMAL a
+    commit does not fsync, so neither requests nor the writer wait on the disk
+    per entry. Queries read the file directly and can lag the queue by up to
+    flush_interval.
+
+    Each payment is followed by one fare entry per chargeable step, which is
+    what the per-mode revenue rollups sum.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=0.5):
+        self.path = path
+        self._writer = BatchedWriter(self._write_batch, 'ledger', batch_size, flush_interval)
+        self._local = threading.local()
+
+    def record_payment(self, journey_id, journey_info, method, amount, transaction_id):
+        now = time.time()
+        entries = [(now, journey_id, PAYMENT, None, None, amount, {
+            'transaction_id': transaction_id,
+            'method': method,
+            'total_fare': journey_info.get('total_fare'),
+            'nol_tier': journey_info.get('nol_tier'),
+            'fare_source': journey_info.get('fare_source')
+        })]
+        for index, step in enumerate(journey_info.get('journey_steps', [])):
+            if step.get('mode') not in ('transfer', 'walk'):
+                entries.append((now, journey_id, FARE, index, step.get('mode'), step.get('fare_aed', 0),
+                                {'transaction_id': transaction_id, 'line_number': step.get('line_number')}))
+        self._writer.put(*entries)
+
+    def record_scan(self, journey_id, step, mode, purpose, result, source='web'):
+        detail = {'purpose': purpose, 'source': source, 'accepted': bool(result.get('success'))}
+        if 'action' in result:
+            detail['action'] = result['action']
+        if 'error' in result:
+            detail['error'] = result['error']
+        self._writer.put((time.time(), journey_id, SCAN, step, mode, None, detail))
+
+    def record_step(self, journey_id, from_step, to_step, reason):
+        self._writer.put((time.time(), journey_id, STEP, from_step, None, None,
+                          {'to_step': to_step, 'reason': reason}))
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'path', None) != self.path:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+            self._local.conn = conn
+            self._local.path = self.path
+        return conn
+
+    def _write_batch(self, entries):
+        rows = [(ts, journey_id, kind, step, mode, amount, json.dumps(detail, ensure_ascii=False))
+                for ts, journey_id, kind, step, mode, amount, detail in entries]
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT INTO ledger (ts, journey_id, kind, step, mode, amount, detail) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def flush(self):
+        """Block until every queued entry has been written"""
+        self._writer.flush()
+
+    def history(self, journey_id):
+        """Every entry for a journey, oldest first"""
+        try:
+            rows = self._connect().execute(
+                'SELECT seq, ts, kind, step, mode, amount, detail FROM ledger '
+                'WHERE journey_id = ? ORDER BY seq', (journey_id,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading ledger: {e}")
+            return []
+        return [{'seq': seq, 'timestamp': ts, 'kind': kind, 'step': step, 'mode': mode, 'amount': amount,
+                 **json.loads(detail)} for seq, ts, kind, step, mode, amount, detail in rows]
+
+    def revenue_by_mode(self, since=None, until=None, by_day=False):
+        """Fares paid per transport mode (and UTC day with by_day)"""
+        day = "date(ts, 'unixepoch')" if by_day else 'NULL'
+        try:
+            rows = self._connect().execute(
+                f'SELECT {day} AS day, mode, COUNT(*), SUM(amount) FROM ledger '
+                'WHERE kind = ? AND ts >= ? AND ts < ? GROUP BY day, mode ORDER BY day, mode',
+                (FARE, since if since is not None else 0, until if until is not None else float('inf'))
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading ledger: {e}")
+            return []
+        rollup = []
+        for row_day, mode, fares, revenue in rows:
+            item = {'mode': mode, 'fares': fares, 'revenue': revenue}
+            if by_day:
+                item['day'] = row_day
+            rollup.append(item)
+        return rollup
+
+    def stats(self):
+        return {
+            'queued': self._writer.qsize(),
+            'entries_written': self._writer.items_written,
+            'batches_written': self._writer.batches_written,
+            'write_errors': self._writer.write_errors
+        }
+
+
+ledger = JourneyLedger(
+    config.LEDGER_PATH,
+    batch_size=config.LEDGER_BATCH_SIZE,
+    flush_interval=config.LEDGER_FLUSH_INTERVAL
+)
+atexit.register(ledger.flush)
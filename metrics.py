@@ -0,0 +1,189 @@
+# In-process metrics in the Prometheus text exposition format
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from flask.sessions import SecureCookieSessionInterface
+
+# Seconds, from cache hits up to slow AI calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COOKIE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096)  # Browsers cap a cookie at about 4 KB
+TOKEN_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels
+
+    observe() is a bisect and three additions under a lock, so it is cheap
+    enough for every request.
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def snapshot(self, *labels):
+        """(count, sum) observed for a label combination"""
+        with self._lock:
+            series = self._series.get(labels)
+            return (sum(series[:-1]), series[-1]) if series else (0, 0.0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {values[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    """Metrics plus stats() sources rendered together as one /metrics page
+
+    Metrics are per process: with several workers each one reports its own
+    values, so scrape them per worker or sum them downstream.
+    """
+
+    def __init__(self, prefix='rta'):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []  # (name, stats function)
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(f'{self.prefix}_{name}', help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(f'{self.prefix}_{name}', help, labelnames, buckets))
+
+    def collect(self, name, stats):
+        """Expose every numeric value of stats() as a gauge named <prefix>_<name>_<key>"""
+        self._collectors.append((name, stats))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Metrics collector {name} error: {e}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f'{self.prefix}_{name}_{key}'
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_seconds = registry.histogram('request_seconds', 'Request handling time by endpoint',
+                                     ('endpoint', 'method', 'status'))
+stage_seconds = registry.histogram('stage_seconds', 'Time spent in hot-path stages', ('stage',))
+cookie_bytes = registry.histogram('session_cookie_bytes', 'Size of session cookies sent',
+                                  buckets=COOKIE_BUCKETS)
+ai_fallback_total = registry.counter('ai_fallback_total', 'AI extractions that fell back to manual parsing',
+                                     ('reason',))
+prompt_tokens_saved = registry.histogram('ai_prompt_tokens_saved', 'Estimated prompt tokens removed by journey compaction, per journey',
+                                         buckets=TOKEN_BUCKETS)
+ai_circuit_transitions_total = registry.counter('ai_circuit_transitions_total',
+                                                'AI provider circuit breaker state changes', ('from_state', 'to_state'))
+
+
+def timed(stage):
+    """Decorator recording a function's duration under stage_seconds{stage=...}"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_seconds.time(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions with their decode/encode time and cookie size recorded"""
+
+    def open_session(self, app, request):
+        with stage_seconds.time('session_open'):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with stage_seconds.time('session_save'):
+            super().save_session(app, session, response)
+        name = self.get_cookie_name(app)
+        for header in response.headers.getlist('Set-Cookie'):
+            if header.startswith(name + '='):
+                cookie_bytes.observe(len(header.split(';', 1)[0]) - len(name) - 1)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Ark chat completions API, for load-testing the AI path
+
+Answers /chat/completions with journey JSON priced by the local fare engine from
+the journey text in the prompt (single or batched), after a latency drawn from a
+configurable distribution. A share of requests can fail, hang or return
+malformed JSON. Point the app at it with:
+
+    python mock_ark_server.py --port 8001 --latency lognormal:0.8,0.6 --error-rate 0.02
+    BYTEPLUS_BASE_URL=http://127.0.0.1:8001/api/v3 BYTEPLUS_API_KEY=mock python app.py
+
+GET /stats reports request counts and peak concurrency.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fare_engine import price_journey
+from journey_parser import parse_journey_text
+
+_SINGLE_JOURNEY = re.compile(r'Journey text:(.*?)\n\s*Please extract', re.DOTALL)
+_BATCH_JOURNEY = re.compile(r'^Journey \d+:\n(.*?)(?=^Journey \d+:\n|^For each of the|\Z)', re.DOTALL | re.MULTILINE)
+
+
+def _extract(journey_text):
+    journey_info = price_journey(parse_journey_text(journey_text))
+    del journey_info['journey_id']  # The model does not assign IDs
+    return journey_info
+
+
+def answer_for_prompt(content):
+    """The journey JSON an ideal model would return for an extraction prompt"""
+    batch = _BATCH_JOURNEY.findall(content)
+    if batch:
+        return {'journeys': [_extract(text) for text in batch]}
+    match = _SINGLE_JOURNEY.search(content)
+    return _extract(match.group(1) if match else content)
+
+
+def latency_sampler(spec, rng=random):
+    """Parse a latency spec into a function returning seconds
+
+    fixed:S, uniform:LOW,HIGH, normal:MEAN,STDDEV, lognormal:MEDIAN,SIGMA or
+    exponential:MEAN.
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: rng.uniform(*values)
+    if kind == 'normal' and len(values) == 2:
+        return lambda: max(0.0, rng.gauss(*values))
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'exponential' and len(values) == 1:
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"Invalid latency spec {spec!r}")
+
+
+class MockArkServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the failure settings and request counters"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency='fixed:0', error_rate=0.0, error_status=500,
+                 malformed_rate=0.0, hang_rate=0.0, hang_seconds=60.0, seed=None):
+        super().__init__(address, MockArkHandler)
+        self.rng = random.Random(seed)
+        self.sample_latency = latency_sampler(latency, self.rng)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'malformed': 0, 'hung': 0, 'ok': 0}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/v3'
+
+    def start(self):
+        """Serve on a daemon thread; returns the thread"""
+        thread = threading.Thread(target=self.serve_forever, name='mock-ark', daemon=True)
+        thread.start()
+        return thread
+
+    def plan(self):
+        """Decide the outcome and latency of one request"""
+        with self._lock:
+            roll = self.rng.random()
+            latency = self.sample_latency()
+        if roll < self.hang_rate:
+            return 'hung', self.hang_seconds
+        roll -= self.hang_rate
+        if roll < self.error_rate:
+            return 'errors', latency
+        roll -= self.error_rate
+        if roll < self.malformed_rate:
+            return 'malformed', latency
+        return 'ok', latency
+
+    def enter(self, outcome):
+        with self._lock:
+            self.counts['requests'] += 1
+            self.counts[outcome] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, in_flight=self.in_flight, max_in_flight=self.max_in_flight)
+
+
+class MockArkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown out a load test
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+        if not self.path.endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        outcome, latency = self.server.plan()
+        self.server.enter(outcome)
+        try:
+            time.sleep(latency)
+            if outcome == 'errors':
+                self._send_json(self.server.error_status,
+                                {'error': {'code': 'MockError', 'message': 'Injected failure'}})
+                return
+            content = json.dumps(answer_for_prompt(request['messages'][-1]['content']))
+            if outcome == 'malformed':
+                content = content[:len(content) // 2]
+            if request.get('stream'):
+                self._stream(request, content)
+            else:
+                self._send_json(200, self._completion(request, content))
+        finally:
+            self.server.leave()
+
+    def _completion(self, request, content):
+        prompt_tokens = sum(len(m.get('content', '')) for m in request.get('messages', [])) // 4
+        return {
+            'id': f'mock-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4,
+                      'total_tokens': prompt_tokens + len(content) // 4}
+        }
+
+    def _stream(self, request, content, chunk_chars=40):
+        """Send the answer as server-sent chat.completion.chunk events"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        base = {'id': f'mock-{uuid.uuid4().hex}', 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': request.get('model', 'mock')}
+        for start in range(0, len(content), chunk_chars):
+            delta = {'role': 'assistant', 'content': content[start:start + chunk_chars]}
+            chunk = dict(base, choices=[{'index': 0, 'delta': delta, 'finish_reason': None}])
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+        done = dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        self.wfile.write(f'data: {json.dumps(done)}\n\ndata: [DONE]\n\n'.encode('utf-8'))
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a local Ark chat completions stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', default='fixed:0',
+                        help='fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exponential:MEAN')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected errors, e.g. 429')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of answers with truncated JSON')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='share of requests that stall')
+    parser.add_argument('--hang-seconds', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, help='seed for reproducible latencies and failures')
+    args = parser.parse_args(argv)
+
+    latency_sampler(args.latency)  # Fail fast on a bad spec
+    server = MockArkServer((args.host, args.port), args.latency, args.error_rate, args.error_status,
+                           args.malformed_rate, args.hang_rate, args.hang_seconds, args.seed)
+    print(f"Mock Ark listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats()))
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
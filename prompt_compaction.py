@@ -0,0 +1,67 @@
+# Prompt compaction - journeys are sent to the AI with only the endpoints of each leg
+import re
+from collections import namedtuple
+
+_RULE = re.compile(r'^\s*(?:===|---)')
+_STOPS = re.compile(r'^\s*Stops:\s*(?P<stops>.*?)\s*$')
+_ARROW = re.compile(r'\s*->\s*')
+# Rough BPE-style pieces: words, runs of up to three digits and single symbols
+_TOKEN = re.compile(r'[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]')
+
+CompactJourney = namedtuple('CompactJourney', ('text', 'tokens_before', 'tokens_after', 'stops_dropped'))
+
+
+def estimate_tokens(text):
+    """Approximate LLM token count - long numeric IDs cost one token per three digits"""
+    return len(_TOKEN.findall(text))
+
+
+def compact_journey_text(journey_text):
+    """Rewrite journey text into the minimal form the AI needs to price it
+
+    Every Stops line keeps only its first and last stop - routing output lists
+    each intermediate OSM node, which the fare does not depend on. Separator
+    and title lines, blank lines and indentation are dropped. Step headers and
+    any other lines are kept as they are, so nothing the local parser could not
+    read is lost.
+    """
+    lines = []
+    dropped = 0
+    for line in journey_text.splitlines():
+        if not line.strip() or _RULE.match(line):
+            continue
+        match = _STOPS.match(line)
+        if match is not None:
+            stops = _ARROW.split(match.group('stops'))
+            if len(stops) > 2:
+                dropped += len(stops) - 2
+                stops = [stops[0], stops[-1]]
+            line = 'Stops: ' + ' -> '.join(stops)
+        lines.append(line.strip())
+    text = '\n'.join(lines)
+    return CompactJourney(text, estimate_tokens(journey_text), estimate_tokens(text), dropped)
+
+
+def restore_stops(journey_info, steps):
+    """Put the full locally parsed stop lists back into the AI's steps
+
+    AI steps are matched to parsed steps by their first and last stop, so a
+    step the AI merged, split or reordered simply keeps the stops it returned.
+    Returns the number of steps restored.
+    """
+    full_stops = {}
+    for step in steps:
+        stops = step['stops']
+        if len(stops) > 2:
+            full_stops.setdefault((stops[0], stops[-1]), stops)
+
+    restored = 0
+    for step in journey_info.get('journey_steps') or ():
+        stops = step.get('stops')
+        if not isinstance(stops, list) or len(stops) < 2:
+            continue
+        match = full_stops.get((str(stops[0]).strip(), str(stops[-1]).strip()))
+        if match is not None and len(match) > len(stops):
+            step['stops'] = list(match)
+            restored += 1
+    return restored
@@ -0,0 +1,93 @@
+# Signed compact QR scan payloads that validators can verify offline
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import uuid
+
+import config
+
+FORMAT_VERSION = 1
+MODES = ('taxi', 'metro', 'bus', 'tram', 'ferry')
+PURPOSES = ('entry', 'exit')
+SIGNATURE_BYTES = 10  # Truncated HMAC-SHA256, 80 bits
+
+# version, journey UUID, step, mode << 1 | purpose, line number length
+_HEADER = struct.Struct('>B16sHBB')
+
+
+def signing_key(secret=None):
+    """Derive the QR signing key so it is never the raw Flask SECRET_KEY"""
+    secret = config.SECRET_KEY if secret is None else secret
+    return hmac.new(secret.encode('utf-8'), b'rta-qr-payload', hashlib.sha256).digest()
+
+
+_default_key = None
+
+
+def _key(key):
+    global _default_key
+    if key is not None:
+        return key
+    if _default_key is None:
+        _default_key = signing_key()
+    return _default_key
+
+
+def encode_scan_payload(journey_id, step, mode, line_number, purpose, key=None):
+    """Pack and sign a scan payload as base32 text, which QR codes store in alphanumeric mode
+
+    Raises ValueError for data the binary format cannot represent (non-UUID
+    journey IDs, unknown modes), so callers can fall back to JSON.
+    """
+    if mode not in MODES or purpose not in PURPOSES:
+        raise ValueError(f"Cannot pack mode {mode!r} / purpose {purpose!r}")
+    line = (line_number or '').encode('utf-8')
+    if len(line) > 255 or not 0 <= step <= 0xFFFF:
+        raise ValueError("Step or line number out of range")
+    body = _HEADER.pack(FORMAT_VERSION, uuid.UUID(journey_id).bytes, step,
+                        MODES.index(mode) << 1 | PURPOSES.index(purpose), len(line)) + line
+    signature = hmac.new(_key(key), body, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.b32encode(body + signature).decode('ascii').rstrip('=')
+
+
+def decode_scan_payload(text, key=None):
+    """Verify and unpack a compact payload into the same dict the JSON format carries
+
+    Raises ValueError if the payload is malformed or its signature does not match.
+    """
+    try:
+        raw = base64.b32decode(text + '=' * (-len(text) % 8))
+    except (TypeError, ValueError):
+        raise ValueError("Not a compact QR payload")
+    if len(raw) < _HEADER.size + SIGNATURE_BYTES:
+        raise ValueError("Truncated QR payload")
+    body, signature = raw[:-SIGNATURE_BYTES], raw[-SIGNATURE_BYTES:]
+    expected = hmac.new(_key(key), body, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    if not hmac.compare_digest(signature, expected):
+        raise ValueError("Invalid QR signature")
+
+    version, journey_bytes, step, kind, line_length = _HEADER.unpack_from(body)
+    if version != FORMAT_VERSION or len(body) != _HEADER.size + line_length or kind >> 1 >= len(MODES):
+        raise ValueError("Unsupported QR payload")
+    line = body[_HEADER.size:].decode('utf-8')
+    return {
+        'journey_id': str(uuid.UUID(bytes=journey_bytes)),
+        'step': step,
+        'mode': MODES[kind >> 1],
+        'action': 'scan',
+        'line_number': line or None,
+        'purpose': PURPOSES[kind & 1]
+    }
+
+
+def parse_scan_data(qr_data, key=None):
+    """Read a scanned QR string in either format
+
+    Returns (scan_info, signed). Legacy JSON payloads are unsigned, so callers
+    must trust them only alongside the rider's session.
+    """
+    if qr_data.lstrip().startswith('{'):
+        return json.loads(qr_data), False
+    return decode_scan_payload(qr_data.strip(), key), True
@@ -0,0 +1,267 @@
+# QR code rendering with a bounded cache of rendered images
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from qrcode.exceptions import DataOverflowError
+
+import config
+from qr_payload import encode_scan_payload
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+
+def qr_purpose(mode):
+    """Metro/bus need an entry and an exit scan, a taxi only a single exit scan"""
+    return 'exit' if mode not in ['metro', 'bus'] else 'entry'
+
+
+def build_qr_data(journey_id, step, mode, line_number, purpose):
+    """QR code data for scanning purposes only (no payment)"""
+    if config.QR_PAYLOAD_FORMAT == 'compact':
+        try:
+            return encode_scan_payload(journey_id, step, mode, line_number, purpose)
+        except ValueError:
+            pass  # Not representable in the binary format - use JSON
+    return json.dumps({
+        'journey_id': journey_id,
+        'step': step,
+        'mode': mode,
+        'action': 'scan',
+        'line_number': line_number,
+        'purpose': purpose
+    })
+
+
+def render_qr(data, fmt='png'):
+    """Render QR code data to PNG or SVG bytes
+
+    With QR_FAST_PATH the symbol version and mask pattern are fixed, which skips
+    the version fit search and the eight-way mask evaluation. Data that does not
+    fit the fixed version falls back to the regular search.
+    """
+    image_factory = qrcode.image.svg.SvgPathImage if fmt == 'svg' else None
+    qr = None
+    if config.QR_FAST_PATH:
+        qr = qrcode.QRCode(
+            version=config.QR_VERSION,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=4,
+            image_factory=image_factory,
+            mask_pattern=config.QR_MASK_PATTERN,
+        )
+        qr.add_data(data)
+        try:
+            qr.make(fit=False)
+        except DataOverflowError:
+            qr = None
+
+    if qr is None:
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=4,
+            image_factory=image_factory,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white") if fmt == 'png' else qr.make_image()
+    buffered = BytesIO()
+    img.save(buffered)
+    return buffered.getvalue()
+
+
+class QRCache:
+    """Bounded LRU of rendered QR images keyed by their scan payload"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (payload, fmt) -> (image bytes, etag)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, image):
+        entry = (image, hashlib.sha1(image).hexdigest())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+qr_cache = QRCache(config.QR_CACHE_MAX_ENTRIES)
+
+
+def journey_qr_payloads(journey_id, journey_steps):
+    """Every scan payload a journey will need: entry and exit for metro/bus, one scan for taxi"""
+    payloads = []
+    for step, transport in enumerate(journey_steps):
+        mode = transport['mode']
+        if mode in ['metro', 'bus']:
+            purposes = ['entry', 'exit']
+        elif mode in ['transfer', 'walk']:
+            continue
+        else:
+            purposes = ['exit']
+        for purpose in purposes:
+            payloads.append((journey_id, step, mode, transport.get('line_number'), purpose))
+    return payloads
+
+
+def _render_payload(payload, fmt):
+    return render_qr(build_qr_data(*payload), fmt)
+
+
+def _timed_render(payload, fmt):
+    start = time.perf_counter()
+    image = _render_payload(payload, fmt)
+    return image, time.perf_counter() - start
+
+
+class QRPrerenderer:
+    """Renders a journey's QR codes into the cache ahead of time on a worker pool
+
+    Rendering is pure Python, so a process pool gives real parallelism while a
+    thread pool (the default) just moves the work off the request thread.
+    """
+
+    def __init__(self, cache, workers=2, kind='thread'):
+        self.cache = cache
+        self.workers = workers
+        self.kind = kind
+        self._executor = None
+        self._inflight = {}  # cache key -> future
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+        self.max_render_seconds = 0.0
+        self.latency_seconds = 0.0  # queue wait + render
+        self.max_latency_seconds = 0.0
+
+    def _get_executor(self):
+        # Created lazily so each forked worker owns its pool
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.kind == 'process' else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    def submit_journey(self, journey_id, journey_steps, fmt='png'):
+        """Queue every QR code the journey will need; returns the number queued"""
+        queued = []
+        with self._lock:
+            executor = self._get_executor()
+            for payload in journey_qr_payloads(journey_id, journey_steps):
+                key = (payload, fmt)
+                if key in self._inflight or self.cache.contains(key):
+                    continue
+                future = executor.submit(_timed_render, payload, fmt)
+                self._inflight[key] = future
+                self.submitted += 1
+                queued.append((key, future))
+
+        # Callbacks may run immediately, so register them outside the lock
+        submitted_at = time.perf_counter()
+        for key, future in queued:
+            future.add_done_callback(lambda f, key=key: self._finished(key, f, submitted_at))
+        return len(queued)
+
+    def _finished(self, key, future, submitted_at):
+        latency = time.perf_counter() - submitted_at
+        try:
+            image, render_seconds = future.result()
+        except Exception as e:
+            print(f"QR pre-render error: {e}")
+            with self._lock:
+                self.failed += 1
+                self._inflight.pop(key, None)
+            return
+        self.cache.put(key, image)
+        with self._lock:
+            self.completed += 1
+            self.render_seconds += render_seconds
+            self.max_render_seconds = max(self.max_render_seconds, render_seconds)
+            self.latency_seconds += latency
+            self.max_latency_seconds = max(self.max_latency_seconds, latency)
+            self._inflight.pop(key, None)
+
+    def wait_for(self, key, timeout=None):
+        """Return the image from an in-flight render of key, or None if there is none"""
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)[0]
+        except Exception:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': len(self._inflight),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_render_seconds': self.render_seconds / self.completed if self.completed else 0.0,
+                'max_render_seconds': self.max_render_seconds,
+                'avg_latency_seconds': self.latency_seconds / self.completed if self.completed else 0.0,
+                'max_latency_seconds': self.max_latency_seconds
+            }
+
+
+qr_prerenderer = QRPrerenderer(qr_cache, config.QR_PRERENDER_WORKERS, config.QR_PRERENDER_EXECUTOR)
+
+
+def get_qr_image(journey_id, step, mode, line_number, purpose, fmt='png'):
+    """Return (image bytes, etag) for a scan payload, rendering it on a cache miss"""
+    payload = (journey_id, step, mode, line_number, purpose)
+    key = (payload, fmt)
+    entry = qr_cache.get(key)
+    if entry is None:
+        # Prefer a pre-render already under way over rendering the same code twice
+        image = qr_prerenderer.wait_for(key, timeout=config.QR_PRERENDER_WAIT_SECONDS)
+        entry = qr_cache.put(key, image if image is not None else _render_payload(payload, fmt))
+    return entry
@@ -46,6 +46,13 @@ SAMPLE_JOURNEY_3 = """
    Stops: DIFC Metro Station -> Business Bay Office Tower
 """
 
+# Named sample journeys served by the journey catalog: name -> (title, description, text)
+SAMPLE_JOURNEYS = {
+    "multi_modal": ("Dubai Marina to Ras Al Khor", "Multi-modal journey with taxi, metro and bus", SAMPLE_JOURNEY_1),
+    "simple": ("Dubai Airport to Downtown Dubai", "Simple taxi and metro journey", SAMPLE_JOURNEY_2),
+    "complex": ("Ibn Battuta Mall to Business Bay", "Bus, metro and taxi journey", SAMPLE_JOURNEY_3),
+}
+
 def print_sample_journeys():
     """Print all sample journeys for easy copying"""
     print("=== SAMPLE JOURNEY 1 (Multi-Modal) ===")
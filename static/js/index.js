@@ -0,0 +1,102 @@
+document.getElementById('processBtn').addEventListener('click', async function() {
+    // No need to get journey text from user input - using predefined journey
+
+    // Show loading
+    document.getElementById('loadingDiv').style.display = 'block';
+    document.getElementById('processBtn').disabled = true;
+    document.getElementById('journeySummary').style.display = 'none';
+    document.getElementById('errorDiv').style.display = 'none';
+
+    try {
+        const response = await fetch('/process_journey', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            // The previewed sample journey - the server's default when none was picked
+            body: JSON.stringify({ journey: this.dataset.journey || undefined })
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            displayJourneySummary(data);
+            if (data.job_id) {
+                // Fares are provisional until the AI job finishes
+                await waitForJob(data.job_id);
+            }
+        } else {
+            showError(data.error || 'Failed to process journey');
+        }
+    } catch (error) {
+        showError('Network error. Please try again.');
+        console.error('Error:', error);
+    } finally {
+        document.getElementById('loadingDiv').style.display = 'none';
+        document.getElementById('processBtn').disabled = false;
+    }
+});
+
+document.getElementById('proceedToPaymentBtn').addEventListener('click', function() {
+    window.location.href = '/payment';
+});
+
+function displayJourneySummary(data) {
+    const transportModes = document.getElementById('transportModes');
+    const totalFare = document.getElementById('totalFare');
+
+    transportModes.innerHTML = '';
+
+    data.journey_steps.forEach(step => {
+        const modeDiv = document.createElement('div');
+        modeDiv.className = 'transport-mode';
+
+        const iconClass = step.mode.toLowerCase();
+        const modeIcon = step.mode === 'transfer' ? '🚶' :
+                        step.mode === 'taxi' ? '🚗' :
+                        step.mode === 'metro' ? '🚇' :
+                        step.mode === 'bus' ? '🚌' : '🚶';
+
+        modeDiv.innerHTML = `
+            <div class="mode-info">
+                <div class="mode-icon ${iconClass}">${modeIcon}</div>
+                <div>
+                    <strong>${step.mode.charAt(0).toUpperCase() + step.mode.slice(1)}</strong>
+                    ${step.line_number ? ` (${step.line_number})` : ''}
+                    <br>
+                    <small>${step.distance_km} km</small>
+                </div>
+            </div>
+            <div class="fare">${step.fare_aed} AED</div>
+        `;
+
+        transportModes.appendChild(modeDiv);
+    });
+
+    totalFare.innerHTML = `💰 Total Fare: <span style="color: #667eea;">${data.total_fare} AED</span>`;
+    document.getElementById('journeySummary').style.display = 'block';
+}
+
+async function waitForJob(jobId) {
+    for (let attempt = 0; attempt < 60; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`/journey_jobs/${jobId}`);
+        if (!response.ok) {
+            return;
+        }
+        const job = await response.json();
+        if (job.status === 'done') {
+            displayJourneySummary(job.result);
+            return;
+        }
+        if (job.status !== 'pending' && job.status !== 'running') {
+            return;  // Keep the provisional fares
+        }
+    }
+}
+
+function showError(message) {
+    const errorDiv = document.getElementById('errorDiv');
+    errorDiv.textContent = message;
+    errorDiv.style.display = 'block';
+}
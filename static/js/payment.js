@@ -0,0 +1,57 @@
+let selectedPaymentMethod = null;
+
+function selectPayment(method) {
+    // Remove previous selection
+    document.querySelectorAll('.payment-method').forEach(el => {
+        el.classList.remove('selected');
+    });
+
+    // Select new method
+    event.currentTarget.classList.add('selected');
+    selectedPaymentMethod = method;
+
+    // Enable pay button
+    document.getElementById('payBtn').disabled = false;
+}
+
+async function processPayment() {
+    if (!selectedPaymentMethod) {
+        alert('Please select a payment method');
+        return;
+    }
+
+    // Show loading
+    document.getElementById('loadingDiv').style.display = 'block';
+    document.getElementById('payBtn').disabled = true;
+
+    // Simulate payment processing
+    await new Promise(resolve => setTimeout(resolve, 3000));
+
+    try {
+        const response = await fetch('/process_payment', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                payment_method: selectedPaymentMethod,
+                amount: JSON.parse(document.getElementById('payBtn').dataset.amount)
+            })
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            // Payment successful, redirect to QR codes
+            window.location.href = '/generate_qr';
+        } else {
+            alert('Payment failed: ' + result.error);
+            document.getElementById('loadingDiv').style.display = 'none';
+            document.getElementById('payBtn').disabled = false;
+        }
+    } catch (error) {
+        alert('Payment processing error. Please try again.');
+        document.getElementById('loadingDiv').style.display = 'none';
+        document.getElementById('payBtn').disabled = false;
+    }
+}
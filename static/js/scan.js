@@ -0,0 +1,157 @@
+// Scan handling shared by the entry and exit QR pages
+
+async function scanQR(qrData) {
+    try {
+        const response = await fetch('/scan_qr', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ qr_data: qrData })
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            showTickAnimation();
+
+            // Use the animation duration from server response (default 8 seconds)
+            const animationDuration = result.animation_duration || 8000;
+
+            setTimeout(() => {
+                if (result.need_exit_qr) {
+                    // Show exit QR section for metro/bus
+                    document.getElementById('exitQrSection').style.display = 'block';
+                    document.getElementById('successMessage').textContent = result.message || '✅ Entry successful!';
+                    document.getElementById('successMessage').style.display = 'block';
+                } else if (result.next_step) {
+                    // Move to next step
+                    setTimeout(() => {
+                        window.location.href = '/generate_qr';
+                    }, 2000);
+                } else {
+                    // Journey complete
+                    setTimeout(() => {
+                        showJourneyComplete();
+                    }, 2000);
+                }
+            }, animationDuration);
+        } else {
+            alert('QR Scan Error: ' + result.error);
+        }
+    } catch (error) {
+        alert('Network error during QR scan');
+        console.error('Error:', error);
+    }
+}
+
+async function scanExitQR(qrData) {
+    try {
+        const response = await fetch('/scan_qr', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ qr_data: qrData })
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            showTickAnimation();
+
+            // Use longer animation duration (8 seconds)
+            const animationDuration = result.animation_duration || 8000;
+
+            setTimeout(() => {
+                if (result.next_step) {
+                    // Move to next step
+                    window.location.href = '/generate_qr';
+                } else {
+                    // Journey complete
+                    showJourneyComplete();
+                }
+            }, animationDuration);
+        } else {
+            alert('Exit QR Scan Error: ' + result.error);
+        }
+    } catch (error) {
+        alert('Network error during exit QR scan');
+        console.error('Error:', error);
+    }
+}
+
+function showTickAnimation() {
+    document.getElementById('qrContainer').style.display = 'none';
+    document.getElementById('animationContainer').style.display = 'block';
+
+    const video = document.getElementById('tickVideo');
+    video.currentTime = 0;
+    video.play();
+
+    video.onended = function() {
+        document.getElementById('animationContainer').style.display = 'none';
+    };
+}
+
+function showJourneyComplete() {
+    document.body.innerHTML = `
+        <div class="container" style="text-align: center;">
+            <div style="font-size: 4rem; margin-bottom: 2rem;">🎉</div>
+            <h1 style="color: #28a745; margin-bottom: 1rem;">Journey Completed!</h1>
+            <p style="font-size: 1.2rem; color: #666; margin-bottom: 2rem;">
+                Thank you for using RTA Multi-Modal Transport
+            </p>
+            <button class="btn" onclick="window.location.href='/'">🏠 Start New Journey</button>
+        </div>
+    `;
+}
+
+function generateExitQR() {
+    window.location.href = '/generate_exit_qr';
+}
+
+function goHome() {
+    window.location.href = '/';
+}
+
+function goBack() {
+    window.history.back();
+}
+
+// Journey status is long-polled; with useEvents (JOURNEY_EVENTS_SSE) it is pushed over SSE where supported
+function watchJourneyStatus(useEvents) {
+    if (useEvents && window.EventSource) {
+        const events = new EventSource('/journey_events');
+        events.addEventListener('completed', () => {
+            events.close();
+            showJourneyComplete();
+        });
+        events.addEventListener('gone', () => events.close());
+        return;
+    }
+
+    let etag = null;
+    async function poll() {
+        try {
+            const response = await fetch('/journey_status?wait=25', {
+                headers: etag ? { 'If-None-Match': etag } : {}
+            });
+            if (response.status === 200) {
+                etag = response.headers.get('ETag');
+                const status = await response.json();
+                if (status.completed) {
+                    showJourneyComplete();
+                    return;
+                }
+            } else if (response.status !== 304) {
+                return;
+            }
+        } catch (error) {
+            console.log('Status check failed:', error);
+            await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+        poll();
+    }
+    poll();
+}
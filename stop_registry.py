@@ -0,0 +1,247 @@
+# Stop registry - canonical stops by name, numeric node ID and location
+import csv
+import math
+import re
+import threading
+from collections import namedtuple
+
+import config
+
+Stop = namedtuple('Stop', ('stop_id', 'name', 'lat', 'lon', 'zone_id'))
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+_EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = 111.32
+
+
+def name_tokens(name):
+    """Lowercased word tokens of a stop name, without a trailing platform or sequence number
+
+    "Burj Khalifa/ Dubai Mall Metro Station 1" -> ['burj', 'khalifa', 'dubai', 'mall', 'metro', 'station']
+    """
+    tokens = _NON_WORD.sub(' ', name.lower()).split()
+    if len(tokens) > 1 and tokens[-1].isdigit():
+        tokens.pop()
+    return tokens
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * _EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class _TrieNode:
+    __slots__ = ('children', 'stop', 'only')
+
+    def __init__(self):
+        self.children = {}
+        self.stop = None  # Index of the stop whose full name ends here
+        self.only = None  # Index of the single stop below this node, -1 once there are several
+
+
+class StopRegistry:
+    """Stops indexed for resolving the names and IDs found in journey text
+
+    Names are matched token by token in a prefix trie, so resolving a stop costs
+    O(length of the name) however many stops are loaded. The longest registered
+    name that prefixes the text wins ("Union Metro Station 2" -> "Union Metro
+    Station"); a text that is itself a prefix of exactly one name resolves to
+    it. Numeric stop IDs (GTFS IDs or OSM node IDs) are kept in an int map and
+    located stops in a grid of cell_degrees squares for nearby queries.
+    """
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self.stops = []
+        self._by_id = {}
+        self._by_node = {}
+        self._trie = _TrieNode()
+        self._grid = {}  # (lat cell, lon cell) -> [stop index]
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.stops)
+
+    def add(self, stop_id, name, lat=None, lon=None, zone_id=None, names=None):
+        """Register a stop and return its index; re-adding a stop_id returns the existing one
+
+        names are the names that resolve to the stop, (name,) by default.
+        """
+        stop_id = str(stop_id)
+        index = self._by_id.get(stop_id)
+        if index is not None:
+            return index
+        index = len(self.stops)
+        self.stops.append(Stop(stop_id, name, lat, lon, zone_id))
+        self._by_id[stop_id] = index
+        if stop_id.isascii() and stop_id.isdigit():
+            self._by_node[int(stop_id)] = index
+        for alias in (name,) if names is None else names:
+            self.add_name(alias, index)
+        if lat is not None and lon is not None:
+            self._grid.setdefault(self._cell(lat, lon), []).append(index)
+        return index
+
+    def add_name(self, name, index):
+        """Make name resolve to the stop at index; the first stop registered under a name keeps it"""
+        tokens = name_tokens(name)
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.children.setdefault(token, _TrieNode())
+            if node.only is None:
+                node.only = index
+            elif node.only != index:
+                node.only = -1
+        if node.stop is None:
+            node.stop = index
+
+    def add_node_id(self, node_id, index):
+        self._by_node[int(node_id)] = index
+
+    def index_of(self, stop_id):
+        return self._by_id.get(str(stop_id))
+
+    def get(self, stop_id):
+        index = self.index_of(stop_id)
+        return None if index is None else self.stops[index]
+
+    def match_name(self, name):
+        """Index of the stop a free-text name refers to, or None"""
+        node = self._trie
+        best = None
+        for token in name_tokens(name):
+            node = node.children.get(token)
+            if node is None:
+                return best
+            if node.stop is not None:
+                best = node.stop
+        if node is not self._trie and node.stop is None and node.only not in (None, -1):
+            best = node.only
+        return best
+
+    def resolve_name(self, name):
+        """The stop a free-text name refers to, or None"""
+        return self._found(self.match_name(name))
+
+    def resolve(self, stop):
+        """Resolve a parsed stop - an int node ID or a name - to a Stop, or None"""
+        if isinstance(stop, int):
+            return self._found(self._by_node.get(stop))
+        if stop.isascii() and stop.isdigit():
+            return self._found(self._by_node.get(int(stop)))
+        return self.resolve_name(stop)
+
+    def resolve_step(self, step):
+        """Stops of a parsed journey step, resolved in order"""
+        return [self.resolve(stop) for stop in step.stop_ids]
+
+    def _found(self, index):
+        with self._lock:
+            self.lookups += 1
+            if index is None:
+                self.misses += 1
+                return None
+        return self.stops[index]
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def nearby(self, lat, lon, radius_km=0.5, limit=10):
+        """Located stops within radius_km, nearest first, as (Stop, distance_km) pairs"""
+        dlat = radius_km / _KM_PER_DEGREE
+        dlon = radius_km / (_KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        lat_low, lon_low = self._cell(lat - dlat, lon - dlon)
+        lat_high, lon_high = self._cell(lat + dlat, lon + dlon)
+        found = []
+        for lat_cell in range(lat_low, lat_high + 1):
+            for lon_cell in range(lon_low, lon_high + 1):
+                for index in self._grid.get((lat_cell, lon_cell), ()):
+                    stop = self.stops[index]
+                    distance = haversine_km(lat, lon, stop.lat, stop.lon)
+                    if distance <= radius_km:
+                        found.append((distance, index))
+        found.sort()
+        return [(self.stops[index], distance) for distance, index in found[:limit]]
+
+    def nearest(self, lat, lon, radius_km=0.5):
+        """The nearest located stop within radius_km, or None"""
+        found = self.nearby(lat, lon, radius_km, limit=1)
+        return found[0][0] if found else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stops': len(self.stops),
+                'node_ids': len(self._by_node),
+                'grid_cells': len(self._grid),
+                'lookups': self.lookups,
+                'misses': self.misses
+            }
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_gtfs_stops(path, registry=None):
+    """Add the stops of a GTFS stops.txt file to registry (a new one by default)
+
+    Platforms with a parent_station are registered under their own ID, but
+    their name resolves to the parent station. Numeric stop_code values are
+    added as node IDs alongside numeric stop_ids.
+    """
+    registry = registry if registry is not None else StopRegistry(config.STOP_GRID_CELL_DEGREES)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+
+    # Stations first, so platform names can point at their parent
+    rows.sort(key=lambda row: bool(row.get('parent_station')))
+    for row in rows:
+        stop_id = (row.get('stop_id') or '').strip()
+        name = (row.get('stop_name') or '').strip()
+        if not stop_id:
+            continue
+        parent = registry.index_of((row.get('parent_station') or '').strip())
+        index = registry.add(stop_id, name, _float(row.get('stop_lat')), _float(row.get('stop_lon')),
+                             (row.get('zone_id') or '').strip() or None,
+                             names=None if parent is None else ())
+        if parent is not None:
+            registry.add_name(name, parent)
+        code = (row.get('stop_code') or '').strip()
+        if code.isascii() and code.isdigit():
+            registry.add_node_id(code, index)
+    return registry
+
+
+def annotate_stops(journey_steps, registry=None):
+    """Add each step's canonical stop IDs (None for unresolved stops) as step['stop_ids']"""
+    registry = registry if registry is not None else stop_registry
+    for step in journey_steps:
+        resolved = (registry.resolve(str(stop)) for stop in step.get('stops') or ())
+        step['stop_ids'] = [stop.stop_id if stop is not None else None for stop in resolved]
+    return journey_steps
+
+
+def build_stop_registry(stops_path=None):
+    """Registry of config.DUBAI_STOPS, plus the GTFS stops file at stops_path if given"""
+    registry = StopRegistry(config.STOP_GRID_CELL_DEGREES)
+    if stops_path:
+        try:
+            load_gtfs_stops(stops_path, registry)
+        except (OSError, csv.Error) as e:
+            print(f"Error loading stops from {stops_path}: {e}")
+    # GTFS stops keep their names; the built-in list only fills the gaps
+    for name in config.DUBAI_STOPS:
+        registry.add('_'.join(name_tokens(name)), name)
+    return registry
+
+
+stop_registry = build_stop_registry(config.STOPS_PATH)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Tariff what-if simulator over historical journeys
+
+Journeys are parsed once into a columnar cache on disk (one raw array file per
+column, memory-mapped on load). The simulator keeps the fares of each mode
+between runs and only recomputes the modes a tariff change touches, so
+sweeping a grid of tariffs never reparses or reprices unchanged modes.
+
+    python tariff_sim.py build journeys.jsonl journey_cache/
+    python tariff_sim.py run journey_cache/ --set TAXI_PER_KM=9
+    python tariff_sim.py run journey_cache/ --sweep TAXI_PER_KM=7,8,9 --sweep METRO_BASE_FARE=3,4
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+import config
+from bulk_fares import FARE_CONSTANTS, MODE_CODES, columns_from_lines, fare_table, iter_line_chunks
+
+CACHE_VERSION = 1
+# Column files of the cache and their dtypes
+STEP_COLUMNS = {'mode': np.int8, 'distance': np.float64, 'journey': np.uint32}
+JOURNEY_COLUMNS = {'tier': np.int8}
+
+# Which cached mode fares each tariff parameter invalidates
+PARAMETER_MODES = {
+    'TAXI_BASE_FARE': ('taxi',),
+    'TAXI_PER_KM': ('taxi',),
+    'METRO_BASE_FARE': ('metro',),
+    'METRO_ZONE_FARE': ('metro',),
+    'BUS_BASE_FARE': ('bus',),
+    'BUS_ZONE_FARE': ('bus',),
+    'ZONE_LENGTH_KM': ('metro', 'bus'),
+    'MAX_FARE_ZONES': ('metro', 'bus')
+}
+HISTOGRAM_MAX_FARE = 200  # Journey totals above this share the last histogram bin
+
+
+def build_cache(jsonl_path, cache_dir, chunk_size=100000, default_tier=None):
+    """Parse a JSONL journey file into the columnar cache; returns the cache metadata"""
+    os.makedirs(cache_dir, exist_ok=True)
+    table = fare_table()
+    files = {name: open(os.path.join(cache_dir, f'step_{name}.bin'), 'wb') for name in STEP_COLUMNS}
+    files.update({name: open(os.path.join(cache_dir, f'journey_{name}.bin'), 'wb') for name in JOURNEY_COLUMNS})
+    journeys = steps = skipped = 0
+    try:
+        with open(jsonl_path, 'rb') as handle:
+            for offsets, lines in iter_line_chunks(handle, chunk_size):
+                columns, chunk_skipped = columns_from_lines(lines, table, default_tier, offsets)
+                counts = np.diff(columns.journey_start)
+                files['mode'].write(columns.modes.tobytes())
+                files['distance'].write(columns.distances.tobytes())
+                files['journey'].write((journeys + np.repeat(np.arange(len(columns)), counts))
+                                       .astype(STEP_COLUMNS['journey']).tobytes())
+                files['tier'].write(columns.tiers.astype(JOURNEY_COLUMNS['tier']).tobytes())
+                journeys += len(columns)
+                steps += len(columns.modes)
+                skipped += chunk_skipped
+    finally:
+        for f in files.values():
+            f.close()
+
+    meta = {'version': CACHE_VERSION, 'journeys': journeys, 'steps': steps, 'skipped': skipped,
+            'tiers': table['tiers']}
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_cache(cache_dir):
+    """Memory-map a columnar cache; returns (meta, step columns, journey columns)"""
+    with open(os.path.join(cache_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != CACHE_VERSION:
+        raise ValueError(f"Unsupported journey cache version {meta.get('version')}")
+
+    def column(prefix, name, dtype, length):
+        if length == 0:
+            return np.zeros(0, dtype)
+        return np.memmap(os.path.join(cache_dir, f'{prefix}_{name}.bin'), dtype=dtype, mode='r', shape=(length,))
+
+    steps = {name: column('step', name, dtype, meta['steps']) for name, dtype in STEP_COLUMNS.items()}
+    journeys = {name: column('journey', name, dtype, meta['journeys']) for name, dtype in JOURNEY_COLUMNS.items()}
+    return meta, steps, journeys
+
+
+class TariffSimulator:
+    """Revenue, per-mode breakdown and fare distribution of a journey corpus under a tariff
+
+    Starts from the tariff in config.py; simulate(**changes) applies changes on
+    top of the current tariff. Nol tier multipliers, surcharges and daily caps
+    apply as in fare_engine, with each journey's cap counted from zero spend.
+    """
+
+    def __init__(self, cache_dir):
+        self.meta, steps, journeys = load_cache(cache_dir)
+        self.journey_count = self.meta['journeys']
+        self.table = fare_table()
+        if self.meta['tiers'] != self.table['tiers']:
+            raise ValueError("Journey cache was built with different Nol tiers - rebuild it")
+        self.tariff = {name: self.table[name] for name in FARE_CONSTANTS}
+
+        journey_tier = np.asarray(journeys['tier'], dtype=np.intp)
+        self._journey_cap = self.table['daily_cap'][journey_tier]
+        modes = np.asarray(steps['mode'])
+        self._steps = {}
+        for mode, code in MODE_CODES.items():
+            index = np.flatnonzero(modes == code)
+            journey = np.asarray(steps['journey'][index], dtype=np.intp)
+            self._steps[mode] = {
+                'index': index,
+                'journey': journey,
+                'distance': np.asarray(steps['distance'][index]),
+                'tier': journey_tier[journey]
+            }
+        # Metro and bus steps in journey order, for applying daily caps
+        stage_index = np.flatnonzero((modes == MODE_CODES['metro']) | (modes == MODE_CODES['bus']))
+        self._stage_index = stage_index
+        self._stage_journey = np.asarray(steps['journey'][stage_index], dtype=np.intp)
+        self._stage_is_metro = modes[stage_index] == MODE_CODES['metro']
+        # Position of each stage step within the metro or bus arrays
+        self._stage_pos = np.where(self._stage_is_metro, np.cumsum(self._stage_is_metro),
+                                   np.cumsum(~self._stage_is_metro)) - 1
+
+        self._fares = {}  # mode -> rounded step fares under self.tariff
+        self._journey_sums = {}  # mode -> per-journey fare totals
+        self._stage = None  # (capped metro/bus spend per journey, metro revenue, bus revenue)
+        self.recomputed = {mode: 0 for mode in MODE_CODES}
+
+    def _mode_fares(self, mode):
+        steps = self._steps[mode]
+        t = self.tariff
+        if mode == 'taxi':
+            fares = np.maximum(t['TAXI_BASE_FARE'], t['TAXI_PER_KM'] * steps['distance'])
+        else:
+            prefix = mode.upper()
+            zones = np.clip(1 + np.floor_divide(steps['distance'], t['ZONE_LENGTH_KM']), 1, t['MAX_FARE_ZONES'])
+            fares = t[f'{prefix}_BASE_FARE'] + t[f'{prefix}_ZONE_FARE'] * (zones - 1)
+            fares = fares * self.table['multiplier'][steps['tier']] + self.table['surcharge'][steps['tier']]
+        return np.round(fares)
+
+    def _refresh(self, modes):
+        for mode in modes:
+            self._fares[mode] = self._mode_fares(mode)
+            self._journey_sums[mode] = np.bincount(self._steps[mode]['journey'], weights=self._fares[mode],
+                                                   minlength=self.journey_count)
+            self.recomputed[mode] += 1
+            if mode != 'taxi':
+                self._stage = None
+
+    def simulate(self, **changes):
+        """Apply tariff changes and return the corpus revenue figures under the new tariff"""
+        unknown = set(changes) - set(FARE_CONSTANTS)
+        if unknown:
+            raise ValueError(f"Unknown tariff parameters: {', '.join(sorted(unknown))}")
+        dirty = {mode for mode in MODE_CODES if mode not in self._fares}
+        for name, value in changes.items():
+            if self.tariff[name] != value:
+                self.tariff[name] = value
+                dirty.update(PARAMETER_MODES[name])
+        self._refresh(sorted(dirty))
+        return self._results()
+
+    def _capped_stage(self):
+        """Capped metro/bus spend per journey, and metro and bus revenue after daily caps
+
+        A journey's capped metro/bus spend is min(spend, cap), so only journeys
+        over their cap need their steps walked to split the reduction by mode.
+        """
+        stage_totals = self._journey_sums['metro'] + self._journey_sums['bus']
+        metro = self._journey_sums['metro'].sum()
+        bus = self._journey_sums['bus'].sum()
+        over_cap = stage_totals > self._journey_cap
+        if not over_cap.any():
+            return stage_totals, metro, bus
+
+        rows = np.flatnonzero(over_cap[self._stage_journey])
+        journey = self._stage_journey[rows]
+        is_metro = self._stage_is_metro[rows]
+        position = self._stage_pos[rows]
+        fares = np.empty(len(rows))
+        fares[is_metro] = self._fares['metro'][position[is_metro]]
+        fares[~is_metro] = self._fares['bus'][position[~is_metro]]
+
+        running = np.cumsum(fares)
+        starts = np.flatnonzero(np.r_[True, journey[1:] != journey[:-1]])
+        before = np.repeat(np.r_[0.0, running][starts], np.diff(np.r_[starts, len(rows)]))
+        spent = running - before
+        cap = self._journey_cap[journey]
+        capped = np.maximum(np.minimum(spent, cap) - np.minimum(spent - fares, cap), 0.0)
+        reduction = fares - capped
+        return (np.minimum(stage_totals, self._journey_cap),
+                metro - reduction[is_metro].sum(), bus - reduction[~is_metro].sum())
+
+    def _results(self):
+        if self._stage is None:
+            self._stage = self._capped_stage()
+        stage_totals, metro, bus = self._stage
+        totals = self._journey_sums['taxi'] + stage_totals
+        taxi = self._journey_sums['taxi'].sum()
+        # Journey totals are whole dirhams, so percentiles come from a count per fare instead of a sort
+        counts = np.bincount(totals.astype(np.intp), minlength=HISTOGRAM_MAX_FARE + 1)
+        histogram = counts[:HISTOGRAM_MAX_FARE + 1].copy()
+        histogram[HISTOGRAM_MAX_FARE] += counts[HISTOGRAM_MAX_FARE + 1:].sum()
+        p50, p90, p99 = _percentiles_from_counts(counts, [50, 90, 99])
+        revenue = float(totals.sum())
+        return {
+            'tariff': dict(self.tariff),
+            'journeys': self.journey_count,
+            'revenue': revenue,
+            'breakdown': {'taxi': float(taxi), 'metro': float(metro), 'bus': float(bus)},
+            'mean_fare': revenue / self.journey_count if self.journey_count else 0.0,
+            'percentiles': {'p50': p50, 'p90': p90, 'p99': p99},
+            'histogram': histogram.tolist()
+        }
+
+    def sweep(self, grid):
+        """Simulate every combination of a {parameter: [values]} grid
+
+        The last parameter varies fastest, so consecutive runs usually change a
+        single parameter and recompute only the modes it affects.
+        """
+        names = list(grid)
+        for values in itertools.product(*(grid[name] for name in names)):
+            yield self.simulate(**dict(zip(names, values)))
+
+
+def _percentiles_from_counts(counts, percents):
+    """np.percentile (linear interpolation) of integer values given as counts per value"""
+    total = int(counts.sum())
+    if total == 0:
+        return [0.0 for _ in percents]
+    cumulative = np.cumsum(counts)
+    results = []
+    for percent in percents:
+        rank = (total - 1) * percent / 100
+        low, high = np.searchsorted(cumulative, [np.floor(rank), np.ceil(rank)], side='right')
+        results.append(float(low + (high - low) * (rank - np.floor(rank))))
+    return results
+
+
+def _parse_assignment(text):
+    name, _, values = text.partition('=')
+    if name not in FARE_CONSTANTS or not values:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE with NAME one of {', '.join(FARE_CONSTANTS)}")
+    return name, [float(v) for v in values.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate tariff changes over historical journeys')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='parse a JSONL journey file into a columnar cache')
+    build.add_argument('input', help='JSONL file of journeys (as read by bulk_fares.py)')
+    build.add_argument('cache_dir')
+    build.add_argument('--tier', choices=list(config.NOL_CARD_TIERS), help='Nol tier for journeys without one')
+    run = commands.add_parser('run', help='simulate tariffs over a journey cache')
+    run.add_argument('cache_dir')
+    run.add_argument('--set', dest='changes', type=_parse_assignment, action='append', default=[],
+                     help='tariff change, e.g. TAXI_PER_KM=9')
+    run.add_argument('--sweep', type=_parse_assignment, action='append', default=[],
+                     help='comma-separated values to sweep, e.g. TAXI_PER_KM=7,8,9')
+    run.add_argument('--histogram', action='store_true', help='include the fare histogram in the output')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        print(json.dumps(build_cache(args.input, args.cache_dir, default_tier=args.tier)))
+        return
+
+    simulator = TariffSimulator(args.cache_dir)
+    simulator.simulate(**{name: values[0] for name, values in args.changes})
+    results = simulator.sweep(dict(args.sweep)) if args.sweep else [simulator.simulate()]
+    for result in results:
+        if not args.histogram:
+            del result['histogram']
+        sys.stdout.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
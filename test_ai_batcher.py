@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Test AI request micro-batching"""
+
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(__file__))
+
+from ai_batcher import AIBatcher
+
+
+def run_concurrently(batcher, texts):
+    results = [None] * len(texts)
+
+    def extract(i):
+        try:
+            results[i] = batcher.extract(texts[i], timeout=5)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=extract, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_texts_share_one_call():
+    batches = []
+
+    def send_batch(texts):
+        batches.append(texts)
+        return [{'text': text} for text in texts]
+
+    batcher = AIBatcher(send_batch, window_seconds=0.2, max_batch_size=10)
+    texts = ['journey a', 'journey b', 'journey  a', 'journey c']
+    results = run_concurrently(batcher, texts)
+
+    assert len(batches) == 1 and len(batches[0]) == 3  # 'journey  a' normalizes to 'journey a'
+    assert results[1] == {'text': 'journey b'}
+    assert results[0] == results[2] and results[0] is not results[2]
+    assert batcher.stats()['coalesced'] == 1
+
+
+def test_full_batch_is_sent_without_waiting():
+    batcher = AIBatcher(lambda texts: list(texts), window_seconds=60, max_batch_size=2)
+    assert run_concurrently(batcher, ['x', 'y']) == ['x', 'y']
+
+
+def test_batch_errors_reach_every_caller():
+    def send_batch(texts):
+        raise ValueError('malformed response')
+
+    batcher = AIBatcher(send_batch, window_seconds=0.05)
+    results = run_concurrently(batcher, ['x', 'y'])
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+if __name__ == "__main__":
+    test_concurrent_texts_share_one_call()
+    test_full_batch_is_sent_without_waiting()
+    test_batch_errors_reach_every_caller()
+    print("All AI batcher tests passed")
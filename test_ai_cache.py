@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Test AI response cache behaviour"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+import config
+from ai_cache import JourneyCache, cache_key
+
+JOURNEY = "1. taxi: 1 stop, 8.5 min, 4.2 km\n   Stops: Dubai Marina Walk -> Mall of the Emirates Metro Station"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_miss_and_whitespace_normalization():
+    cache = JourneyCache(max_entries=4, ttl_seconds=60)
+    assert cache.get(JOURNEY) is None
+    cache.put(JOURNEY, {'total_fare': 34})
+
+    result = cache.get("\n  " + JOURNEY.replace(' -> ', '   ->  ') + "\n\n")
+    assert result == {'total_fare': 34}
+    result['total_fare'] = 0  # callers get their own copy
+    assert cache.get(JOURNEY) == {'total_fare': 34}
+
+    stats = cache.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 1
+
+
+def test_ttl_and_lru_eviction():
+    clock = FakeClock()
+    cache = JourneyCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    cache.get('a')
+    cache.put('c', {'n': 3})  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+
+    clock.now += 11
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['expirations'] == 1
+
+
+def test_fare_config_change_invalidates():
+    key = cache_key(JOURNEY)
+    original = config.TAXI_PER_KM
+    try:
+        config.TAXI_PER_KM = original + 1
+        assert cache_key(JOURNEY) != key
+    finally:
+        config.TAXI_PER_KM = original
+    assert cache_key(JOURNEY) == key
+
+
+def test_sqlite_backend_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'ai_cache.sqlite3')
+    JourneyCache(path=path).put(JOURNEY, {'total_fare': 34})
+    assert JourneyCache(path=path).get(JOURNEY) == {'total_fare': 34}
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_hit_miss_and_whitespace_normalization()
+    test_ttl_and_lru_eviction()
+    test_fare_config_change_invalidates()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_sqlite_backend_shared_between_instances(pathlib.Path(tmp))
+    print("All AI cache tests passed")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Test AI call deadlines, hedging and the circuit breaker"""
+
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(__file__))
+
+from ai_stream import StreamAborted, MISMATCH
+from ai_client import ResilientAIClient, CircuitBreaker, CircuitOpenError, LatencyTracker, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClient:
+    """Answers after the next scripted delay, or raises when the script says so"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, timeout, **kwargs):
+        with self.lock:
+            self.calls += 1
+            step = self.script.pop(0) if self.script else 0.0
+        if isinstance(step, Exception):
+            raise step
+        time.sleep(step)
+        return f'answer after {step}'
+
+
+def test_circuit_breaker_transitions():
+    now = [0.0]
+    transitions = []
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0],
+                             on_transition=lambda old, new: transitions.append((old, new)))
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow() and not breaker.available()
+
+    now[0] = 11.0
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # Only one probe at a time
+    breaker.release()  # A probe that proved nothing lets the next call probe
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    now[0] = 22.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert transitions == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)]
+
+
+def test_deadline_and_open_circuit():
+    client = ResilientAIClient(FakeClient([0.5, RuntimeError('boom')]), 'm', timeout=0.1, hedge=False,
+                               breaker=CircuitBreaker(failure_threshold=2))
+    start = time.monotonic()
+    try:
+        client.create([])
+    except TimeoutError:
+        pass
+    assert time.monotonic() - start < 0.3
+    try:
+        client.create([])
+    except RuntimeError:
+        pass
+    try:
+        client.create([])
+    except CircuitOpenError:
+        pass
+    else:
+        raise AssertionError("circuit should be open")
+    stats = client.stats()
+    assert stats['timeouts'] == 1 and stats['failures'] == 1 and stats['circuit_rejected'] == 1
+
+
+def test_slow_call_is_hedged():
+    latencies = LatencyTracker(min_samples=1)
+    latencies.add(0.05)
+    fake = FakeClient([1.0, 0.01])
+    client = ResilientAIClient(fake, 'm', timeout=2.0, hedge_min_seconds=0.05, hedge_budget=1.0, latencies=latencies)
+    start = time.monotonic()
+    assert client.create([]) == 'answer after 0.01'
+    assert time.monotonic() - start < 0.5
+    assert fake.calls == 2 and client.stats()['hedge_wins'] == 1
+
+
+def test_stream_failures_reach_the_breaker():
+    client = ResilientAIClient(FakeClient([0.01] * 6), 'm', timeout=1.0, hedge=False,
+                               breaker=CircuitBreaker(failure_threshold=2))
+
+    def abort(stream):
+        raise TimeoutError("AI stream exceeded its deadline")
+
+    def mismatch(stream):
+        raise StreamAborted(MISMATCH, "AI step 0 is a bus, the journey says metro")
+    assert client.stream([], lambda stream: stream.upper()) == 'ANSWER AFTER 0.01'
+    # Answers that contradict the journey are not the provider's fault
+    for _ in range(3):
+        try:
+            client.stream([], mismatch)
+        except StreamAborted:
+            pass
+    assert client.breaker.state == CLOSED and client.stats()['stream_failures'] == 0
+    for _ in range(2):
+        try:
+            client.stream([], abort)
+        except TimeoutError:
+            pass
+    assert client.breaker.state == OPEN and client.stats()['stream_failures'] == 2
+    # Time to the stream's headers is kept apart from full responses
+    assert len(client.stream_latencies._samples) == 6 and not client.latencies._samples
+
+
+if __name__ == "__main__":
+    test_circuit_breaker_transitions()
+    test_deadline_and_open_circuit()
+    test_slow_call_is_hedged()
+    test_stream_failures_reach_the_breaker()
+    print("All AI client tests passed")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Test background AI extraction jobs"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(__file__))
+
+from ai_jobs import AIJobQueue, DONE, CANCELLED, TIMED_OUT
+
+
+class BlockingWorker:
+    """Extraction stand-in that holds every call until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, journey_text, **options):
+        self.calls.append((journey_text, options))
+        self.release.wait(5)
+        return {'journey_text': journey_text, **options}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_jobs_complete_with_options():
+    worker = BlockingWorker()
+    worker.release.set()
+    completed = []
+    queue = AIJobQueue(worker, max_workers=1)
+    job = queue.submit('journey', on_complete=completed.append, tier='blue')
+    job.future.result(timeout=5)
+    wait_until(lambda: queue.get(job.id).status == DONE)
+    assert completed == [{'journey_text': 'journey', 'tier': 'blue'}]
+    assert queue.get(job.id).to_dict()['result'] == completed[0]
+
+
+def test_full_queue_rejects_and_pending_jobs_cancel():
+    worker = BlockingWorker()
+    queue = AIJobQueue(worker, max_workers=1, max_pending=1)
+    running, pending = queue.submit('first'), queue.submit('second')
+    assert queue.submit('third') is None and queue.stats()['rejected'] == 1
+
+    assert queue.cancel(pending.id) and not queue.cancel(pending.id)
+    assert queue.get(pending.id).status == CANCELLED
+    assert queue.submit('fourth') is not None  # The cancelled job freed its slot
+    worker.release.set()
+    running.future.result(timeout=5)
+    wait_until(lambda: queue.get(running.id).status == DONE)
+    assert 'second' not in [text for text, _ in worker.calls]
+    assert not queue.cancel(running.id)  # Already finished
+
+
+def test_late_results_are_discarded():
+    worker = BlockingWorker()
+    completed = []
+    queue = AIJobQueue(worker, max_workers=1, timeout_seconds=0.05)
+    job = queue.submit('slow', on_complete=completed.append)
+    wait_until(lambda: worker.calls)
+    time.sleep(0.1)
+    assert queue.get(job.id).status == TIMED_OUT
+    worker.release.set()
+    job.future.result(timeout=5)
+    assert queue.get(job.id).status == TIMED_OUT and queue.get(job.id).result is None and completed == []
+
+
+def test_job_status_api():
+    import app
+    from benchmark import StubArk
+    from sample_journeys import SAMPLE_JOURNEY_2
+    client = app.app.test_client()
+    assert client.get('/journey_jobs/missing').status_code == 404
+    assert client.delete('/journey_jobs/missing').status_code == 404
+
+    real_client, app.ai_client.client = app.ai_client.client, StubArk()
+    try:
+        job = app.ai_jobs.submit(SAMPLE_JOURNEY_2 + '\n# job status test', tier='blue')
+        job.future.result(timeout=5)
+        wait_until(lambda: client.get(f'/journey_jobs/{job.id}').get_json()['status'] == DONE)
+    finally:
+        app.ai_client.client = real_client
+    result = client.get(f'/journey_jobs/{job.id}').get_json()['result']
+    assert result['nol_tier'] == 'blue' and result['journey_steps']
+    assert client.delete(f'/journey_jobs/{job.id}').status_code == 404  # Finished jobs cannot be cancelled
+
+
+if __name__ == "__main__":
+    test_jobs_complete_with_options()
+    test_full_queue_rejects_and_pending_jobs_cancel()
+    test_late_results_are_discarded()
+    test_job_status_api()
+    print("All AI job tests passed")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Test streamed AI extraction and its early abort"""
+
+import sys
+import os
+import json
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(__file__))
+
+from byteplussdkarkruntime import Ark
+
+from ai_stream import StepStreamParser, StreamingExtractor, StreamAborted, MALFORMED, MISMATCH
+from journey_parser import parse_journey_text
+from mock_ark_server import MockArkServer, answer_for_prompt
+from sample_journeys import SAMPLE_JOURNEY_2
+
+
+class FakeStream:
+    """Chat completion chunks of content, counting how many were read"""
+
+    def __init__(self, content, chunk_chars=10):
+        self.pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    def close(self):
+        self.closed = True
+
+
+def answer_text(**step_changes):
+    answer = answer_for_prompt(SAMPLE_JOURNEY_2)
+    for index, changes in step_changes.items():
+        answer['journey_steps'][int(index[1:])].update(changes)
+    return json.dumps(answer)
+
+
+def test_parser_emits_steps_as_they_complete():
+    text = '{"note": "x", "journey_steps": [{"mode": "taxi", "stops": ["A {1}", "B \\"2\\""]}, {"mode": "bus"}], "total_fare": 3}'
+    parser = StepStreamParser()
+    seen = []
+    for i, char in enumerate(text):
+        for step in parser.feed(char):
+            seen.append((step['mode'], i))
+    assert [mode for mode, _ in seen] == ['taxi', 'bus']
+    assert seen[0][1] == text.index('}, {')  # Emitted on its closing brace
+    assert json.loads(parser.text)['total_fare'] == 3
+
+    for bad in ('Sure! Here is the JSON', '{"journey_steps": ["taxi"]}', '{"journey_steps": [{"mode": ]}'):
+        try:
+            StepStreamParser().feed(bad)
+        except StreamAborted as e:
+            assert e.reason == MALFORMED
+        else:
+            raise AssertionError(f"{bad!r} should abort")
+
+
+def test_valid_stream_returns_answer():
+    extractor = StreamingExtractor()
+    stream = FakeStream(answer_text())
+    steps = []
+    answer = extractor.extract(stream, SAMPLE_JOURNEY_2, parse_journey_text(SAMPLE_JOURNEY_2),
+                               on_step=lambda index, step: steps.append(step['mode']))
+    assert answer == json.loads(answer_text())
+    assert steps == ['taxi', 'metro', 'transfer'] and stream.closed
+    assert extractor.stats()['completed'] == 1 and extractor.stats()['steps'] == 3
+
+
+def test_disagreeing_step_aborts_early():
+    extractor = StreamingExtractor()
+    local_steps = parse_journey_text(SAMPLE_JOURNEY_2)
+    for content, reason in ((answer_text(s0={'mode': 'bus'}), MISMATCH),
+                            (answer_text(s1={'distance_km': 40.0}), MISMATCH),
+                            (answer_text(s0={'fare_aed': 'twelve'}), MALFORMED)):
+        stream = FakeStream(content)
+        try:
+            extractor.extract(stream, SAMPLE_JOURNEY_2, local_steps)
+        except StreamAborted as e:
+            assert e.reason == reason
+        else:
+            raise AssertionError("stream should abort")
+        assert stream.closed and stream.read < len(stream.pieces)
+
+    # A missing step is only known at the end
+    answer = json.loads(answer_text())
+    del answer['journey_steps'][2]
+    try:
+        extractor.extract(FakeStream(json.dumps(answer)), SAMPLE_JOURNEY_2, local_steps)
+    except StreamAborted as e:
+        assert e.reason == MISMATCH
+    stats = extractor.stats()
+    assert stats['aborted_mismatch'] == 3 and stats['aborted_malformed'] == 1
+
+
+def test_streams_from_ark_client():
+    server = MockArkServer(('127.0.0.1', 0), seed=1)
+    server.start()
+    try:
+        client = Ark(base_url=server.base_url, api_key='mock', max_retries=0)
+        stream = client.chat.completions.create(
+            model='mock', stream=True,
+            messages=[{'role': 'user', 'content': f"\nJourney text: {SAMPLE_JOURNEY_2}\n\nPlease extract ..."}])
+        answer = StreamingExtractor().extract(stream, SAMPLE_JOURNEY_2, parse_journey_text(SAMPLE_JOURNEY_2))
+        assert [s['mode'] for s in answer['journey_steps']] == ['taxi', 'metro', 'transfer']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_parser_emits_steps_as_they_complete()
+    test_valid_stream_returns_answer()
+    test_disagreeing_step_aborts_early()
+    test_streams_from_ark_client()
+    print("All AI stream tests passed")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Test content-hashed static assets"""
+
+import sys
+import os
+import gzip
+import re
+sys.path.append(os.path.dirname(__file__))
+
+from assets import AssetManifest
+
+
+def test_manifest_hashes_and_compresses(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'page.css').write_text('body { color: #333; }\n' * 100)
+    (tmp_path / 'clip.mp4').write_bytes(os.urandom(2048))
+    now = [0.0]
+    manifest = AssetManifest(str(tmp_path), check_interval=1.0, clock=lambda: now[0])
+
+    hashed = manifest.hashed('css/page.css')
+    assert re.fullmatch(r'css/page\.[0-9a-f]{12}\.css', hashed)
+    asset = manifest.lookup(hashed)
+    assert asset.mimetype == 'text/css' and gzip.decompress(asset.gzipped) == (tmp_path / 'css' / 'page.css').read_bytes()
+    assert manifest.get('clip.mp4').gzipped is None  # Video does not compress
+    assert manifest.hashed('missing.js') is None
+
+    (tmp_path / 'css' / 'page.css').write_text('body { color: #000; }\n')
+    assert manifest.hashed('css/page.css') == hashed  # Not rescanned until the interval passes
+    now[0] = 2.0
+    assert manifest.hashed('css/page.css') != hashed
+    assert manifest.lookup(hashed) is None and manifest.builds == 2
+
+
+def test_asset_route_caching_and_ranges():
+    from app import app, asset_url
+    client = app.test_client()
+    html = client.get('/').get_data(as_text=True)
+    css_url = re.search(r'href="(/assets/css/index\.[0-9a-f]+\.css)"', html).group(1)
+
+    response = client.get(css_url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control'] and response.headers['Vary'] == 'Accept-Encoding'
+    assert client.get(css_url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert b'body' in client.get(css_url).data
+
+    with app.test_request_context():
+        video_url = asset_url('tick_video.mp4')
+    response = client.get(video_url, headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206 and len(response.data) == 100
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert client.get('/assets/tick_video.000000000000.mp4').status_code == 404
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_manifest_hashes_and_compresses(Path(tmp_dir))
+    test_asset_route_caching_and_ranges()
+    print("All asset tests passed")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Test the shared batched background writer"""
+
+import sys
+import os
+import json
+import threading
+sys.path.append(os.path.dirname(__file__))
+
+from batch_writer import BatchedWriter, append_jsonl
+
+
+def test_groups_stay_in_one_batch():
+    batches = []
+    writer = BatchedWriter(batches.append, 'test', batch_size=4, flush_interval=0.05)
+    for i in range(5):
+        writer.put(*[(i, part) for part in range(3)])
+    writer.flush()
+    assert [item for batch in batches for item in batch] == [(i, part) for i in range(5) for part in range(3)]
+    assert all(len(batch) % 3 == 0 for batch in batches)  # A group never straddles two batches
+    assert writer.items_written == 15 and writer.batches_written == len(batches) < 5
+
+
+def test_failed_batches_are_counted_and_dropped():
+    written = []
+    failing = threading.Event()
+    failing.set()
+
+    def write_batch(batch):
+        if failing.is_set():
+            raise OSError('disk full')
+        written.extend(batch)
+    writer = BatchedWriter(write_batch, 'test', flush_interval=0.01)
+    writer.put('lost')
+    writer.flush()
+    failing.clear()
+    writer.put('kept')
+    writer.flush()
+    assert written == ['kept'] and writer.write_errors == 1 and writer.items_written == 1 and writer.qsize() == 0
+
+
+def test_append_jsonl(tmp_path):
+    path = str(tmp_path / 'items.jsonl')
+    append_jsonl(path, [{'a': 1}, {'b': 'é'}])
+    append_jsonl(path, [{'c': 3}], fsync=False)
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'a': 1}, {'b': 'é'}, {'c': 3}]
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_groups_stay_in_one_batch()
+    test_failed_batches_are_counted_and_dropped()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_append_jsonl(pathlib.Path(tmp))
+    print("All batch writer tests passed")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Test the benchmark journey generator and stub AI client"""
+
+import sys
+import os
+import json
+import random
+sys.path.append(os.path.dirname(__file__))
+
+from benchmark import synthetic_journey, StubArk, SCENARIOS
+from fare_engine import is_confident
+from journey_parser import parse_journey_text
+
+
+def test_synthetic_journeys_parse():
+    rng = random.Random(1)
+    for legs, stops, modes in SCENARIOS.values():
+        text = synthetic_journey(rng, legs, stops, modes)
+        steps = parse_journey_text(text)
+        assert len(steps) == legs and is_confident(text, steps)
+        assert all(len(step) == (stops if step.mode in ('metro', 'bus') else 2) for step in steps)
+    assert synthetic_journey(random.Random(5), 4, 10) == synthetic_journey(random.Random(5), 4, 10)
+
+
+def test_stub_ark_answers_batches():
+    stub = StubArk()
+    rng = random.Random(2)
+    content = '\n\n'.join(f"Journey {i}:\n{synthetic_journey(rng, 3, 4)}" for i in (1, 2))
+    response = stub.chat.completions.create(model='m', messages=[{'role': 'user', 'content': content}])
+    answer = json.loads(response.choices[0].message.content)
+    assert len(answer['journeys']) == 2 and stub.calls == 1
+
+
+if __name__ == "__main__":
+    test_synthetic_journeys_parse()
+    test_stub_ark_answers_batches()
+    print("All benchmark helper tests passed")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test vectorized bulk fare computation against the scalar fare engine"""
+
+import sys
+import os
+import json
+import random
+sys.path.append(os.path.dirname(__file__))
+
+from bulk_fares import fare_table, columns_from_lines, price_columns, reprice_file
+from fare_engine import price_journey
+from journey_parser import parse_journey_text
+from sample_journeys import SAMPLE_JOURNEYS
+
+
+def random_journeys(count, seed=7):
+    rng = random.Random(seed)
+    journeys = []
+    for i in range(count):
+        steps = [{'mode': rng.choice(['taxi', 'metro', 'bus', 'transfer']),
+                  'distance_km': round(rng.uniform(0.1, 45.0), 1)} for _ in range(rng.randint(0, 6))]
+        journeys.append({'journey_id': f'j{i}', 'nol_tier': rng.choice(['red', 'silver', 'gold', 'blue']),
+                         'journey_steps': steps})
+    return journeys
+
+
+def scalar_fares(record):
+    if 'journey_text' in record:
+        steps = parse_journey_text(record['journey_text'])
+    else:
+        steps = [{'mode': s['mode'], 'distance': s['distance_km'], 'stops': []} for s in record['journey_steps']]
+    info = price_journey(steps, record.get('nol_tier'))
+    return [s['fare_aed'] for s in info['journey_steps']], info['total_fare']
+
+
+def test_matches_price_journey():
+    records = random_journeys(500)
+    records += [{'journey_text': text} for _, _, text in SAMPLE_JOURNEYS.values()]
+    table = fare_table()
+    columns, skipped = columns_from_lines([json.dumps(r) for r in records] + ['not json'], table)
+    assert skipped == 1
+    fares, totals = price_columns(columns, table)
+    starts = columns.journey_start
+    for i, record in enumerate(records):
+        step_fares, total = scalar_fares(record)
+        assert fares[starts[i]:starts[i + 1]].tolist() == step_fares, record
+        assert totals[i] == total
+
+
+def test_sharded_file_keeps_order(tmp_path):
+    records = random_journeys(300, seed=11)
+    source = tmp_path / 'journeys.jsonl'
+    source.write_text(''.join(json.dumps(r) + '\n' for r in records))
+    single = reprice_file(str(source), str(tmp_path / 'one.jsonl'), chunk_size=64)
+    sharded = reprice_file(str(source), str(tmp_path / 'four.jsonl'), workers=4, chunk_size=64)
+    assert single == sharded and single['journeys'] == 300
+    assert (tmp_path / 'one.jsonl').read_text() == (tmp_path / 'four.jsonl').read_text()
+
+    # What-if tariffs only change the affected modes
+    reprice_file(str(source), str(tmp_path / 'dear.jsonl'), overrides={'TAXI_PER_KM': 9.0})
+    for before, after, record in zip((tmp_path / 'one.jsonl').read_text().splitlines(),
+                                     (tmp_path / 'dear.jsonl').read_text().splitlines(), records):
+        if not any(s['mode'] == 'taxi' for s in record['journey_steps']):
+            assert before == after
+
+
+def test_default_ids_are_unique_across_shards(tmp_path):
+    records = random_journeys(100, seed=5)
+    for record in records:
+        del record['journey_id']
+    source = tmp_path / 'anonymous.jsonl'
+    source.write_text(''.join(json.dumps(r) + '\n' for r in records))
+    reprice_file(str(source), str(tmp_path / 'one.jsonl'), chunk_size=16)
+    reprice_file(str(source), str(tmp_path / 'three.jsonl'), workers=3, chunk_size=16)
+    assert (tmp_path / 'one.jsonl').read_text() == (tmp_path / 'three.jsonl').read_text()
+    ids = [json.loads(line)['journey_id'] for line in (tmp_path / 'three.jsonl').read_text().splitlines()]
+    assert len(set(ids)) == 100 and ids[0] == 0 and ids == sorted(ids)
+
+
+def test_undecodable_lines_are_skipped(tmp_path):
+    from tariff_sim import build_cache
+    records = random_journeys(20, seed=9)
+    source = tmp_path / 'mixed.jsonl'
+    source.write_bytes(b''.join(json.dumps(r).encode('utf-8') + b'\n' for r in records[:10]) + b'{"journey_id": "\xff"}\n'
+                       + b''.join(json.dumps(r).encode('utf-8') + b'\n' for r in records[10:]))
+    summary = reprice_file(str(source), str(tmp_path / 'out.jsonl'), workers=2, chunk_size=4)
+    assert summary['journeys'] == 20 and summary['skipped'] == 1
+    meta = build_cache(str(source), str(tmp_path / 'cache'), chunk_size=4)
+    assert meta['journeys'] == 20 and meta['skipped'] == 1
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_matches_price_journey()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_sharded_file_keeps_order(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_default_ids_are_unique_across_shards(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_undecodable_lines_are_skipped(pathlib.Path(tmp))
+    print("All bulk fare tests passed")
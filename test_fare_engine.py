@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test local fare engine"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from app import parse_journey_text, get_journey_info
+from fare_engine import calculate_fare, is_confident, price_journey, zones_for_distance, apply_tier
+from sample_journeys import SAMPLE_JOURNEY_1
+
+
+def test_zone_fares_by_tier():
+    assert zones_for_distance(4.0) == 1
+    assert zones_for_distance(15.8) == 2
+    assert zones_for_distance(80.0) == 3
+    assert calculate_fare('metro', 4.0) == 3
+    assert calculate_fare('metro', 25.0) == 8  # 3 + 2 x 2.25 = 7.5
+    assert calculate_fare('metro', 25.0, tier='gold') == 15
+    assert calculate_fare('metro', 4.0, tier='red') == 4
+    assert calculate_fare('taxi', 0.5) == 12
+    assert calculate_fare('transfer', 0.1) == 0
+
+
+def test_daily_cap():
+    steps = parse_journey_text(SAMPLE_JOURNEY_1)
+    uncapped = price_journey(steps)
+    capped = price_journey(steps, spent_today=18.0)
+    metro_bus = [s['fare_aed'] for s in capped['journey_steps'] if s['mode'] in ('metro', 'bus')]
+    assert sum(metro_bus) == 2
+    assert capped['total_fare'] < uncapped['total_fare']
+
+
+def test_confident_text_is_priced_locally():
+    steps = parse_journey_text(SAMPLE_JOURNEY_1)
+    assert is_confident(SAMPLE_JOURNEY_1, steps)
+    journey_info = get_journey_info(SAMPLE_JOURNEY_1)
+    assert journey_info['fare_source'] == 'local'
+    assert len(journey_info['journey_steps']) == 6
+
+
+def test_unparseable_text_is_not_confident():
+    text = "1. ferry: 2 stops, 10 min, 3 km\n   Stops: Deira -> Bur Dubai"
+    assert not is_confident(text, parse_journey_text(text))
+
+
+def test_default_tier_fares_are_repriced_for_the_rider():
+    steps = parse_journey_text(SAMPLE_JOURNEY_1)
+    default = price_journey(steps)  # What the AI and the fallback price at
+    for tier, spent in (('blue', 0.0), ('gold', 0.0), ('red', 8.0), ('silver', 18.0)):
+        rider = apply_tier(default, tier, spent)
+        assert rider['journey_steps'] == price_journey(steps, tier, spent)['journey_steps']
+        assert rider['total_fare'] == price_journey(steps, tier, spent)['total_fare'] and rider['nol_tier'] == tier
+    assert default['nol_tier'] == 'silver'  # Not changed in place
+
+    # Without a distance the fare is converted between the tiers' rules
+    ai_info = {'journey_steps': [{'mode': 'metro', 'fare_aed': 8}, {'mode': 'taxi', 'fare_aed': 20}]}
+    assert apply_tier(ai_info, 'gold')['total_fare'] == 36
+
+
+if __name__ == "__main__":
+    test_zone_fares_by_tier()
+    test_daily_cap()
+    test_confident_text_is_priced_locally()
+    test_unparseable_text_is_not_confident()
+    test_default_tier_fares_are_repriced_for_the_rider()
+    print("All fare engine tests passed")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Test append-only fare results log"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from fare_log import FareResultLog, fare_breakdown
+
+JOURNEY_INFO = {
+    'journey_id': 'j1',
+    'total_fare': 31,
+    'fare_source': 'local',
+    'journey_steps': [
+        {'mode': 'taxi', 'fare_aed': 23},
+        {'mode': 'transfer', 'fare_aed': 0},
+        {'mode': 'metro', 'fare_aed': 5},
+        {'mode': 'metro', 'fare_aed': 3},
+    ]
+}
+
+
+def test_breakdown_skips_transfers():
+    assert fare_breakdown(JOURNEY_INFO) == {'taxi': 23, 'metro': 8}
+
+
+def test_records_are_batched_and_queryable(tmp_path):
+    log = FareResultLog(str(tmp_path / 'fares.jsonl'), batch_size=50, flush_interval=0.05, fsync=False)
+    for i in range(120):
+        log.record(dict(JOURNEY_INFO, journey_id=f'j{i}'))
+    log.flush()
+
+    assert log.stats()['records_written'] == 120
+    assert log.stats()['batches_written'] <= 10
+    assert len(log.query()) == 120
+    assert log.query(journey_id='j7')[0]['breakdown'] == {'taxi': 23, 'metro': 8}
+    assert log.query(calculated_by='ai') == []
+    assert [r['journey_id'] for r in log.query(limit=2)] == ['j118', 'j119']
+
+
+def test_fare_results_need_the_ledger_token():
+    import config
+    from app import app
+    client = app.test_client()
+    config.LEDGER_API_TOKEN = 'secret'
+    try:
+        assert client.get('/fare_results').status_code == 401
+        assert client.get('/fare_results', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        response = client.get('/fare_results?limit=1', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200 and 'results' in response.get_json()
+    finally:
+        config.LEDGER_API_TOKEN = ''
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_breakdown_skips_transfers()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_records_are_batched_and_queryable(pathlib.Path(tmp))
+    test_fare_results_need_the_ledger_token()
+    print("All fare log tests passed")
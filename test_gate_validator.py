@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Test batched gate scan validation"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(__file__))
+
+from gate_validator import GateValidator, apply_scan
+from journey_events import JourneyEvents
+from journey_store import MemoryJourneyStore
+from qr_render import build_qr_data
+
+PAID = '6c1b3b6e-0c3a-4b8e-9a55-2d4c1f0e7a10'
+UNPAID = 'e0a8c2d4-5b1f-4f6a-8c3e-9d7b6a5f4e32'
+MISSING = '00000000-0000-4000-8000-000000000000'
+JOURNEY_INFO = {'journey_steps': [
+    {'mode': 'metro', 'line_number': 'Red', 'stops': ['a', 'b']},
+    {'mode': 'taxi', 'line_number': None, 'stops': ['b', 'c']}
+]}
+
+
+def make_validator():
+    store = MemoryJourneyStore()
+    store.create(PAID, JOURNEY_INFO)
+    store.update(PAID, payment_completed=True)
+    store.create(UNPAID, JOURNEY_INFO)
+    return store, GateValidator(store, JourneyEvents())
+
+
+def test_batch_applies_transitions_in_order():
+    store, validator = make_validator()
+    results = validator.validate_batch([
+        {'qr_data': build_qr_data(PAID, 0, 'metro', 'Red', 'entry')},
+        {'qr_data': build_qr_data(PAID, 0, 'metro', 'Red', 'exit')},
+        {'qr_data': build_qr_data(PAID, 1, 'taxi', None, 'exit')},
+        {'qr_data': build_qr_data(UNPAID, 0, 'metro', 'Red', 'entry')},
+        {'qr_data': build_qr_data(MISSING, 0, 'metro', 'Red', 'entry')},
+        {'qr_data': 'not json'}
+    ])
+    assert [r['accepted'] for r in results] == [True, True, True, False, False, False]
+    assert [r['index'] for r in results] == list(range(6))
+    assert results[0]['action'] == 'enter_metro' and not results[0]['next_step']
+    assert results[2]['action'] == 'exit_taxi'
+    assert results[3]['error'] == 'Journey not paid'
+    assert store.get(PAID)['current_step'] == 2
+
+
+def test_replays_are_idempotent():
+    store, validator = make_validator()
+    scan = {'qr_data': build_qr_data(PAID, 0, 'metro', 'Red', 'exit'), 'idempotency_key': 'gate-7:1'}
+    first = validator.validate_batch([scan])[0]
+    replay = validator.validate_batch([scan])[0]
+    assert first['accepted'] and replay['accepted'] and replay['replayed']
+    assert store.get(PAID)['current_step'] == 1
+
+    # Without a key the payload itself identifies the scan
+    taxi = {'qr_data': build_qr_data(PAID, 1, 'taxi', None, 'exit')}
+    assert validator.validate_batch([taxi, taxi])[1]['replayed']
+    assert store.get(PAID)['current_step'] == 2
+
+    # A stale QR for an earlier step is rejected, not applied
+    stale = validator.validate_batch([{'qr_data': build_qr_data(PAID, 0, 'metro', 'Red', 'entry')}])[0]
+    assert not stale['accepted']
+    assert validator.stats() == {'accepted': 2, 'rejected': 1, 'replayed': 2}
+
+
+def test_unsigned_json_is_refused():
+    store, validator = make_validator()
+    legacy = json.dumps({'journey_id': PAID, 'step': 0, 'mode': 'metro', 'action': 'scan', 'purpose': 'entry'})
+    assert validator.validate_batch([{'qr_data': legacy}])[0]['error'] == 'Unsigned QR code'
+    validator.require_signed = False
+    assert validator.validate_batch([{'qr_data': legacy, 'idempotency_key': 'retry'}])[0]['accepted']
+
+
+def test_replayed_scan_does_not_skip_a_step():
+    store, _ = make_validator()
+    events = JourneyEvents()
+    exit_scan = {'step': 0, 'mode': 'metro', 'action': 'scan', 'purpose': 'exit'}
+    assert apply_scan(store, events, PAID, store.get(PAID), exit_scan)[1] == 200
+    # The same code scanned again once the journey is on step 1
+    assert apply_scan(store, events, PAID, store.get(PAID), exit_scan)[1] == 409
+    assert store.get(PAID)['current_step'] == 1
+
+    # Even against stale state, the store only advances from the scanned step
+    stale = dict(store.get(PAID), current_step=0)
+    assert apply_scan(store, events, PAID, stale, exit_scan) == ({'error': 'QR code already scanned'}, 409)
+    assert store.get(PAID)['current_step'] == 1
+
+
+def test_scans_must_match_a_paid_current_step():
+    store, _ = make_validator()
+    events = JourneyEvents()
+    taxi_scan = {'step': 1, 'mode': 'taxi', 'action': 'scan'}
+    assert apply_scan(store, events, UNPAID, store.get(UNPAID), taxi_scan) == ({'error': 'Journey not paid'}, 403)
+    result, status = apply_scan(store, events, PAID, store.get(PAID), taxi_scan)
+    assert status == 409 and result['error'] == 'QR code is not for the current step'
+    wrong_mode = {'step': 0, 'mode': 'taxi', 'action': 'scan'}
+    assert apply_scan(store, events, PAID, store.get(PAID), wrong_mode)[1] == 409
+    assert store.get(PAID)['current_step'] == 0
+
+
+def test_gate_scans_skip_walking_transfers():
+    store = MemoryJourneyStore()
+    store.create(PAID, {'journey_steps': [
+        {'mode': 'taxi', 'line_number': None, 'stops': ['a', 'b']},
+        {'mode': 'transfer', 'stops': ['b', 'c']},
+        {'mode': 'metro', 'line_number': 'Red', 'stops': ['c', 'd']}
+    ]})
+    store.update(PAID, payment_completed=True)
+    validator = GateValidator(store, JourneyEvents())
+    results = validator.validate_batch([
+        {'qr_data': build_qr_data(PAID, 0, 'taxi', None, 'exit')},
+        {'qr_data': build_qr_data(PAID, 2, 'metro', 'Red', 'entry')},
+        {'qr_data': build_qr_data(PAID, 2, 'metro', 'Red', 'exit')}
+    ])
+    assert [r['accepted'] for r in results] == [True, True, True]
+    assert store.get(PAID)['current_step'] == 3
+
+
+def test_temporary_rejections_are_not_cached():
+    store, validator = make_validator()
+    early = {'qr_data': build_qr_data(PAID, 1, 'taxi', None, 'exit')}
+    assert validator.validate_batch([early])[0]['error'] == 'QR code is not for the current step'
+    validator.validate_batch([{'qr_data': build_qr_data(PAID, 0, 'metro', 'Red', 'exit')}])
+    result = validator.validate_batch([early])[0]
+    assert result['accepted'] and not result['replayed']
+
+    # A payload that will never validate is answered from the cache
+    forged = {'qr_data': build_qr_data(PAID, 0, 'metro', 'Red', 'exit')[:-4] + 'AAAA'}
+    assert not validator.validate_batch([forged])[0]['replayed']
+    assert validator.validate_batch([forged])[0]['replayed']
+
+
+def test_journey_removed_while_skipping_transfers():
+    class VanishingStore(MemoryJourneyStore):
+        def advance_step(self, journey_id, expected_step, steps=1):
+            self.delete(journey_id)  # Expired between the read and the skip
+            return None
+    store = VanishingStore()
+    store.create(PAID, {'journey_steps': [
+        {'mode': 'transfer', 'stops': ['a', 'b']},
+        {'mode': 'metro', 'line_number': 'Red', 'stops': ['b', 'c']}
+    ]})
+    store.update(PAID, payment_completed=True)
+    results = GateValidator(store, JourneyEvents()).validate_batch([
+        {'qr_data': build_qr_data(PAID, 1, 'metro', 'Red', 'entry')},
+        {'qr_data': build_qr_data(PAID, 1, 'metro', 'Red', 'exit')}
+    ])
+    assert [(r['accepted'], r['error']) for r in results] == [(False, 'Unknown journey')] * 2
+
+
+if __name__ == "__main__":
+    test_batch_applies_transitions_in_order()
+    test_replays_are_idempotent()
+    test_unsigned_json_is_refused()
+    test_replayed_scan_does_not_skip_a_step()
+    test_scans_must_match_a_paid_current_step()
+    test_gate_scans_skip_walking_transfers()
+    test_temporary_rejections_are_not_cached()
+    test_journey_removed_while_skipping_transfers()
+    print("All gate validator tests passed")
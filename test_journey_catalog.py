@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Test sample journey catalog reloading"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(__file__))
+
+from journey_catalog import JourneyCatalog, FALLBACK_JOURNEY
+
+
+def write_sample(path, title):
+    journey_text = "1. taxi: 1 stop, 8.5 min, 4.2 km\n   Stops: Dubai Marina Walk -> DIFC"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'sample_journey': {'title': title, 'journey_text': journey_text}}, f)
+
+
+def test_reloads_only_when_file_changes(tmp_path):
+    path = tmp_path / 'sample_journey.json'
+    write_sample(path, 'First')
+    now = [0.0]
+    catalog = JourneyCatalog(str(path), check_interval=1.0, clock=lambda: now[0])
+    assert catalog.get()['title'] == 'First'
+    assert catalog.reloads == 1
+
+    now[0] = 5.0
+    catalog.get()
+    assert catalog.reloads == 1  # unchanged file is not reparsed
+
+    write_sample(path, 'Second title')
+    assert catalog.get()['title'] == 'First'  # not re-checked until the interval passes
+    now[0] = 10.0
+    assert catalog.get()['title'] == 'Second title'
+    journey, steps = catalog.lookup()
+    assert [s['mode'] for s in steps] == ['taxi']
+
+
+def test_named_samples_and_fallback(tmp_path):
+    catalog = JourneyCatalog(str(tmp_path / 'missing.json'))
+    assert catalog.get() is FALLBACK_JOURNEY
+    assert {'multi_modal', 'simple', 'complex'} <= set(catalog.names())
+    assert len(catalog.lookup('multi_modal')[1]) == 6
+    assert catalog.get('unknown') is None
+
+
+def test_home_page_processes_the_previewed_journey():
+    from app import app, journey_catalog
+    client = app.test_client()
+    page = client.get('/?journey=simple').get_data(as_text=True)
+    assert 'data-journey="simple"' in page and journey_catalog.get('simple')['title'] in page
+    assert 'data-journey=""' in client.get('/?journey=unknown').get_data(as_text=True)  # Default journey shown
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_reloads_only_when_file_changes(pathlib.Path(tmp))
+        test_named_samples_and_fallback(pathlib.Path(tmp))
+    test_home_page_processes_the_previewed_journey()
+    print("All journey catalog tests passed")
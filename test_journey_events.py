@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Test journey status push - change notification, long-poll and SSE"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(__file__))
+
+from journey_events import JourneyEvents
+
+
+def test_waiters_wake_on_publish():
+    events = JourneyEvents()
+    assert not events.wait('j1', events.version('j1'), 0.01)
+    version = events.version('j1')
+    threading.Timer(0.05, events.publish, ('j1',)).start()
+    start = time.monotonic()
+    assert events.wait('j1', version, 5) and time.monotonic() - start < 1
+    assert events.version('j1') == version + 1 and events.waiters == 0
+
+
+def start_journey(client):
+    client.post('/process_journey', json={'journey': 'simple'})
+    with client.session_transaction() as session:
+        return session['journey_id']
+
+
+def later(seconds, func, *args):
+    timer = threading.Timer(seconds, func, args)
+    timer.start()
+    return timer
+
+
+def test_status_etag_and_long_poll():
+    from app import app, journey_store, journey_events
+    client = app.test_client()
+    assert client.get('/journey_status').status_code == 400
+    journey_id = start_journey(client)
+
+    response = client.get('/journey_status')
+    assert response.get_json() == {'current_step': 0, 'total_steps': 3, 'completed': False, 'payment_completed': False}
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+    assert client.get('/journey_status', headers={'If-None-Match': etag}).status_code == 304
+    # Nothing changes while waiting - the long-poll ends with a 304
+    assert client.get('/journey_status?wait=0.1', headers={'If-None-Match': etag}).status_code == 304
+
+    def pay():
+        journey_store.update(journey_id, payment_completed=True)
+        journey_events.publish(journey_id)
+    timer = later(0.1, pay)
+    start = time.monotonic()
+    response = client.get('/journey_status?wait=5', headers={'If-None-Match': etag})
+    timer.join()
+    assert response.status_code == 200 and response.get_json()['payment_completed']
+    assert response.headers['ETag'] != etag and time.monotonic() - start < 2
+
+
+def test_events_stream_until_completed():
+    import config
+    from app import app, journey_store, journey_events
+    client = app.test_client()
+    journey_id = start_journey(client)
+    journey_store.update(journey_id, payment_completed=True)
+    assert client.get('/journey_events').status_code == 404  # Long-poll only by default
+
+    config.JOURNEY_EVENTS_SSE = True
+    try:
+        response = client.get('/journey_events', buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        chunks = (chunk.decode('utf-8') for chunk in response.response)
+        assert next(chunks).startswith('event: status\n')
+
+        def finish():
+            journey_store.advance_step(journey_id, 0, 3)
+            journey_events.publish(journey_id)
+        timer = later(0.1, finish)
+        rest = ''.join(chunks)
+        timer.join()
+        assert rest.startswith('event: completed\n') and '"completed": true' in rest
+        response.close()
+    finally:
+        config.JOURNEY_EVENTS_SSE = False
+
+
+if __name__ == "__main__":
+    test_waiters_wake_on_publish()
+    test_status_etag_and_long_poll()
+    test_events_stream_until_completed()
+    print("All journey event tests passed")
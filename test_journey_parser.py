@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Test single-pass journey parser"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(__file__))
+
+from journey_parser import parse_journey_text, iter_journey_steps
+from sample_journeys import SAMPLE_JOURNEY_1
+
+
+def long_taxi_journey(stop_count):
+    stops = ' -> '.join(str(9074620000 + i) for i in range(stop_count))
+    return (f"1. transfer (transfer): 2 stops, 1.2 min, 0.10 km\n"
+            f"   Stops: Burj Khalifa/ Dubai Mall Metro Station 1 -> 9074620000\n\n"
+            f"2. taxi (taxi): {stop_count} stops, 4.3 min, 2.87 km\n"
+            f"   Stops: {stops}\n")
+
+
+def test_sample_journey_steps():
+    steps = parse_journey_text(SAMPLE_JOURNEY_1)
+    assert [s['mode'] for s in steps] == ['taxi', 'transfer', 'metro', 'transfer', 'bus', 'transfer']
+    assert steps[2]['line_number'] == 'MRed1' and steps[4]['line_number'] == '64'
+    assert steps[3]['stops'] == ['Union Metro Station 2', 'Union Metro Station (Green Line)', 'Union Bus Terminal']
+    assert steps[0].get('distance') == 4.2
+
+
+def test_node_ids_are_stored_as_ints():
+    steps = parse_journey_text(long_taxi_journey(5))
+    assert steps[0].stop_ids == ['Burj Khalifa/ Dubai Mall Metro Station 1', 9074620000]
+    assert steps[1].stop_ids == [9074620000 + i for i in range(5)]
+    assert steps[1]['stops'][0] == '9074620000'
+
+
+def test_non_ascii_digit_stops_stay_names():
+    steps = parse_journey_text("1. bus (bus): 2 stops, 5 min, 2 km\n   Stops: \u00b2 -> \u0661\u0662\u0663 -> 42")
+    assert steps[0]['stops'] == ['\u00b2', '\u0661\u0662\u0663', '42']
+    assert steps[0].stop_ids == ['\u00b2', '\u0661\u0662\u0663', 42]
+
+
+def test_incremental_parsing_from_lines():
+    lines = iter(long_taxi_journey(3).splitlines())
+    assert [s.mode for s in iter_journey_steps(lines)] == ['transfer', 'taxi']
+
+
+def test_throughput_scales_linearly():
+    def parse_time(stop_count):
+        text = long_taxi_journey(stop_count)
+        start = time.perf_counter()
+        steps = parse_journey_text(text)
+        elapsed = time.perf_counter() - start
+        assert len(steps[1]) == stop_count
+        return elapsed
+
+    parse_time(1000)  # warm up
+    small, large = parse_time(5000), parse_time(50000)
+    assert large < small * 30  # 10x the stops should cost roughly 10x, not 100x
+
+
+if __name__ == "__main__":
+    test_sample_journey_steps()
+    test_node_ids_are_stored_as_ints()
+    test_non_ascii_digit_stops_stay_names()
+    test_incremental_parsing_from_lines()
+    test_throughput_scales_linearly()
+    print("All journey parser tests passed")
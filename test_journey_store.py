@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Test server-side journey store backends"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from journey_store import JourneyStore, MemoryJourneyStore, SQLiteJourneyStore
+
+JOURNEY_INFO = {'journey_steps': [{'mode': 'taxi', 'stops': ['a', 'b']}], 'total_fare': 12}
+
+
+def check_store(store):
+    store.create('j1', JOURNEY_INFO)
+    state = store.get('j1')
+    assert state['journey_info'] == JOURNEY_INFO
+    assert state['current_step'] == 0 and not state['payment_completed']
+
+    revised = dict(JOURNEY_INFO, total_fare=14)
+    assert store.replace_journey_info('j1', revised)
+    assert store.get('j1')['journey_info']['total_fare'] == 14
+
+    assert store.update('j1', payment_completed=True, payment_method='credit_card', payment_amount=12)
+    assert store.get('j1')['payment_completed']
+    assert not store.replace_journey_info('j1', JOURNEY_INFO)  # fares are fixed once paid
+
+    # Only one of two racing scans on the same step wins
+    assert store.advance_step('j1', 0) == 1
+    assert store.advance_step('j1', 0) is None
+    assert store.advance_step('j1', 1, steps=2) == 3
+    assert store.get('j1')['current_step'] == 3
+
+    # Of two payments for one journey only the first is recorded
+    store.create('j2', JOURNEY_INFO)
+    assert store.mark_paid('j2', 'credit_card', 12)
+    assert not store.mark_paid('j2', 'apple_pay', 12)
+    assert store.get('j2')['payment_method'] == 'credit_card' and store.get('j2')['payment_completed']
+    assert not store.mark_paid('missing', 'credit_card', 12)
+
+    assert store.get('missing') is None
+    assert store.advance_step('missing', 0) is None
+    store.delete('j1')
+    assert store.get('j1') is None
+
+
+def test_memory_store():
+    check_store(MemoryJourneyStore())
+
+
+def test_sqlite_store(tmp_path):
+    check_store(SQLiteJourneyStore(str(tmp_path / 'journeys.sqlite3')))
+
+
+def test_expired_journeys_are_dropped():
+    now = [0.0]
+    store = MemoryJourneyStore(ttl_seconds=10, clock=lambda: now[0])
+    store.create('j1', JOURNEY_INFO)
+    now[0] = 11.0
+    assert store.get('j1') is None
+
+
+def test_backends_must_implement_every_method():
+    class PartialStore(JourneyStore):
+        def get(self, journey_id):
+            return None
+    try:
+        PartialStore()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("a store missing methods should not be constructible")
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_memory_store()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_sqlite_store(pathlib.Path(tmp))
+    test_expired_journeys_are_dropped()
+    test_backends_must_implement_every_method()
+    print("All journey store tests passed")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Test the payment and trip ledger"""
+
+import sys
+import os
+import sqlite3
+import time
+sys.path.append(os.path.dirname(__file__))
+
+from ledger import JourneyLedger
+from gate_validator import GateValidator
+from journey_events import JourneyEvents
+from journey_store import MemoryJourneyStore
+from qr_render import build_qr_data
+
+JOURNEY_ID = '6c1b3b6e-0c3a-4b8e-9a55-2d4c1f0e7a10'
+JOURNEY_INFO = {'total_fare': 31, 'fare_source': 'local', 'journey_steps': [
+    {'mode': 'metro', 'line_number': 'Red', 'fare_aed': 8, 'stops': ['a', 'b']},
+    {'mode': 'transfer', 'fare_aed': 0, 'stops': ['b', 'c']},
+    {'mode': 'taxi', 'line_number': None, 'fare_aed': 23, 'stops': ['c', 'd']}
+]}
+
+
+def test_payments_are_batched_and_rolled_up(tmp_path):
+    ledger = JourneyLedger(str(tmp_path / 'ledger.sqlite3'), batch_size=100, flush_interval=0.05)
+    for i in range(60):
+        ledger.record_payment(f'j{i}', JOURNEY_INFO, 'card', 31, f'tx{i}')
+    ledger.flush()
+
+    assert ledger.stats()['entries_written'] == 180  # A payment and two fares each
+    assert ledger.stats()['batches_written'] <= 10
+    history = ledger.history('j7')
+    assert [(e['kind'], e['step'], e['mode'], e['amount']) for e in history] == [
+        ('payment', None, None, 31), ('fare', 0, 'metro', 8), ('fare', 2, 'taxi', 23)]
+    assert history[0]['transaction_id'] == 'tx7' and history[0]['method'] == 'card'
+
+    assert ledger.revenue_by_mode() == [
+        {'mode': 'metro', 'fares': 60, 'revenue': 480.0},
+        {'mode': 'taxi', 'fares': 60, 'revenue': 1380.0}]
+    assert ledger.revenue_by_mode(since=time.time() + 60) == []
+    assert {row['day'] for row in ledger.revenue_by_mode(by_day=True)} == {time.strftime('%Y-%m-%d', time.gmtime())}
+
+    # Entries cannot be changed once written
+    conn = sqlite3.connect(ledger.path)
+    for statement in ('UPDATE ledger SET amount = 0', 'DELETE FROM ledger'):
+        try:
+            conn.execute(statement)
+            assert False, statement
+        except sqlite3.IntegrityError:
+            pass
+
+
+def test_gate_scans_and_steps_are_recorded(tmp_path):
+    ledger = JourneyLedger(str(tmp_path / 'ledger.sqlite3'), flush_interval=0.01)
+    store = MemoryJourneyStore()
+    store.create(JOURNEY_ID, JOURNEY_INFO)
+    store.update(JOURNEY_ID, payment_completed=True)
+    validator = GateValidator(store, JourneyEvents(), ledger=ledger)
+    validator.validate_batch([
+        {'qr_data': build_qr_data(JOURNEY_ID, 0, 'metro', 'Red', 'entry')},
+        {'qr_data': build_qr_data(JOURNEY_ID, 0, 'metro', 'Red', 'exit')},
+        {'qr_data': build_qr_data(JOURNEY_ID, 0, 'metro', 'Red', 'exit'), 'idempotency_key': 'gate-2:9'},
+    ])
+    ledger.flush()
+
+    history = ledger.history(JOURNEY_ID)
+    assert [(e['kind'], e['step']) for e in history] == [
+        ('scan', 0), ('scan', 0), ('step', 0), ('step', 1), ('scan', 2)]
+    assert history[0]['purpose'] == 'entry' and history[0]['accepted'] and history[0]['source'] == 'gate'
+    assert history[2]['to_step'] == 1 and history[2]['reason'] == 'exit_metro'
+    assert history[3]['to_step'] == 2 and history[3]['reason'] == 'transfer_skipped'
+    assert not history[4]['accepted'] and history[4]['error'] == 'QR code is not for the current step'
+
+
+def test_repeated_payments_are_refused(tmp_path):
+    import app
+    ledger, path = app.ledger, app.ledger.path
+    ledger.path = str(tmp_path / 'ledger.sqlite3')
+    try:
+        client = app.app.test_client()
+        client.post('/process_journey', json={'journey': 'simple'})
+        payment = {'payment_method': 'credit_card', 'amount': 10}
+        assert client.post('/process_payment', json=payment).status_code == 200
+        assert client.post('/process_payment', json=payment).status_code == 409
+        ledger.flush()
+        with client.session_transaction() as session:
+            journey_id, nol_spend = session['journey_id'], session.get('nol_spend')
+        assert [e['kind'] for e in ledger.history(journey_id)].count('payment') == 1
+        assert nol_spend['amount'] == sum(
+            e['amount'] for e in ledger.history(journey_id) if e['kind'] == 'fare' and e['mode'] in ('metro', 'bus'))
+    finally:
+        ledger.path = path
+
+
+def test_concurrent_payments_charge_once(tmp_path):
+    import threading
+    import app
+    ledger, path = app.ledger, app.ledger.path
+    ledger.path = str(tmp_path / 'ledger.sqlite3')
+    try:
+        client = app.app.test_client()
+        client.post('/process_journey', json={'journey': 'simple'})
+        cookie = client.get_cookie(app.app.config['SESSION_COOKIE_NAME'])
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def pay():
+            rider = app.app.test_client()  # A double click - same session, separate connection
+            rider.set_cookie(cookie.key, cookie.value)
+            barrier.wait()
+            statuses.append(rider.post('/process_payment', json={'payment_method': 'credit_card', 'amount': 10})
+                            .status_code)
+        store_get = app.journey_store.get
+
+        def slow_get(journey_id):
+            state = store_get(journey_id)
+            time.sleep(0.05)  # Every request reads the journey as unpaid before any of them pays
+            return state
+        app.journey_store.get = slow_get
+        try:
+            threads = [threading.Thread(target=pay) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            del app.journey_store.get
+        ledger.flush()
+        with client.session_transaction() as session:
+            journey_id = session['journey_id']
+        assert sorted(statuses) == [200] + [409] * 7
+        assert [e['kind'] for e in ledger.history(journey_id)].count('payment') == 1
+    finally:
+        ledger.path = path
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_payments_are_batched_and_rolled_up(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_gate_scans_and_steps_are_recorded(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_repeated_payments_are_refused(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_concurrent_payments_charge_once(pathlib.Path(tmp))
+    print("All ledger tests passed")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Test metrics collection and Prometheus text rendering"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from metrics import Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry(prefix='test')
+    latency = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value, 'parse')
+    with latency.time('ai'):
+        pass
+
+    text = registry.render()
+    assert 'test_latency_seconds_bucket{stage="parse",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{stage="parse",le="1.0"} 3' in text
+    assert 'test_latency_seconds_bucket{stage="parse",le="+Inf"} 4' in text
+    assert 'test_latency_seconds_count{stage="parse"} 4' in text
+    assert latency.snapshot('parse') == (4, 6.05)
+    assert latency.snapshot('ai')[0] == 1
+
+
+def test_counters_and_collectors():
+    registry = Registry(prefix='test')
+    fallbacks = registry.counter('fallback_total', 'Fallbacks', ('reason',))
+    fallbacks.inc('error')
+    fallbacks.inc('error', amount=2)
+    registry.collect('cache', lambda: {'hits': 3, 'hit_rate': 0.75, 'backend': 'sqlite'})
+    registry.collect('broken', lambda: 1 / 0)
+
+    text = registry.render()
+    assert 'test_fallback_total{reason="error"} 3' in text
+    assert 'test_cache_hits 3' in text and 'test_cache_hit_rate 0.75' in text
+    assert 'backend' not in text and 'broken' not in text
+
+
+if __name__ == "__main__":
+    test_histogram_buckets_are_cumulative()
+    test_counters_and_collectors()
+    print("All metrics tests passed")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Test the local Ark stand-in against the real Ark client"""
+
+import sys
+import os
+import json
+import urllib.request
+sys.path.append(os.path.dirname(__file__))
+
+from byteplussdkarkruntime import Ark
+
+from mock_ark_server import MockArkServer, latency_sampler
+from sample_journeys import SAMPLE_JOURNEY_2, SAMPLE_JOURNEY_3
+
+
+def ask(client, content, **kwargs):
+    return client.chat.completions.create(model='mock', messages=[{'role': 'user', 'content': content}], **kwargs)
+
+
+def test_answers_single_and_batched_prompts():
+    server = MockArkServer(('127.0.0.1', 0), latency='fixed:0.01', seed=1)
+    server.start()
+    try:
+        client = Ark(base_url=server.base_url, api_key='mock', max_retries=0)
+        single = json.loads(ask(client, f"\nJourney text: {SAMPLE_JOURNEY_2}\n\nPlease extract ...").choices[0].message.content)
+        assert [s['mode'] for s in single['journey_steps']] == ['taxi', 'metro', 'transfer']
+
+        batch = f"\nJourney 1:\n{SAMPLE_JOURNEY_2}\n\nJourney 2:\n{SAMPLE_JOURNEY_3}\n\nFor each of the 2 journeys above ..."
+        answer = json.loads(ask(client, batch).choices[0].message.content)
+        assert [len(j['journey_steps']) for j in answer['journeys']] == [3, 4]
+
+        streamed = ''.join(chunk.choices[0].delta.content or '' for chunk in ask(client, batch, stream=True))
+        assert json.loads(streamed) == answer
+
+        stats = json.loads(urllib.request.urlopen(server.base_url.replace('/api/v3', '/stats')).read())
+        assert stats['requests'] == 3 and stats['ok'] == 3 and stats['in_flight'] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_injected_failures():
+    server = MockArkServer(('127.0.0.1', 0), error_rate=0.5, malformed_rate=0.5, error_status=429, seed=3)
+    server.start()
+    try:
+        client = Ark(base_url=server.base_url, api_key='mock', max_retries=0)
+        outcomes = []
+        for _ in range(20):
+            try:
+                json.loads(ask(client, SAMPLE_JOURNEY_2).choices[0].message.content)
+                outcomes.append('ok')
+            except ValueError:
+                outcomes.append('malformed')
+            except Exception:
+                outcomes.append('error')
+        stats = server.stats()
+        assert outcomes.count('error') == stats['errors'] > 0
+        assert outcomes.count('malformed') == stats['malformed'] > 0
+        assert 'ok' not in outcomes
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_latency_specs():
+    assert latency_sampler('fixed:0.25')() == 0.25
+    assert 0.1 <= latency_sampler('uniform:0.1,0.2')() <= 0.2
+    assert latency_sampler('lognormal:0.8,0.5')() > 0
+    try:
+        latency_sampler('gamma:1')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("accepted an unknown distribution")
+
+
+if __name__ == "__main__":
+    test_answers_single_and_batched_prompts()
+    test_injected_failures()
+    test_latency_specs()
+    print("All mock Ark server tests passed")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Test journey compaction for AI prompts"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(__file__))
+
+from prompt_compaction import compact_journey_text, restore_stops, estimate_tokens
+from journey_parser import parse_journey_text
+from mock_ark_server import answer_for_prompt
+from sample_journeys import SAMPLE_JOURNEY_2
+
+with open(os.path.join(os.path.dirname(__file__), 'sample_journey.json')) as f:
+    ROUTED_JOURNEY = json.load(f)['sample_journey']['journey_text']
+
+
+def test_compaction_keeps_headers_and_endpoints():
+    compact = compact_journey_text(ROUTED_JOURNEY)
+    assert compact.text.splitlines() == [
+        "1. transfer (transfer): 2 stops, 1.2 min, 0.10 km",
+        "Stops: Burj Khalifa/ Dubai Mall Metro Station 1 -> 9074620786",
+        "2. taxi (taxi): 32 stops, 4.3 min, 2.87 km",
+        "Stops: 9074620786 -> 1844058872",
+        "3. transfer (transfer): 2 stops, 1.5 min, 0.13 km",
+        "Stops: 1844058872 -> The Binary Tower 2",
+    ]
+    assert compact.stops_dropped == 30
+    assert compact.tokens_after < compact.tokens_before / 2
+    assert estimate_tokens("9074620786") == 4
+
+    # The compact text still parses to the same legs
+    full, short = parse_journey_text(ROUTED_JOURNEY), parse_journey_text(compact.text)
+    assert [(s['mode'], s['distance'], s['stops'][0], s['stops'][-1]) for s in full] == \
+           [(s['mode'], s['distance'], s['stops'][0], s['stops'][-1]) for s in short]
+
+    # Unrecognised lines are passed through untouched
+    assert compact_journey_text("Take the Red line\n\n  Stops: A -> B").text == "Take the Red line\nStops: A -> B"
+
+
+def test_ai_steps_get_full_stop_lists_back():
+    steps = parse_journey_text(ROUTED_JOURNEY)
+    answer = answer_for_prompt(compact_journey_text(ROUTED_JOURNEY).text)
+    assert [len(step['stops']) for step in answer['journey_steps']] == [2, 2, 2]
+    assert restore_stops(answer, steps) == 1
+    assert answer['journey_steps'][1]['stops'] == steps[1]['stops'] and len(steps[1]['stops']) == 32
+
+    # Steps whose endpoints do not match a parsed leg keep the AI's stops
+    answer = answer_for_prompt(SAMPLE_JOURNEY_2)
+    assert restore_stops(answer, steps) == 0
+
+
+if __name__ == "__main__":
+    test_compaction_keeps_headers_and_endpoints()
+    test_ai_steps_get_full_stop_lists_back()
+    print("All prompt compaction tests passed")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Test signed compact QR scan payloads"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(__file__))
+
+from qr_payload import encode_scan_payload, decode_scan_payload, parse_scan_data, signing_key
+
+JOURNEY_ID = '3f3f7fbe-01f3-446c-af13-d735001e7f55'
+
+
+def test_round_trip():
+    payload = encode_scan_payload(JOURNEY_ID, 3, 'metro', 'Red', 'exit')
+    # Base32 stays within the QR alphanumeric character set
+    assert payload.isalnum() and payload.isupper()
+    assert decode_scan_payload(payload) == {
+        'journey_id': JOURNEY_ID, 'step': 3, 'mode': 'metro', 'action': 'scan',
+        'line_number': 'Red', 'purpose': 'exit'
+    }
+    assert decode_scan_payload(encode_scan_payload(JOURNEY_ID, 0, 'taxi', None, 'exit'))['line_number'] is None
+
+
+def test_tampered_or_foreign_payloads_are_rejected():
+    payload = encode_scan_payload(JOURNEY_ID, 3, 'metro', 'Red', 'exit')
+    tampered = payload[:30] + ('A' if payload[30] != 'A' else 'B') + payload[31:]
+    other_key = encode_scan_payload(JOURNEY_ID, 3, 'metro', 'Red', 'exit', key=signing_key('another-secret'))
+    for bad in (tampered, other_key, payload[:20], 'not a payload'):
+        try:
+            decode_scan_payload(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {bad!r}")
+
+
+def test_unpackable_data_and_legacy_json():
+    for args in ((JOURNEY_ID, 0, 'walk', None, 'exit'), ('not-a-uuid', 0, 'taxi', None, 'exit')):
+        try:
+            encode_scan_payload(*args)
+        except ValueError:
+            continue
+        raise AssertionError(f"packed {args!r}")
+
+    legacy = json.dumps({'journey_id': JOURNEY_ID, 'step': 0, 'mode': 'taxi'})
+    assert parse_scan_data(legacy) == (json.loads(legacy), False)
+    assert parse_scan_data(encode_scan_payload(JOURNEY_ID, 0, 'taxi', None, 'exit'))[1]
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_tampered_or_foreign_payloads_are_rejected()
+    test_unpackable_data_and_legacy_json()
+    print("All QR payload tests passed")
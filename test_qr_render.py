@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Test QR code caching, pre-rendering and the /qr endpoint"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(__file__))
+
+from qr_render import QRCache, QRPrerenderer, journey_qr_payloads, render_qr, build_qr_data
+
+JOURNEY_ID = '6c1b3b6e-0c3a-4b8e-9a55-2d4c1f0e7a10'
+JOURNEY_STEPS = [
+    {'mode': 'taxi', 'line_number': None},
+    {'mode': 'transfer'},
+    {'mode': 'metro', 'line_number': 'Red'}
+]
+
+
+def test_cache_is_a_bounded_lru():
+    cache = QRCache(max_entries=2)
+    image, etag = cache.put('a', b'image a')
+    assert cache.get('a') == (image, etag) and etag == cache.put('a', b'image a')[1]
+    cache.put('b', b'image b')
+    cache.get('a')  # Now 'b' is the least recently used
+    cache.put('c', b'image c')
+    assert cache.contains('a') and not cache.contains('b') and cache.contains('c')
+    assert cache.get('b') is None
+    assert cache.stats() == {'entries': 2, 'hits': 2, 'misses': 1, 'evictions': 1, 'hit_rate': 2 / 3}
+
+
+def test_prerenderer_fills_the_cache_once():
+    assert [(step, purpose) for _, step, _, _, purpose in journey_qr_payloads(JOURNEY_ID, JOURNEY_STEPS)] == [
+        (0, 'exit'), (2, 'entry'), (2, 'exit')]
+    cache = QRCache()
+    prerenderer = QRPrerenderer(cache, workers=2)
+    assert prerenderer.submit_journey(JOURNEY_ID, JOURNEY_STEPS) == 3
+
+    key = ((JOURNEY_ID, 2, 'metro', 'Red', 'exit'), 'png')
+    image = prerenderer.wait_for(key, timeout=5) or cache.get(key)[0]
+    assert image == render_qr(build_qr_data(*key[0]))
+    deadline = time.monotonic() + 5
+    while prerenderer.stats()['completed'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert prerenderer.stats()['completed'] == 3 and prerenderer.stats()['queue_depth'] == 0
+    assert cache.contains(key) and prerenderer.wait_for(key) is None  # Nothing in flight any more
+
+    # Codes already cached are not rendered again
+    assert prerenderer.submit_journey(JOURNEY_ID, JOURNEY_STEPS) == 0
+    assert prerenderer.stats()['submitted'] == 3 and prerenderer.stats()['failed'] == 0
+
+
+def test_qr_endpoint_is_cached_per_journey():
+    from app import app
+    client = app.test_client()
+    client.post('/process_journey', json={'journey': 'simple'})
+    with client.session_transaction() as session:
+        journey_id = session['journey_id']
+    url = f'/qr/{journey_id}/0.png'
+    assert client.get(url).status_code == 404  # Not paid yet
+    client.post('/process_payment', json={'payment_method': 'credit_card', 'amount': 1})
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.mimetype == 'image/png'
+    assert response.headers['Cache-Control'].startswith('private') and response.data.startswith(b'\x89PNG')
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get(f'/qr/{journey_id}/0.svg').mimetype == 'image/svg+xml'
+    assert client.get(f'{url}?purpose=exit').headers['ETag'] != client.get(f'{url}?purpose=entry').headers['ETag']
+
+    assert client.get(f'/qr/{journey_id}/0.gif').status_code == 404
+    assert client.get(f'/qr/{journey_id}/99.png').status_code == 404
+    assert client.get(f'{url}?purpose=refund').status_code == 400
+    assert app.test_client().get(url).status_code == 403  # Another rider's journey
+
+
+if __name__ == "__main__":
+    test_cache_is_a_bounded_lru()
+    test_prerenderer_fills_the_cache_once()
+    test_qr_endpoint_is_cached_per_journey()
+    print("All QR render tests passed")
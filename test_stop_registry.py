@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Test stop name, node ID and location lookups"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from stop_registry import StopRegistry, load_gtfs_stops, build_stop_registry, annotate_stops, name_tokens
+from journey_parser import parse_journey_text
+
+GTFS_STOPS = """﻿stop_id,stop_code,stop_name,stop_lat,stop_lon,zone_id,location_type,parent_station
+S1-P1,,Burj Khalifa/ Dubai Mall Metro Station,25.2013,55.2697,1,0,S1
+S1,70101,Burj Khalifa/ Dubai Mall Metro Station,25.2013,55.2697,1,1,
+S2,70102,Business Bay Metro Station,25.1912,55.2605,1,1,
+9001,,Union Bus Terminal,25.2666,55.3145,2,0,
+"""
+
+
+def test_names_resolve_by_longest_prefix():
+    registry = StopRegistry()
+    registry.add('moe', 'Mall of the Emirates Metro Station')
+    registry.add('marina', 'Dubai Marina')
+    registry.add('marina_walk', 'Dubai Marina Walk')
+    assert name_tokens("Burj Khalifa/ Dubai Mall Metro Station 1") == ['burj', 'khalifa', 'dubai', 'mall', 'metro', 'station']
+
+    assert registry.resolve("Mall of the Emirates Metro Station 1").stop_id == 'moe'
+    assert registry.resolve("mall of the emirates").stop_id == 'moe'  # Prefix of a single stop
+    assert registry.resolve("Dubai Marina Walk").stop_id == 'marina_walk'
+    assert registry.resolve("Dubai Marina Metro Station").stop_id == 'marina'
+    assert registry.resolve("Dubai") is None  # Prefix of several stops
+    assert registry.resolve("Nowhere") is None
+    assert registry.stats()['misses'] == 2
+
+
+def test_gtfs_stops_and_node_ids(tmp_path):
+    path = tmp_path / 'stops.txt'
+    path.write_text(GTFS_STOPS, encoding='utf-8')
+    registry = build_stop_registry(str(path))
+
+    station = registry.resolve("Burj Khalifa/ Dubai Mall Metro Station 2")
+    assert station.stop_id == 'S1' and station.zone_id == '1'
+    assert registry.get('S1-P1').name == station.name  # Platform kept under its own ID
+    assert registry.resolve(70102).stop_id == 'S2' and registry.resolve('9001').stop_id == '9001'
+    assert registry.resolve("Union Bus Terminal").stop_id == '9001'  # GTFS name wins over the built-in list
+    assert registry.resolve("Karama").stop_id == 'karama'
+
+    assert [stop.stop_id for stop, _ in registry.nearby(25.2010, 55.2700, radius_km=0.2)] == ['S1', 'S1-P1']
+    assert registry.nearest(25.1915, 55.2600).stop_id == 'S2'
+    assert registry.nearest(25.0, 55.0) is None
+
+    step = parse_journey_text("1. 64 (bus): 2 stops, 5 min, 3 km\n   Stops: 70101 -> Business Bay Metro Station 3")[0]
+    assert [stop.stop_id for stop in registry.resolve_step(step)] == ['S1', 'S2']
+    steps = annotate_stops([{'stops': ['Business Bay Metro Station', 'Nowhere']}], registry)
+    assert steps[0]['stop_ids'] == ['S2', None]
+
+
+def test_many_stops(tmp_path):
+    path = tmp_path / 'stops.txt'
+    rows = ['stop_id,stop_name,stop_lat,stop_lon']
+    rows += [f'{i},Stop {i} Road {i % 97},{25 + i % 200 / 1000},{55 + i // 200 / 1000}' for i in range(20000)]
+    path.write_text('\n'.join(rows), encoding='utf-8')
+    registry = load_gtfs_stops(str(path))
+    assert len(registry) == 20000
+    assert registry.resolve("Stop 12345 Road 26").stop_id == '12345'
+    assert registry.resolve(19999).name == 'Stop 19999 Road 17'
+    assert len(registry.nearby(25.1, 55.05, radius_km=0.3, limit=100)) > 10
+
+
+def test_non_ascii_digits_are_names():
+    registry = StopRegistry()
+    registry.add('12', 'Twelfth Street')
+    registry.add('١٢', 'Arabic Numbered Stop')
+    assert registry.resolve('١٢') is None and registry.resolve('²') is None  # Not node 12, and no ValueError
+    assert registry.resolve('12').stop_id == '12'
+    assert annotate_stops([{'stops': ['١٢', '²']}], registry)[0]['stop_ids'] == [None, None]
+
+    from app import app
+    assert app.test_client().get('/stops/resolve?name=%C2%B2').status_code == 404
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_names_resolve_by_longest_prefix()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_gtfs_stops_and_node_ids(Path(tmp_dir))
+        test_many_stops(Path(tmp_dir))
+    test_non_ascii_digits_are_names()
+    print("All stop registry tests passed")
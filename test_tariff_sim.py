@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Test the tariff what-if simulator against bulk repricing"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+
+from bulk_fares import fare_table, columns_from_lines, price_columns, MODE_CODES
+from tariff_sim import build_cache, TariffSimulator
+from test_bulk_fares import random_journeys
+
+
+def expected(lines, **changes):
+    table = fare_table(changes)
+    columns, _ = columns_from_lines(lines, table)
+    fares, totals = price_columns(columns, table)
+    breakdown = {mode: float(fares[columns.modes == code].sum()) for mode, code in MODE_CODES.items()}
+    return float(totals.sum()), breakdown, totals
+
+
+def test_simulation_matches_repricing(tmp_path):
+    lines = [json.dumps(r) for r in random_journeys(2000, seed=3)]
+    source = tmp_path / 'journeys.jsonl'
+    source.write_text('\n'.join(lines) + '\n')
+    meta = build_cache(str(source), str(tmp_path / 'cache'), chunk_size=300)
+    assert meta['journeys'] == 2000
+
+    simulator = TariffSimulator(str(tmp_path / 'cache'))
+    for changes in ({}, {'TAXI_PER_KM': 9.0}, {'METRO_BASE_FARE': 4.0}, {'ZONE_LENGTH_KM': 5.0, 'BUS_ZONE_FARE': 3.0}):
+        result = simulator.simulate(**changes)
+        revenue, breakdown, totals = expected(lines, **result['tariff'])
+        assert result['revenue'] == revenue
+        assert result['breakdown'] == breakdown
+        assert np.allclose(list(result['percentiles'].values()), np.percentile(totals, [50, 90, 99]))
+        assert sum(result['histogram']) == 2000
+
+
+def test_changes_recompute_only_affected_modes(tmp_path):
+    source = tmp_path / 'journeys.jsonl'
+    source.write_text(''.join(json.dumps(r) + '\n' for r in random_journeys(200)))
+    build_cache(str(source), str(tmp_path / 'cache'))
+    simulator = TariffSimulator(str(tmp_path / 'cache'))
+    simulator.simulate()
+    assert simulator.recomputed == {'taxi': 1, 'metro': 1, 'bus': 1}
+
+    results = list(simulator.sweep({'METRO_BASE_FARE': [3.0, 4.0], 'TAXI_PER_KM': [7.0, 8.0, 9.0]}))
+    assert len(results) == 6
+    # Taxi fares change at every grid point, metro fares once and bus fares never
+    assert simulator.recomputed == {'taxi': 7, 'metro': 2, 'bus': 1}
+    assert results[1]['tariff']['TAXI_PER_KM'] == 8.0 and results[1]['tariff']['METRO_BASE_FARE'] == 3.0
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_simulation_matches_repricing(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_changes_recompute_only_affected_modes(pathlib.Path(tmp))
+    print("All tariff simulator tests passed")
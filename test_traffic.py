@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Test traffic capture and replay"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(__file__))
+
+from traffic import TrafficLog, Replayer, load_capture
+from benchmark import StubArk, journey_flow
+
+
+def test_captured_journeys_replay_cleanly(tmp_path):
+    import app
+    path = str(tmp_path / 'capture.jsonl')
+    real_client, app.ai_client.client = app.ai_client.client, StubArk()
+    app.traffic_log = capture = TrafficLog(path, flush_interval=0.01)
+    try:
+        for name in ('multi_modal', 'simple', 'multi_modal'):
+            journey_flow(app.app.test_client(), name, poll_status=True)
+        capture.flush()
+    finally:
+        app.traffic_log = None
+
+    try:
+        sessions = load_capture(path)
+        assert len(sessions) == 3
+        assert capture.stats()['requests_written'] == sum(len(entries) for entries in sessions)
+        first = sessions[0]
+        assert [entry['e'] for entry in first[:3]] == ['process_journey', 'process_payment', 'generate_qr']
+        scans = [entry['b'] for entry in first if entry['e'] == 'scan_qr']
+        assert scans and all('qr_data' not in body and body['signed'] for body in scans)  # No replayable secrets
+
+        report = Replayer(app.app, speed=0, workers=3).run(sessions)
+    finally:
+        app.ai_client.client = real_client
+    assert report['journeys'] == 3 and report['requests'] == sum(len(entries) for entries in sessions)
+    assert set(report['routes']) == {'process_journey', 'process_payment', 'generate_qr', 'scan_qr', 'journey_status'}
+    assert all(route['status_mismatches'] == 0 for route in report['routes'].values())
+    assert report['session_bytes']['max'] >= report['session_bytes']['first_p50'] > 0
+
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_captured_journeys_replay_cleanly(pathlib.Path(tmp))
+    print("All traffic replay tests passed")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Traffic capture and replay for the journey routes
+
+With TRAFFIC_CAPTURE_PATH set, every request to the journey lifecycle routes
+is appended to a compact JSONL log: when it arrived, which journey it belongs
+to, the route and body, and how it was answered. Replaying drives the log
+through the app in-process, each journey on its own client and the journeys
+concurrently, with the Ark client stubbed as in benchmark.py:
+
+    python traffic.py replay capture.jsonl --speed 10 --workers 16
+
+Without production traffic at hand, `python traffic.py capture out.jsonl`
+records the sample journeys from benchmark.py's flow instead.
+
+Scan bodies are logged as the scanned step, mode and purpose rather than the
+signed QR payload, and rebuilt for the replayed journey, since its journey ID
+differs from the captured one.
+"""
+import argparse
+import hashlib
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from batch_writer import BatchedWriter, append_jsonl
+from qr_payload import parse_scan_data
+
+CAPTURED_ENDPOINTS = ('process_journey', 'process_payment', 'generate_qr', 'scan_qr', 'journey_status')
+
+
+def _journey_key(journey_id):
+    """Short stable key grouping a journey's requests, without logging the journey ID itself"""
+    if not journey_id:
+        return None
+    return hashlib.sha1(str(journey_id).encode('utf-8')).hexdigest()[:12]
+
+
+def _scan_fields(body):
+    """The parts of a scan body that survive replay, plus the scanned journey"""
+    try:
+        scan_info, signed = parse_scan_data(body['qr_data'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {'invalid': True}, None
+    fields = {key: scan_info.get(key) for key in ('step', 'mode', 'line_number', 'purpose')}
+    fields['signed'] = signed
+    return fields, scan_info.get('journey_id')
+
+
+class TrafficLog:
+    """JSONL capture log of journey route requests, appended in batches without fsync"""
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0):
+        self.path = path
+        self._writer = BatchedWriter(self._write_batch, 'traffic-log', batch_size, flush_interval)
+
+    def record_request(self, request, response, elapsed, journey_id):
+        """Queue one captured request; journey_id is the rider's journey after the request"""
+        body = request.get_json(silent=True) if request.method == 'POST' else None
+        if request.endpoint == 'scan_qr':
+            body, scanned = _scan_fields(body)
+            journey_id = scanned or journey_id
+        self._writer.put({
+            'ts': round(time.time(), 3),
+            'j': _journey_key(journey_id),
+            'e': request.endpoint,
+            'm': request.method,
+            'p': request.path,
+            'q': request.query_string.decode('latin-1'),
+            'b': body,
+            's': response.status_code,
+            'ms': round(elapsed * 1000, 2)
+        })
+
+    def _write_batch(self, batch):
+        append_jsonl(self.path, batch, fsync=False)
+
+    def flush(self):
+        """Block until every queued request has been written"""
+        self._writer.flush()
+
+    def stats(self):
+        return {
+            'queued': self._writer.qsize(),
+            'requests_written': self._writer.items_written,
+            'write_errors': self._writer.write_errors
+        }
+
+
+def load_capture(path):
+    """Captured requests grouped by journey, each group in arrival order"""
+    sessions = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Skip a torn trailing line
+            sessions.setdefault(entry['j'], []).append(entry)
+    for entries in sessions.values():
+        entries.sort(key=lambda entry: entry['ts'])
+    return list(sessions.values())
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Replayer:
+    """Replays captured journeys against the app and collects per-route timings
+
+    speed scales the captured inter-arrival times (10 replays ten times
+    faster); 0 sends every request as soon as the previous one of its journey
+    has been answered.
+    """
+
+    def __init__(self, app, speed=1.0, workers=8):
+        self.app = app
+        self.speed = speed
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.timings = {}  # endpoint -> [ms]
+        self.recorded = {}  # endpoint -> [ms] from the capture
+        self.errors = {}  # endpoint -> count of unexpected status codes
+        self.session_bytes = {}  # endpoint -> [cookie bytes after the request]
+        self.growth = []  # per journey: (cookie bytes after the first request, largest cookie seen)
+
+    def run(self, sessions):
+        start_ts = min((entries[0]['ts'] for entries in sessions if entries), default=0.0)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(self._replay_session, entries, start_ts, started)
+                           for entries in sessions]:
+                future.result()
+        return self.report(time.perf_counter() - started)
+
+    def _replay_session(self, entries, start_ts, started):
+        from qr_render import build_qr_data
+        client = self.app.test_client()
+        cookie_name = self.app.config['SESSION_COOKIE_NAME']
+        journey_id = None
+        sizes = []
+        for entry in entries:
+            if self.speed:
+                delay = started + (entry['ts'] - start_ts) / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            body = entry['b']
+            if entry['e'] == 'scan_qr':
+                if body.get('invalid') or journey_id is None:
+                    body = {'qr_data': 'not a QR code'}
+                else:
+                    body = {'qr_data': build_qr_data(journey_id, body['step'], body['mode'],
+                                                     body['line_number'], body['purpose'])}
+
+            url = entry['p'] + ('?' + entry['q'] if entry['q'] else '')
+            request_start = time.perf_counter()
+            response = client.open(url, method=entry['m'], json=body)
+            elapsed = (time.perf_counter() - request_start) * 1000
+            response.close()
+
+            if entry['e'] == 'process_journey' and response.status_code == 200:
+                with client.session_transaction() as session:
+                    journey_id = session.get('journey_id')
+            cookie = client.get_cookie(cookie_name)
+            size = len(cookie.value) if cookie is not None else 0
+            sizes.append(size)
+
+            with self._lock:
+                self.timings.setdefault(entry['e'], []).append(elapsed)
+                self.recorded.setdefault(entry['e'], []).append(entry['ms'])
+                self.session_bytes.setdefault(entry['e'], []).append(size)
+                if response.status_code != entry['s']:
+                    self.errors[entry['e']] = self.errors.get(entry['e'], 0) + 1
+        if sizes:
+            with self._lock:
+                self.growth.append((sizes[0], max(sizes)))
+
+    def report(self, wall_seconds):
+        requests = sum(len(timings) for timings in self.timings.values())
+        routes = {}
+        for endpoint, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            recorded = sorted(self.recorded[endpoint])
+            routes[endpoint] = {
+                'requests': len(timings),
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'captured_p50_ms': round(percentile(recorded, 0.5), 3),
+                'status_mismatches': self.errors.get(endpoint, 0),
+                'session_bytes_p50': statistics.median(self.session_bytes[endpoint])
+            }
+        return {
+            'journeys': len(self.growth),
+            'requests': requests,
+            'seconds': round(wall_seconds, 3),
+            'requests_per_sec': round(requests / wall_seconds, 1) if wall_seconds else None,
+            'routes': routes,
+            'session_bytes': {
+                'first_p50': statistics.median(first for first, _ in self.growth) if self.growth else 0,
+                'max_p50': statistics.median(largest for _, largest in self.growth) if self.growth else 0,
+                'max': max((largest for _, largest in self.growth), default=0)
+            }
+        }
+
+
+def capture_sample_flows(path, journeys):
+    """Record the benchmark's sample journey flows, with the AI stubbed"""
+    from benchmark import setup_environment, flush_side_effects, journey_flow
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_environment(tmp_dir, 0.0)
+        import app
+        app.traffic_log = TrafficLog(path)
+        names = ('multi_modal', 'simple', 'complex')
+        for i in range(journeys):
+            journey_flow(app.app.test_client(), names[i % len(names)], poll_status=True)
+        app.traffic_log.flush()
+        app.traffic_log = None
+        flush_side_effects()
+    print(f"Captured {journeys} journeys to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay captured journey traffic')
+    commands = parser.add_subparsers(dest='command', required=True)
+    capture = commands.add_parser('capture', help='record sample journey flows to a capture log')
+    capture.add_argument('output')
+    capture.add_argument('--journeys', type=int, default=30)
+    replay = commands.add_parser('replay', help='drive a capture log through the app with the AI stubbed')
+    replay.add_argument('capture', help='JSONL written with TRAFFIC_CAPTURE_PATH set')
+    replay.add_argument('--speed', type=float, default=1.0, help='speed-up over captured timing, 0 for no waits')
+    replay.add_argument('--workers', type=int, default=8, help='journeys replayed at once')
+    replay.add_argument('--ai-latency', type=float, default=0.0, help='seconds the stub AI waits per call')
+    args = parser.parse_args(argv)
+
+    config.TRAFFIC_CAPTURE_PATH = ''  # Captures are written to the given path, never the configured one
+    if args.command == 'capture':
+        capture_sample_flows(args.output, args.journeys)
+        return
+
+    sessions = load_capture(args.capture)
+    if not sessions:
+        print(f"No captured requests in {args.capture}")
+        sys.exit(1)
+
+    from benchmark import setup_environment, flush_side_effects
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_environment(tmp_dir, args.ai_latency)
+        from app import app
+        report = Replayer(app, speed=args.speed, workers=args.workers).run(sessions)
+        flush_side_effects()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()